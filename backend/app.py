@@ -3,25 +3,359 @@
 # pip install flask-cors
 # Run with: python backend/app.py
 
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, g, jsonify, request, render_template, stream_with_context, url_for
+import base64
+import binascii
+import csv
+import datetime
+import functools
+import gzip
+import hashlib
+import io
+import json
+import logging
+import math
+import os
 import sqlite3
+import sys
+import threading
+import time
 from pathlib import Path
 from flask_cors import CORS
+import numpy as np
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses are only gzip-compressed
+    brotli = None
+
+# Make the backend package importable when run as a script (python backend/app.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend import metrics  # noqa: E402
+from backend.common import EARTH_RADIUS_KM, REJECTION_SUMMARY_PATH, haversine_vectorized  # noqa: E402
+from backend.database.cache import ResultCache  # noqa: E402
+from backend.database.columns import ColumnStore, columns_dir  # noqa: E402
+from backend.database.db import SECONDS_PER_DAY, SPATIAL_INDEXES  # noqa: E402
+from backend.database.heatmap import (HEATMAP_LEVELS, cell_latitude, cell_longitude, cell_x,  # noqa: E402
+                                      cell_y)
+from backend.database.pool import ConnectionPool, LimitedConnection, PoolTimeout  # noqa: E402
 
 app = Flask(__name__, static_folder="../static", template_folder="../templates")
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "Link", "X-Cache", "ETag"])
 
 # Path to database
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "database" / "nyc_taxi.db"
 
+# Page size of the trip listings, overridable with ?limit=
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched from SQLite per batch while streaming an export
+EXPORT_BATCH_ROWS = 5000
+
+# Trips are stored with epoch times and integer codes (see schema.sql); these select lists decode them
+# back to the text values of the cleaned data
+TRIP_SUMMARY_COLUMNS = """trip_id AS id, vendor_id, datetime(pickup_at, 'unixepoch') AS pickup_datetime,
+    datetime(dropoff_at, 'unixepoch') AS dropoff_datetime, passenger_count,
+    pickup_longitude, pickup_latitude, dropoff_longitude, dropoff_latitude, trip_duration_seconds AS trip_duration"""
+
+PICKUP_ZONE = "(SELECT zone_code FROM location_zones WHERE zone_id = pickup_zone_id) AS pickup_zone"
+DROPOFF_ZONE = "(SELECT zone_code FROM location_zones WHERE zone_id = dropoff_zone_id) AS dropoff_zone"
+
+# Every column of the cleaned data, in its order
+TRIP_DETAIL_COLUMNS = f"""trip_id, vendor_id, datetime(pickup_at, 'unixepoch') AS pickup_datetime,
+    datetime(dropoff_at, 'unixepoch') AS dropoff_datetime, date(pickup_at, 'unixepoch') AS pickup_date,
+    pickup_month, pickup_hour, pickup_day_of_week,
+    (SELECT day_name FROM day_names WHERE day_of_week = pickup_day_of_week) AS pickup_day_name,
+    is_pickup_weekend, is_pickup_peak_hour,
+    (SELECT time_of_day FROM times_of_day WHERE hour = pickup_hour) AS time_of_day,
+    pickup_longitude, pickup_latitude, dropoff_longitude, dropoff_latitude, {PICKUP_ZONE}, {DROPOFF_ZONE},
+    passenger_count, CASE is_store_and_fwd WHEN 1 THEN 'Y' ELSE 'N' END AS store_and_fwd_flag,
+    trip_distance_km, trip_duration_seconds, trip_duration_seconds / 60.0 AS trip_duration_minutes,
+    trip_speed_kmh, fare_per_km, idle_time_ratio, estimated_fare"""
+
+# Zone code parameter -> pickup_zone_id, so the comparison can use idx_trips_pickup_zone
+PICKUP_ZONE_IS = "pickup_zone_id = (SELECT zone_id FROM location_zones WHERE zone_code = ?)"
+
+# Columns selected for paging that are not part of the response
+HIDDEN_COLUMNS = {"rowid", "pickup_at", "sort_key"}
+
+# ?sort= values of /api/trips -> the indexed column the listing is ordered by; a leading "-" sorts descending
+TRIP_SORTS = {
+    "pickup_time": "pickup_at",
+    "duration": "trip_duration_seconds",
+    "distance": "trip_distance_km",
+    "fare": "estimated_fare",
+}
+
+
+# Request and SQL latency histograms, served at /metrics; statements slower than SLOW_QUERY_MS are
+# logged with their query plan (0 disables the slow-query log)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+if METRICS_ENABLED and SLOW_QUERY_MS > 0:
+    metrics.slow_query_seconds = SLOW_QUERY_MS / 1000
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+@app.before_request
+def start_request_timer():
+    """Note when the request started and which route it matched (registered first, so it times the other hooks)"""
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+        metrics.current_route.set(request.url_rule.rule if request.url_rule else "unmatched")
+
+
+@app.after_request
+def record_request_time(response):
+    """Add the request to the latency histogram and request counter of its route"""
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = metrics.current_route.get()
+        metrics.request_duration.observe(request.method, route, value=time.perf_counter() - started)
+        metrics.requests_total.inc(request.method, route, str(response.status_code))
+    return response
+
+
+# Read-only connections are pooled and reused across requests. A statement is interrupted after
+# QUERY_TIMEOUT seconds in a single execute or fetch (0: no limit)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+DB_POOL_TIMEOUT = 30
+QUERY_TIMEOUT = float(os.environ.get("QUERY_TIMEOUT", 10))
+pool = None
+pool_lock = threading.Lock()  # guards replacing pool, as waitress serves requests on several threads
+
+
+def get_pool():
+    """The connection pool for DB_PATH, created on first use"""
+    global pool
+    with pool_lock:
+        if pool is None or pool.db_path != Path(DB_PATH).resolve():
+            if pool is not None:
+                pool.close()
+            pool = ConnectionPool(DB_PATH, size=DB_POOL_SIZE, query_timeout=QUERY_TIMEOUT or None,
+                                  factory=metrics.TimedConnection if METRICS_ENABLED else LimitedConnection)
+        return pool
+
 
 # Routes to use in API
 def get_connection():
-    """Create and return the SQLite connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
-    return conn
+    """Return this request's pooled SQLite connection (rows behave like dictionaries)"""
+    if "db" not in g:
+        g.db_pool = get_pool()
+        g.db = g.db_pool.acquire(timeout=DB_POOL_TIMEOUT)
+    return g.db
+
+
+@app.teardown_appcontext
+def release_connection(exception):
+    """Hand the request's connection back to the pool"""
+    conn = g.pop("db", None)
+    if conn is not None:
+        g.pop("db_pool").release(conn)
+
+
+@app.errorhandler(PoolTimeout)
+def pool_exhausted(error):
+    return jsonify({"error": "Server busy, try again shortly"}), 503
+
+
+@app.errorhandler(sqlite3.OperationalError)
+def query_interrupted(error):
+    """A statement stopped at QUERY_TIMEOUT becomes a 503; other database errors stay 500s"""
+    if str(error) != "interrupted":
+        raise error
+    return jsonify({"error": f"Query exceeded the {QUERY_TIMEOUT:g}s time limit"}), 503
+
+
+# Responses of the read endpoints are cached in process, keyed by database generation, endpoint and parameters
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_MB", 64)) * 1024 * 1024
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 300))
+result_cache = ResultCache(max_bytes=RESULT_CACHE_BYTES, ttl=RESULT_CACHE_TTL)
+
+
+def database_stamp():
+    """Inode, mtime and size of the database and its WAL; changes on every rebuild, ingest or checkpoint"""
+    stamp = []
+    for path in (Path(DB_PATH), Path(f"{DB_PATH}-wal")):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            stat = None
+        # An empty WAL (as created when the first reader opens the database) holds no changes
+        stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size) if stat and stat.st_size else None)
+    return tuple(stamp)
+
+
+@app.before_request
+def check_database_generation():
+    """Drop cached results when the database has changed since they were read
+
+    The request's results are cached under the generation seen here, before any of its queries ran,
+    so they are never older than their key.
+    """
+    global pool
+    previous = result_cache.generation
+    stamp = database_stamp()
+    g.database_generation = stamp
+    if result_cache.set_generation(stamp) and previous:
+        # A database file replaced on disk (not rebuilt in place) leaves pooled connections on the old file
+        if previous[0] is None or stamp[0] is None or previous[0][0] != stamp[0][0]:
+            with pool_lock:
+                if pool is not None:
+                    pool.close()
+                    pool = None
+
+
+def cached(view):
+    """Serve repeated requests for a view from result_cache; only successful responses are stored.
+
+    Successful responses carry an ETag of the database stamp and the request, so a client revalidating
+    with If-None-Match gets a 304 without the view running until the database changes. Bodies are
+    stored compressed, once per content encoding.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        generation = g.database_generation
+        request_key = (generation, request.endpoint, tuple(sorted(request.view_args.items())),
+                       tuple(sorted(request.args.items(multi=True))))
+        etag = hashlib.sha1(repr(request_key).encode()).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            set_validators(response, etag)
+            return response
+        encoding = content_encoding()
+        key = (*request_key, encoding)
+        hit = result_cache.get(key)
+        if hit is not None:
+            body, status, headers = hit
+            response = Response(body, status=status, headers=headers)
+            response.headers["X-Cache"] = "HIT"
+            return response
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            set_validators(response, etag)
+            compress_response(response, encoding)
+            # Not worth keeping if the database changed (and the cache was cleared) while the view ran
+            if result_cache.generation == generation:
+                body = response.get_data()
+                result_cache.put(key, (body, response.status_code, list(response.headers.items())), len(body))
+        response.headers["X-Cache"] = "MISS"
+        return response
+    return wrapper
+
+
+def set_validators(response, etag):
+    # Weak, since the same ETag is sent for every content encoding of the body;
+    # no-cache lets browsers keep the response but revalidate it on every use
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+
+
+# JSON responses are compressed with brotli (if installed) or gzip, whichever the client prefers
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def content_encoding():
+    """The Accept-Encoding of the request we compress with, or None"""
+    return request.accept_encodings.best_match(["br", "gzip"] if brotli else ["gzip"])
+
+
+def compress_response(response, encoding):
+    """Compress a complete JSON response in place"""
+    if response.mimetype != "application/json" or response.is_streamed or response.direct_passthrough:
+        return response
+    response.vary.add("Accept-Encoding")
+    if encoding is None or "Content-Encoding" in response.headers:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    if encoding == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@app.after_request
+def compress_json(response):
+    """Compress the JSON responses not already compressed (and cached) by @cached"""
+    return compress_response(response, content_encoding())
+
+
+# Keyset pagination: listings are ordered by an indexed sort key plus rowid (the implicit last
+# column of every index), and the next page seeks past the last key instead of using OFFSET
+class InvalidCursor(ValueError):
+    """Raised when the ?cursor= parameter cannot be decoded"""
+
+
+@app.errorhandler(InvalidCursor)
+def invalid_cursor(error):
+    return jsonify({"error": str(error)}), 400
+
+
+def page_size():
+    """Requested page size, clamped to 1..MAX_PAGE_SIZE"""
+    return max(1, min(request.args.get("limit", DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+
+
+def encode_cursor(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(sort_key).encode()).decode()
+
+
+# Python ints outside SQLite's 64-bit INTEGER cannot be bound as query parameters
+SQLITE_INTEGERS = range(-2 ** 63, 2 ** 63)
+
+
+def sort_value(value):
+    """Whether a value decoded from a cursor can be bound in place of a sort column (all are numeric)"""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return value in SQLITE_INTEGERS
+    return isinstance(value, float) and math.isfinite(value)
+
+
+def decode_cursor(length):
+    """Sort key of the last row of the previous page, or None for the first page
+
+    The sort key is `length` numbers, the last of them the rowid.
+    """
+    cursor = request.args.get("cursor")
+    if not cursor:
+        return None
+    try:
+        sort_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor("Invalid cursor")
+    if (not isinstance(sort_key, list) or len(sort_key) != length or not all(map(sort_value, sort_key))
+            or not isinstance(sort_key[-1], int)):
+        raise InvalidCursor("Invalid cursor")
+    return sort_key
+
+
+def paged_response(rows, sort_columns, limit):
+    """JSON list of one page, with the next page's cursor in the X-Next-Cursor and Link headers.
+
+    rows come from a query fetching limit + 1 rows, selecting rowid and the sort columns.
+    """
+    page = rows[:limit]
+    response = jsonify([{key: row[key] for key in row.keys() if key not in HIDDEN_COLUMNS} for row in page])
+    if len(rows) > limit:
+        last = page[-1]
+        cursor = encode_cursor([last[column] for column in sort_columns] + [last["rowid"]])
+        response.headers["X-Next-Cursor"] = cursor
+        next_url = url_for(request.endpoint, **{**request.view_args, **request.args, "cursor": cursor})
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
 
 
 # Index route
@@ -32,96 +366,706 @@ def index():
 
 
 @app.route('/api/trips', methods=['GET'])
+@cached
 def get_trips():
-    """Get first 100 trips"""
+    """Get one page of trips (?limit=, ?cursor=), ordered by pickup time or by ?sort= (see TRIP_SORTS)"""
+    sort = request.args.get("sort", "pickup_time")
+    descending = sort.startswith("-")
+    column = TRIP_SORTS.get(sort.removeprefix("-"))
+    if column is None:
+        raise InvalidFilter(f"Invalid value for sort: {sort!r}")
+    limit = page_size()
+    after = decode_cursor(2)
+
+    # Each sort is a walk of its single-column index (backwards when descending), and the cursor seek
+    # starts the walk past the last row of the previous page. Trips without a fare are not ordered by fare.
+    clauses = ["estimated_fare IS NOT NULL"] if column == "estimated_fare" else []
+    if after:
+        clauses.append(f"({column}, rowid) {'<' if descending else '>'} (?, ?)")
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+    direction = " DESC" if descending else ""
+
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT trip_id AS id, vendor_id, pickup_datetime, dropoff_datetime, passenger_count, pickup_longitude, pickup_latitude, dropoff_longitude, dropoff_latitude, trip_duration_seconds AS trip_duration FROM trips LIMIT 100")
-    data = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(data)
+    cursor.execute(f"""
+        SELECT rowid, {column} AS sort_key, {TRIP_SUMMARY_COLUMNS}, trip_distance_km, estimated_fare
+        FROM trips
+        {where}
+        ORDER BY {column}{direction}, rowid{direction}
+        LIMIT ?
+    """, (*(after or []), limit + 1))
+    rows = cursor.fetchall()
+    return paged_response(rows, ["sort_key"], limit)
 
 
 @app.route('/api/trips/<trip_id>', methods=['GET'])
+@cached
 def get_trip_by_id(trip_id):
     """Get one trip by its trip_id"""
     conn = get_connection()
-    row = conn.execute("SELECT * FROM trips WHERE trip_id = ?", (trip_id,)).fetchone()
-    conn.close()
+    row = conn.execute(f"SELECT {TRIP_DETAIL_COLUMNS} FROM trips WHERE trip_id = ?", (trip_id,)).fetchone()
     if row:
         return jsonify(dict(row))
     else:
         return jsonify({"error": "Trip not found"}), 404
 
-# @app.route('/api/fares', methods=['GET'])
-# def get_fares():
-
-#@app.route('/api/fares', methods=['GET'])
-#def get_fares():
-    """Get first 100 fare records"""
-    conn = get_connection()
-    rows = conn.execute("SELECT * FROM fares LIMIT 100").fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
-
 
 @app.route('/api/trips/by_date', methods=['GET'])
+@cached
 def trips_by_date():
-    """Filter trips by pickup date (YYYY-MM-DD)"""
+    """Filter trips by pickup date (YYYY-MM-DD), ordered by pickup time"""
     date = request.args.get("date")
     if not date:
         return jsonify({"error": "Please provide ?date=YYYY-MM-DD"}), 400
+    try:
+        start = day_start(date)
+    except ValueError:
+        raise InvalidFilter(f"Invalid value for date: {date!r}")
+    limit = page_size()
+    after = decode_cursor(2)
 
+    # A day is a range of pickup_at, so the page is a seek on idx_trips_pickup_at.
+    # On later pages the cursor replaces the lower bound, since SQLite only seeks on a lone row value.
     conn = get_connection()
-    query = """
-            SELECT *
+    query = f"""
+            SELECT rowid, pickup_at, {TRIP_DETAIL_COLUMNS}
             FROM trips
-            WHERE DATE(pickup_datetime) = ?
-            LIMIT 100 \
+            WHERE {"(pickup_at, rowid) > (?, ?)" if after else "pickup_at >= ?"}
+            AND pickup_at < ?
+            ORDER BY pickup_at, rowid
+            LIMIT ?
             """
-    rows = conn.execute(query, (date,)).fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
+    rows = conn.execute(query, (*(after or [start]), start + SECONDS_PER_DAY, limit + 1)).fetchall()
+    return paged_response(rows, ["pickup_at"], limit)
 
 
 @app.route('/api/trips/by_distance', methods=['GET'])
+@cached
 def trips_by_distance():
-    """Filter trips by trip distance range"""
-    min_d = float(request.args.get("min", 0))
-    max_d = float(request.args.get("max", 10))
+    """Filter trips by trip distance range, ordered by distance"""
+    min_d = float_arg("min", 0.0)
+    max_d = float_arg("max", 10.0)
+    limit = page_size()
+    after = decode_cursor(2)
 
     conn = get_connection()
-    query = """
-            SELECT *
+    query = f"""
+            SELECT rowid, {TRIP_DETAIL_COLUMNS}
             FROM trips
-            WHERE trip_distance_km BETWEEN ? AND ?
-            LIMIT 100
+            WHERE {"(trip_distance_km, rowid) > (?, ?)" if after else "trip_distance_km >= ?"}
+            AND trip_distance_km <= ?
+            ORDER BY trip_distance_km, rowid
+            LIMIT ?
             """
-    rows = conn.execute(query, (min_d, max_d)).fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in rows])
+    rows = conn.execute(query, (*(after or [min_d]), max_d, limit + 1)).fetchall()
+    return paged_response(rows, ["trip_distance_km"], limit)
 
 @app.route('/api/trips/by_location', methods=['GET'])
+@cached
 def trips_by_location():
     """Filter trips by pickup location zone (e.g., midtown, downtown)"""
     location = request.args.get("location")
     if not location:
         return jsonify({"error": "Please provide ?location=<zone>"}), 400
+    limit = page_size()
+    after = decode_cursor(1)
 
+    # Zone codes are stored in lower case
     conn = get_connection()
-    query = """
-        SELECT trip_id AS id, vendor_id, pickup_datetime, dropoff_datetime,
-               passenger_count, pickup_longitude, pickup_latitude,
-               dropoff_longitude, dropoff_latitude, trip_duration_seconds AS trip_duration,
-               pickup_zone
+    query = f"""
+        SELECT rowid, {TRIP_SUMMARY_COLUMNS}, {PICKUP_ZONE}
+        FROM trips
+        WHERE {PICKUP_ZONE_IS}
+        {"AND rowid > ?" if after else ""}
+        ORDER BY rowid
+        LIMIT ?
+    """
+    rows = conn.execute(query, (location.lower(), *(after or []), limit + 1)).fetchall()
+    return paged_response(rows, [], limit)
+
+
+# Composable search: every filter compiles to a plain comparison on an indexed column, so SQLite
+# can seek idx_trips_pickup_at, idx_trips_zone_month, idx_trips_zone_pickup_at, idx_trips_vendor_pickup_at or a
+# single-column index.
+# Results are ordered the way that index returns them, so neither the page nor the cursor seek needs a sort.
+class InvalidFilter(ValueError):
+    """Raised when a search filter has a malformed value"""
+
+
+@app.errorhandler(InvalidFilter)
+def invalid_filter(error):
+    return jsonify({"error": str(error)}), 400
+
+
+def day_start(value):
+    """Epoch seconds of the start of a YYYY-MM-DD day"""
+    return (datetime.date.fromisoformat(value) - datetime.date(1970, 1, 1)).days * SECONDS_PER_DAY
+
+
+def day_end(value):
+    """Epoch seconds of the start of the day after a YYYY-MM-DD day"""
+    return day_start(value) + SECONDS_PER_DAY
+
+
+def zone_code(value):
+    return value.lower()
+
+
+def integer(value):
+    """int() of a query parameter, limited to the integers SQLite can bind"""
+    number = int(value)
+    if number not in SQLITE_INTEGERS:
+        raise ValueError(f"{value!r} is out of range")
+    return number
+
+
+# Query parameter -> (SQL comparison, parser)
+SEARCH_FILTERS = {
+    "start_date": ("pickup_at >= ?", day_start),
+    "end_date": ("pickup_at < ?", day_end),
+    "hour": ("pickup_hour = ?", integer),
+    "month": ("pickup_month = ?", integer),
+    "zone": (PICKUP_ZONE_IS, zone_code),
+    "vendor": ("vendor_id = ?", integer),
+    "min_distance": ("trip_distance_km >= ?", float),
+    "max_distance": ("trip_distance_km <= ?", float),
+    "min_duration": ("trip_duration_seconds >= ?", integer),
+    "max_duration": ("trip_duration_seconds <= ?", integer),
+    "min_fare": ("estimated_fare >= ?", float),
+    "max_fare": ("estimated_fare <= ?", float),
+}
+
+
+# Range filters whose column, followed by rowid, orders the results when no equality filter does
+SEARCH_RANGE_SORTS = [
+    (("start_date", "end_date"), "pickup_at"),
+    (("min_distance", "max_distance"), "trip_distance_km"),
+    (("min_duration", "max_duration"), "trip_duration_seconds"),
+    (("min_fare", "max_fare"), "estimated_fare"),
+]
+
+
+def search_sort_columns(values):
+    """Sort columns (before rowid) matching the index SQLite will seek for these filters"""
+    # A zone and a date range are one range of idx_trips_zone_pickup_at
+    if "zone" in values and {"start_date", "end_date"} & values.keys():
+        return ["pickup_at"]
+    # Equality lookups on a single-column index (or a full composite prefix) come out in rowid order
+    if {"zone", "hour", "month"} & values.keys():
+        return []
+    for names, column in SEARCH_RANGE_SORTS:
+        # Only the date range is covered by a composite index with vendor in front (idx_trips_vendor_pickup_at)
+        if names[0] in values or names[1] in values:
+            if column == "pickup_at" or "vendor" not in values:
+                return [column]
+    return []
+
+
+def parse_search_filters(filters):
+    """Parsed values of the SEARCH_FILTERS present in a dict of strings; unknown keys are ignored"""
+    values = {}
+    for name, (_, parse) in SEARCH_FILTERS.items():
+        if filters.get(name) not in (None, ""):
+            try:
+                values[name] = parse(filters[name])
+            except ValueError:
+                raise InvalidFilter(f"Invalid value for {name}: {filters[name]!r}")
+    return values
+
+
+def compile_trip_search(filters):
+    """WHERE clauses, their parameters and the sort columns for a dict of SEARCH_FILTERS values (as strings)
+
+    Unknown keys are ignored. Rows are ordered by the sort columns and then rowid.
+    """
+    return compile_parsed_search(parse_search_filters(filters))
+
+
+def compile_parsed_search(values):
+    """compile_trip_search for filter values already parsed by parse_search_filters"""
+    values = dict(values)
+
+    # An hour of a single day is one range of idx_trips_pickup_at
+    if ({"start_date", "end_date", "hour"} <= values.keys() and 0 <= values["hour"] < 24
+            and values["end_date"] - values["start_date"] == SECONDS_PER_DAY):
+        values["start_date"] += values.pop("hour") * 3600
+        values["end_date"] = values["start_date"] + 3600
+    clauses, params = [], []
+    for name, value in values.items():
+        clauses.append(SEARCH_FILTERS[name][0])
+        params.append(value)
+    return clauses, params, search_sort_columns(values)
+
+
+def search_page_query(clauses, params, sort_columns, after=None):
+    """SQL for one page of a compiled search, seeking past the `after` sort key; the LIMIT is the last parameter"""
+    clauses, params = list(clauses), list(params)
+    sort_key = ", ".join(sort_columns + ["rowid"])
+    if after:
+        # SQLite only seeks on the row value when it is the sole lower bound of the sort column, and
+        # the cursor (taken from a matching row) already implies the filter's lower bound
+        lower_bound = f"{sort_columns[0]} >= ?" if sort_columns else None
+        if lower_bound in clauses:
+            index = clauses.index(lower_bound)
+            try:
+                if after[0] < params[index]:
+                    raise InvalidCursor("Invalid cursor")
+            except TypeError:
+                raise InvalidCursor("Invalid cursor")
+            del clauses[index], params[index]
+        clauses.append(f"({sort_key}) > ({', '.join('?' * len(after))})")
+        params += after
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+    query = f"""
+        SELECT rowid, pickup_at, {TRIP_SUMMARY_COLUMNS}, date(pickup_at, 'unixepoch') AS pickup_date,
+               {PICKUP_ZONE}, trip_distance_km, estimated_fare
         FROM trips
-        WHERE LOWER(pickup_zone) = LOWER(?)
-        LIMIT 100
+        {where}
+        ORDER BY {sort_key}
+        LIMIT ?
+    """
+    return query, params
+
+
+@app.route('/api/trips/search', methods=['GET'])
+@cached
+def search_trips():
+    """Trips matching any combination of the SEARCH_FILTERS parameters (?limit=, ?cursor=)"""
+    clauses, params, sort_columns = compile_trip_search(request.args)
+    limit = page_size()
+    after = decode_cursor(len(sort_columns) + 1)
+    query, params = search_page_query(clauses, params, sort_columns, after)
+
+    conn = get_connection()
+    rows = conn.execute(query, (*params, limit + 1)).fetchall()
+    # trip_duration_seconds is returned as trip_duration (see TRIP_SUMMARY_COLUMNS)
+    keys = ["trip_duration" if column == "trip_duration_seconds" else column for column in sort_columns]
+    return paged_response(rows, keys, limit)
+
+
+# Spatial queries, answered from the R*Tree indexes over the pickup and dropoff points
+MAX_RADIUS_KM = 50
+# Widens the search box a little, so rounding never leaves out a trip on the edge of the circle
+SEARCH_BOX_PADDING = 1e-6
+
+
+def float_arg(name, default=None):
+    """A finite float query parameter; InvalidFilter if it is malformed, or missing without a default"""
+    value = request.args.get(name)
+    if value in (None, ""):
+        if default is None:
+            raise InvalidFilter(f"Please provide ?{name}=")
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    # nan and inf parse, but bound no box or range
+    if not math.isfinite(number):
+        raise InvalidFilter(f"Invalid value for {name}: {value!r}")
+    return number
+
+
+def spatial_point():
+    """Which trip point (pickup or dropoff) a spatial query matches, from ?point="""
+    point = request.args.get("point", "pickup")
+    if f"trip_{point}_points" not in SPATIAL_INDEXES:
+        raise InvalidFilter("point must be pickup or dropoff")
+    return point
+
+
+def bbox_rowids(point, min_lat, min_lon, max_lat, max_lon):
+    """SQL selecting the rowids (as id) of the trips whose point lies in the box, and its parameters
+
+    The R*Tree stores bounds rounded outwards, so points it places inside the box are inside; only
+    those overlapping an edge are checked against the exact coordinates in trips.
+    """
+    sql = f"""
+        SELECT id FROM trip_{point}_points AS points
+        WHERE max_longitude >= ?1 AND min_longitude <= ?2 AND max_latitude >= ?3 AND min_latitude <= ?4
+          AND ((min_longitude >= ?1 AND max_longitude <= ?2 AND min_latitude >= ?3 AND max_latitude <= ?4)
+               OR EXISTS (SELECT 1 FROM trips WHERE trips.rowid = points.id
+                          AND {point}_longitude BETWEEN ?1 AND ?2 AND {point}_latitude BETWEEN ?3 AND ?4))
+    """
+    return sql, [min_lon, max_lon, min_lat, max_lat]
+
+
+@app.route('/api/trips/within_bbox', methods=['GET'])
+@cached
+def trips_within_bbox():
+    """Trips whose pickup (or ?point=dropoff) lies in a bounding box, in rowid order (?limit=, ?cursor=)"""
+    point = spatial_point()
+    min_lat, max_lat = float_arg("min_lat"), float_arg("max_lat")
+    min_lon, max_lon = float_arg("min_lon"), float_arg("max_lon")
+    if min_lat > max_lat or min_lon > max_lon:
+        raise InvalidFilter("min_lat / min_lon must not exceed max_lat / max_lon")
+    limit = page_size()
+    after = decode_cursor(1)
+
+    # Page through the R*Tree matches first, then read only that page's trips
+    rowids, params = bbox_rowids(point, min_lat, min_lon, max_lat, max_lon)
+    conn = get_connection()
+    query = f"""
+        WITH page AS ({rowids} {"AND id > ?5" if after else ""} ORDER BY id LIMIT ?6)
+        SELECT trips.rowid, {TRIP_SUMMARY_COLUMNS}, {PICKUP_ZONE}, {DROPOFF_ZONE}
+        FROM page JOIN trips ON trips.rowid = page.id
+        ORDER BY page.id
+    """
+    rows = conn.execute(query, (*params, after[0] if after else None, limit + 1)).fetchall()
+    return paged_response(rows, [], limit)
+
+
+def search_box(lat, lon, search_km):
+    """(min_lat, min_lon, max_lat, max_lon) of a box holding every point within search_km of (lat, lon)
+
+    Degrees are taken on the sphere the haversine distance uses. The circle is widest in longitude
+    towards the pole, so the longitude span is that of the box's latitude nearest to it, and takes
+    every longitude once the box reaches a pole.
+    """
+    dlat = math.degrees(search_km / EARTH_RADIUS_KM) * (1 + SEARCH_BOX_PADDING)
+    widest_lat = abs(lat) + dlat
+    dlon = dlat / math.cos(math.radians(widest_lat)) if widest_lat < 90 else 180
+    if dlon >= 180:
+        return max(lat - dlat, -90), -180, min(lat + dlat, 90), 180
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+@app.route('/api/trips/near', methods=['GET'])
+@cached
+def trips_near():
+    """The trips whose pickup (or ?point=dropoff) is nearest to ?lat= / ?lon=, within ?radius_km= (default 1)
+
+    The R*Tree is searched with a box that grows towards the radius until it holds `limit` trips, and
+    candidates are refined with the haversine distance, so only the neighbourhood of the point is read.
+    """
+    point = spatial_point()
+    lat, lon = float_arg("lat"), float_arg("lon")
+    radius_km = float_arg("radius_km", 1.0)
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise InvalidFilter(f"radius_km must be between 0 and {MAX_RADIUS_KM}")
+    limit = page_size()
+
+    conn = get_connection()
+    search_km = min(radius_km, 0.25)
+    while True:
+        candidates, params = bbox_rowids(point, *search_box(lat, lon, search_km))
+        rows = conn.execute(f"SELECT rowid, {point}_latitude, {point}_longitude FROM trips WHERE rowid IN ({candidates})",
+                            params).fetchall()
+        rowids = np.array([row[0] for row in rows], dtype=np.int64)
+        distances = haversine_vectorized(lon, lat, np.array([row[2] for row in rows], dtype=float),
+                                         np.array([row[1] for row in rows], dtype=float))
+        within = distances <= search_km
+        # Every trip within search_km lies in the box, so once it holds `limit` of them they are the nearest
+        if within.sum() >= limit or search_km >= radius_km:
+            break
+        search_km = min(search_km * 4, radius_km)
+
+    nearest = np.argsort(distances[within], kind="stable")[:limit]
+    rowids, distances = rowids[within][nearest], distances[within][nearest]
+    placeholders = ", ".join("?" * len(rowids))
+    trips = {row["rowid"]: row for row in conn.execute(
+        f"SELECT rowid, {TRIP_SUMMARY_COLUMNS}, {PICKUP_ZONE}, {DROPOFF_ZONE} FROM trips WHERE rowid IN ({placeholders})",
+        rowids.tolist())}
+    return jsonify([{**{key: trips[rowid][key] for key in trips[rowid].keys() if key != "rowid"},
+                     "distance_km": round(float(distance), 4)}
+                    for rowid, distance in zip(rowids.tolist(), distances)])
+
+
+# Density map, answered from the heatmap cells precomputed at load time (see backend/database/heatmap.py)
+MAX_HEATMAP_CELLS = 4096
+NYC_BOUNDS = {"min_lat": 40.5, "max_lat": 41.0, "min_lon": -74.5, "max_lon": -73.5}
+
+
+def int_arg(name):
+    """An optional integer query parameter (None if missing); InvalidFilter if it is malformed"""
+    value = request.args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return integer(value)
+    except ValueError:
+        raise InvalidFilter(f"Invalid value for {name}: {value!r}")
+
+
+@app.route('/api/heatmap', methods=['GET'])
+@cached
+def heatmap():
+    """Trip counts per grid cell of a viewport (?min_lat= ... ?max_lon=, default all of New York)
+
+    ?zoom= picks the grid level (default and maximum: the finest held); the level is lowered until the
+    viewport spans at most MAX_HEATMAP_CELLS cells, so the response size does not grow with the trips.
+    Takes ?point=dropoff, ?hour= and ?vendor=.
     """
-    rows = conn.execute(query, (location,)).fetchall()
-    conn.close()
+    point = spatial_point()
+    bounds = {name: float_arg(name, default) for name, default in NYC_BOUNDS.items()}
+    if bounds["min_lat"] > bounds["max_lat"] or bounds["min_lon"] > bounds["max_lon"]:
+        raise InvalidFilter("min_lat / min_lon must not exceed max_lat / max_lon")
+    zoom = int_arg("zoom")
+    level = HEATMAP_LEVELS[-1] if zoom is None else min(max(zoom, HEATMAP_LEVELS[0]), HEATMAP_LEVELS[-1])
+    while True:
+        min_x, max_x = cell_x([bounds["min_lon"], bounds["max_lon"]], level).tolist()
+        # Rows count down from the north edge
+        min_y, max_y = cell_y([bounds["max_lat"], bounds["min_lat"]], level).tolist()
+        if (max_x - min_x + 1) * (max_y - min_y + 1) <= MAX_HEATMAP_CELLS or level == HEATMAP_LEVELS[0]:
+            break
+        level -= 1
+
+    clauses = ["level = ?", "cell_x BETWEEN ? AND ?", "cell_y BETWEEN ? AND ?"]
+    params = [level, min_x, max_x, min_y, max_y]
+    for name, column in [("hour", "pickup_hour"), ("vendor", "vendor_id")]:
+        value = int_arg(name)
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    conn = get_connection()
+    rows = conn.execute(f"""
+        SELECT cell_x, cell_y, SUM(trip_count) AS trips
+        FROM {point}_heatmap_cells
+        WHERE {" AND ".join(clauses)}
+        GROUP BY cell_x, cell_y
+    """, params).fetchall()
+
+    # Cells are returned with their centre, and their size in degrees for drawing them
+    x = np.array([row["cell_x"] for row in rows])
+    y = np.array([row["cell_y"] for row in rows])
+    longitudes = cell_longitude(x + 0.5, level).tolist()
+    latitudes = cell_latitude(y + 0.5, level).tolist()
+    heights = (cell_latitude(y, level) - cell_latitude(y + 1, level)).tolist()
+    return jsonify({
+        "level": level,
+        "point": point,
+        "cell_width": 360 / 2 ** level,
+        "cells": [{"x": row["cell_x"], "y": row["cell_y"], "lon": lon, "lat": lat, "height": height,
+                   "trips": row["trips"]}
+                  for row, lon, lat, height in zip(rows, longitudes, latitudes, heights)],
+    })
+
+
+@app.route('/api/trips/export', methods=['GET'])
+def export_trips():
+    """Stream every trip matching the filters as NDJSON (default) or CSV (?format=csv)
+
+    Accepts the filters of the listing routes: date, min / max distance and location.
+    Rows are read in batches and written as they are fetched, so memory stays flat.
+    """
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+
+    clauses, params = [], []
+    if request.args.get("date"):
+        try:
+            start = day_start(request.args["date"])
+        except ValueError:
+            raise InvalidFilter(f"Invalid value for date: {request.args['date']!r}")
+        clauses.append("pickup_at >= ? AND pickup_at < ?")
+        params += [start, start + SECONDS_PER_DAY]
+    if request.args.get("min"):
+        clauses.append("trip_distance_km >= ?")
+        params.append(float_arg("min"))
+    if request.args.get("max"):
+        clauses.append("trip_distance_km <= ?")
+        params.append(float_arg("max"))
+    if request.args.get("location"):
+        clauses.append(PICKUP_ZONE_IS)
+        params.append(request.args["location"].lower())
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(f"SELECT {TRIP_DETAIL_COLUMNS} FROM trips {where}", params)
+    columns = [column[0] for column in cursor.description]
+
+    def generate():
+        try:
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                yield buffer.getvalue()
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+                if not rows:
+                    break
+                if export_format == "csv":
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+        finally:
+            cursor.close()
+
+    if export_format == "csv":
+        return Response(stream_with_context(generate()), mimetype="text/csv",
+                        headers={"Content-Disposition": "attachment; filename=trips.csv"})
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+# Dashboard statistics, answered from the rollup tables built at load time. They take the filters of
+# /api/trips/search; filters the rollups do not hold (hour, distance, duration, fare) are answered from
+# trips, or from the memory-mapped columns when COLUMN_ENGINE=1
+ROLLUP_FILTERS = {"start_date", "end_date", "month", "zone", "vendor"}
+COLUMN_ENGINE = os.environ.get("COLUMN_ENGINE", "0") == "1"
+column_store = None  # (database generation and export time, store or None)
+
+
+def get_column_store():
+    """The columnar copy of DB_PATH, if enabled and exported from the current database (else None)
+
+    Checked again whenever the database or the export changes.
+    """
+    global column_store
+    if not COLUMN_ENGINE:
+        return None
+    manifest = columns_dir(DB_PATH) / "manifest.json"
+    key = (result_cache.generation, manifest.stat().st_mtime_ns if manifest.exists() else None)
+    if column_store is None or column_store[0] != key:
+        store = ColumnStore(manifest.parent) if key[1] else None
+        column_store = (key, store if store and store.matches(get_connection()) else None)
+    return column_store[1]
+
+
+def stats_filters():
+    """Parsed stats filters, and the column store to answer them from (None: answer in SQL)"""
+    filters = parse_search_filters(request.args)
+    store = get_column_store() if filters.keys() - ROLLUP_FILTERS else None
+    return filters, store
+
+
+def stats_source(rollup_table, filters):
+    """FROM clause and parameters over the rows the filters select
+
+    Filters the rollups hold are answered from rollup_table; otherwise the trips are read directly,
+    one row per trip under the rollup column names, so the aggregate queries are the same either way.
+    """
+    clauses, params, _ = compile_parsed_search(filters)
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+    if filters.keys() <= ROLLUP_FILTERS:
+        return f"{rollup_table} {where}", params
+    return f"""(SELECT pickup_hour, vendor_id, passenger_count, 1 AS trip_count,
+                       trip_distance_km AS total_distance_km,
+                       CAST(trip_duration_seconds AS REAL) AS total_duration_seconds,
+                       estimated_fare AS total_fare, passenger_count AS total_passengers
+                FROM trips {where})""", params
+
+
+@app.route('/api/stats/summary', methods=['GET'])
+@cached
+def stats_summary():
+    """Trip count and averages over all trips matching the filters"""
+    filters, store = stats_filters()
+    if store:
+        return jsonify(store.summary(filters))
+    source, params = stats_source("trip_rollups", filters)
+    conn = get_connection()
+    query = f"""
+        SELECT COALESCE(SUM(trip_count), 0) AS total_trips,
+               SUM(total_duration_seconds) / SUM(trip_count) AS avg_duration_seconds,
+               SUM(total_distance_km) / SUM(trip_count) AS avg_distance_km,
+               SUM(total_fare) / SUM(trip_count) AS avg_fare,
+               CAST(SUM(total_passengers) AS REAL) / SUM(trip_count) AS avg_passengers
+        FROM {source}
+    """
+    row = conn.execute(query, params).fetchone()
+    return jsonify(dict(row))
+
+
+@app.route('/api/stats/hourly', methods=['GET'])
+@cached
+def stats_hourly():
+    """Trip counts by pickup hour"""
+    filters, store = stats_filters()
+    if store:
+        return jsonify(store.hourly(filters))
+    source, params = stats_source("trip_rollups", filters)
+    conn = get_connection()
+    query = f"""
+        SELECT pickup_hour AS hour, SUM(trip_count) AS trips
+        FROM {source}
+        GROUP BY pickup_hour
+        ORDER BY pickup_hour
+    """
+    rows = conn.execute(query, params).fetchall()
+    return jsonify([dict(row) for row in rows])
+
+
+@app.route('/api/stats/vendors', methods=['GET'])
+@cached
+def stats_vendors():
+    """Trip counts and share per vendor"""
+    filters, store = stats_filters()
+    if store:
+        return jsonify(store.vendor_shares(filters))
+    source, params = stats_source("trip_rollups", filters)
+    conn = get_connection()
+    query = f"""
+        SELECT vendor_id, vendor_name, trips, CAST(trips AS REAL) / SUM(trips) OVER () AS share
+        FROM (SELECT vendor_id, SUM(trip_count) AS trips FROM {source} GROUP BY vendor_id)
+        JOIN vendors USING (vendor_id)
+        ORDER BY trips DESC, vendor_id
+    """
+    rows = conn.execute(query, params).fetchall()
+    return jsonify([dict(row) for row in rows])
+
+
+@app.route('/api/stats/passengers', methods=['GET'])
+@cached
+def stats_passengers():
+    """Trip counts by passenger count"""
+    filters, store = stats_filters()
+    if store:
+        return jsonify(store.passengers(filters))
+    source, params = stats_source("trip_passenger_rollups", filters)
+    conn = get_connection()
+    query = f"""
+        SELECT passenger_count, SUM(trip_count) AS trips
+        FROM {source}
+        GROUP BY passenger_count
+        ORDER BY passenger_count
+    """
+    rows = conn.execute(query, params).fetchall()
     return jsonify([dict(row) for row in rows])
 
 
+@app.route('/api/rejections', methods=['GET'])
+def rejections():
+    """Records excluded by the last cleaning run, counted per reason (written by scripts/data_cleaning.py)"""
+    try:
+        with open(REJECTION_SUMMARY_PATH) as f:
+            return jsonify(json.load(f))
+    except FileNotFoundError:
+        return jsonify({"error": "No rejection summary found. Please run: python scripts/data_cleaning.py"}), 404
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit / miss counters and occupancy of the result cache"""
+    return jsonify(result_cache.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request and SQL latency histograms, row counts and result cache counters, in Prometheus text format"""
+    stats = result_cache.stats()
+    cache_metrics = []
+    for name, documentation in [("hits", "Result cache hits"), ("misses", "Result cache misses"),
+                                ("evictions", "Entries evicted to stay within max_bytes"),
+                                ("expirations", "Entries dropped after their TTL"),
+                                ("invalidations", "Cache clears after a database change")]:
+        counter = metrics.Counter(f"result_cache_{name}_total", documentation)
+        counter.inc(amount=stats[name])
+        cache_metrics.append(counter)
+    for name, documentation in [("entries", "Entries held in the result cache"),
+                                ("bytes", "Bytes held in the result cache")]:
+        gauge = metrics.Gauge(f"result_cache_{name}", documentation)
+        gauge.set(value=stats[name])
+        cache_metrics.append(gauge)
+    return Response(metrics.render(cache_metrics), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server; `python run.py` serves with a bounded thread pool instead
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get("FLASK_DEBUG") == "1")
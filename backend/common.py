@@ -0,0 +1,25 @@
+""" Paths and helpers shared by the API and the offline scripts (cleaning, ingest, setup) """
+
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Logs of the cleaning runs: excluded records and their summary, served by /api/rejections
+LOG_DIR = BASE_DIR / 'backend' / 'logs'
+LOG_PATH = LOG_DIR / 'excluded_records.log'
+REJECTED_PATH = LOG_DIR / 'rejected_records.parquet'
+REJECTION_SUMMARY_PATH = LOG_DIR / 'rejection_summary.json'
+
+EARTH_RADIUS_KM = 6371
+
+
+# Haversine formula for distance calculation
+def haversine_vectorized(lon1, lat1, lon2, lat2):
+    """Calculate distance between two GPS points"""
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
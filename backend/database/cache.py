@@ -0,0 +1,87 @@
+""" In-process cache of query results for the API """
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """ Size-bounded LRU cache with a time-to-live, tied to a database generation
+
+    Entries are evicted least recently used first once their total size exceeds `max_bytes`,
+    and expire `ttl` seconds after they were stored. Changing the generation (see
+    `set_generation`) drops every entry, so results never outlive the data they were read from.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=300, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = None
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """ Cached value for key, or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                self._discard(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value, size):
+        """ Store value, evicting least recently used entries to stay within max_bytes """
+        if size > self.max_bytes or self.ttl <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (self.clock() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def set_generation(self, generation):
+        """ Record the current database generation, clearing the cache if it changed. Returns True on change """
+        with self._lock:
+            if generation == self.generation:
+                return False
+            if self.generation is not None:
+                self.invalidations += 1
+            self.generation = generation
+            self._entries.clear()
+            self._bytes = 0
+            return True
+
+    def _discard(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,270 @@
+""" Memory-mapped columnar copy of the trips table, for whole-table filters and aggregates
+
+The load step exports the filter and aggregate columns of trips to one .npy file per column, next to
+the database (nyc_taxi.columns/). The API maps them read-only, so opening the store costs no reads and
+every worker process shares the same pages through the OS page cache. Filters become boolean masks and
+group-bys become np.bincount over small integer codes, instead of a scan that builds a Python row per trip.
+
+manifest.json records a signature of the database the columns were exported from; a store whose
+signature no longer matches (e.g. after an ingest that did not re-export) is not used. Trips added
+since an export are appended to its files in place (append_columns), so an ingest costs its own rows.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+# Stored column -> dtype; zones are stored as their position in manifest['zones'] (-1 for none)
+COLUMN_DTYPES = {
+    'pickup_at': np.int64,  # seconds since 1970-01-01
+    'pickup_month': np.int8,
+    'pickup_hour': np.int8,
+    'pickup_zone': np.int16,  # a zones file can hold hundreds of zones
+    'vendor_id': np.int8,
+    'passenger_count': np.int8,
+    'trip_distance_km': np.float64,
+    'trip_duration_seconds': np.int32,
+    'estimated_fare': np.float64,
+}
+
+# Rows read from SQLite per batch during the export
+EXPORT_BATCH_ROWS = 250000
+
+# Search filter -> (stored column, comparison)
+FILTERS = {
+    'start_date': ('pickup_at', np.greater_equal),
+    'end_date': ('pickup_at', np.less),
+    'hour': ('pickup_hour', np.equal),
+    'month': ('pickup_month', np.equal),
+    'zone': ('pickup_zone', np.equal),
+    'vendor': ('vendor_id', np.equal),
+    'min_distance': ('trip_distance_km', np.greater_equal),
+    'max_distance': ('trip_distance_km', np.less_equal),
+    'min_duration': ('trip_duration_seconds', np.greater_equal),
+    'max_duration': ('trip_duration_seconds', np.less_equal),
+    'min_fare': ('estimated_fare', np.greater_equal),
+    'max_fare': ('estimated_fare', np.less_equal),
+}
+
+
+def columns_dir(db_path):
+    """ Directory holding the column files of a database """
+    return Path(db_path).with_suffix('.columns')
+
+
+def source_signature(conn):
+    """ Fingerprint of the trips a database holds: trip count, last rowid and the ingested files """
+    trips, last_rowid = conn.execute(
+        "SELECT (SELECT COALESCE(SUM(trip_count), 0) FROM trip_rollups), (SELECT MAX(rowid) FROM trips)").fetchone()
+    # As tuples: the API's connections return sqlite3.Row objects, which json cannot encode
+    files = [tuple(row) for row in conn.execute("SELECT file_name, fingerprint FROM ingested_files ORDER BY file_name")]
+    return hashlib.sha256(json.dumps([trips, last_rowid, files]).encode()).hexdigest()
+
+
+def export_columns(conn, directory):
+    """ Write the trip columns of an open database to directory, replacing any previous export
+
+    Rows are read in rowid order in batches straight into the memory-mapped output files, and the new
+    files are swapped in with renames, so readers never map a half-written column.
+    """
+    directory = Path(directory)
+    staging = directory.with_name(directory.name + '.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    rows = conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+    zone_rows = conn.execute("SELECT zone_id, zone_code FROM location_zones ORDER BY zone_id").fetchall()
+    zones = [code for _, code in zone_rows]
+    zone_numbers = zone_numbers_of(zone_rows)
+    vendors = dict(conn.execute("SELECT vendor_id, vendor_name FROM vendors"))
+
+    columns = {name: np.lib.format.open_memmap(staging / f'{name}.npy', mode='w+', dtype=dtype, shape=(rows,))
+               for name, dtype in COLUMN_DTYPES.items()}
+    copy_trips(conn, columns, zone_numbers)
+    del columns
+
+    with open(staging / 'manifest.json', 'w') as f:
+        json.dump({'rows': rows, 'last_rowid': max_rowid(conn), 'zones': zones, 'vendors': vendors,
+                   'columns': list(COLUMN_DTYPES), 'signature': source_signature(conn)}, f, indent=2)
+
+    replace_directory(staging, directory)
+    return rows
+
+
+def max_rowid(conn):
+    return conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM trips").fetchone()[0]
+
+
+def zone_numbers_of(zone_rows):
+    """ zone_id -> position in manifest['zones'] """
+    return {zone_id: number for number, (zone_id, _) in enumerate(zone_rows)}
+
+
+def copy_trips(conn, columns, zone_numbers, after_rowid=0, start=0):
+    """ Copy the trips past after_rowid, in rowid order, into the columns from position start """
+    cursor = conn.execute("""
+        SELECT pickup_at, pickup_month, pickup_hour, pickup_zone_id, vendor_id, passenger_count, trip_distance_km,
+               trip_duration_seconds, estimated_fare
+        FROM trips
+        WHERE rowid > ?
+        ORDER BY rowid
+        """, (after_rowid,))
+    while True:
+        batch = cursor.fetchmany(EXPORT_BATCH_ROWS)
+        if not batch:
+            break
+        end = start + len(batch)
+        values = list(zip(*batch))
+        columns['pickup_zone'][start:end] = [zone_numbers.get(zone_id, -1) for zone_id in values[3]]
+        for name, column in zip(['pickup_at', 'pickup_month', 'pickup_hour'], values[:3]):
+            columns[name][start:end] = column
+        for name, column in zip(['vendor_id', 'passenger_count', 'trip_distance_km', 'trip_duration_seconds',
+                                 'estimated_fare'], values[4:]):
+            columns[name][start:end] = column
+        start = end
+    for column in columns.values():
+        column.flush()
+
+
+def replace_directory(staging, directory):
+    """ Swap a finished export in for the previous one """
+    # Mapped files stay readable after the rename, so running servers keep working on the old export
+    previous = directory.with_name(directory.name + '.old')
+    shutil.rmtree(previous, ignore_errors=True)
+    if directory.exists():
+        os.replace(directory, previous)
+    os.replace(staging, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def grow_column(path, dtype, rows):
+    """ Resize a 1-d .npy file to rows in place; False if its dtype differs or its header cannot be rewritten
+
+    np.lib.format pads headers so the length of a 1-d array can grow without moving the data.
+    """
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, file_dtype = read_header(f)
+        data_offset = f.tell()
+        if file_dtype != np.dtype(dtype) or len(shape) != 1 or fortran_order:
+            return False
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                      'fortran_order': False, 'shape': (rows,)})
+        if version != (1, 0) or len(header.getvalue()) != data_offset:
+            return False
+        # Data first, header second: a reader sees either the old length or a file long enough for the new one
+        f.truncate(data_offset + rows * np.dtype(dtype).itemsize)
+        f.seek(0)
+        f.write(header.getvalue())
+    return True
+
+
+def append_columns(conn, directory):
+    """ Append the trips added since the export in directory to its files; returns the new row count
+
+    Only valid when no exported trip has changed since (an ingest that replaced no trips). Returns None,
+    leaving the export to be redone with export_columns, if there is no export, it predates last_rowid
+    or its zones or columns differ. Running servers keep their mapping of the old length, and only use
+    the new rows once manifest.json (replaced last) matches the database.
+    """
+    directory = Path(directory)
+    try:
+        with open(directory / 'manifest.json') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    zone_rows = conn.execute("SELECT zone_id, zone_code FROM location_zones ORDER BY zone_id").fetchall()
+    if ('last_rowid' not in manifest or manifest['columns'] != list(COLUMN_DTYPES)
+            or manifest['zones'] != [code for _, code in zone_rows]):
+        return None
+
+    # Positions follow the manifest, so an append interrupted before the manifest was written is redone
+    added = conn.execute("SELECT COUNT(*) FROM trips WHERE rowid > ?", (manifest['last_rowid'],)).fetchone()[0]
+    rows = manifest['rows'] + added
+    for name, dtype in COLUMN_DTYPES.items():
+        if not grow_column(directory / f'{name}.npy', dtype, rows):
+            return None
+    columns = {name: np.load(directory / f'{name}.npy', mmap_mode='r+') for name in COLUMN_DTYPES}
+    copy_trips(conn, columns, zone_numbers_of(zone_rows), manifest['last_rowid'], manifest['rows'])
+    del columns
+
+    manifest.update(rows=rows, last_rowid=max_rowid(conn), signature=source_signature(conn))
+    staged = directory / 'manifest.json.tmp'
+    with open(staged, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staged, directory / 'manifest.json')
+    return rows
+
+
+class ColumnStore:
+    """ Read-only, memory-mapped trip columns with the aggregates of the stats endpoints
+
+    Filters are dicts of parsed search filter values (see FILTERS); dates are epoch seconds.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        with open(self.directory / 'manifest.json') as f:
+            self.manifest = json.load(f)
+        self.rows = self.manifest['rows']
+        self.zones = {code: number for number, code in enumerate(self.manifest['zones'])}
+        self.vendors = {int(vendor_id): name for vendor_id, name in self.manifest['vendors'].items()}
+        self.columns = {name: np.load(self.directory / f'{name}.npy', mmap_mode='r')
+                        for name in self.manifest['columns']}
+
+    def matches(self, conn):
+        """ Whether the columns were exported from the database conn is reading """
+        return self.manifest['signature'] == source_signature(conn)
+
+    def mask(self, filters):
+        """ Boolean mask of the trips matching the filters (None: every trip) """
+        mask = None
+        for name, value in filters.items():
+            column, compare = FILTERS[name]
+            if column == 'pickup_zone':
+                value = self.zones.get(value, -2)  # an unknown zone matches nothing
+            matched = compare(self.columns[column], value)
+            mask = matched if mask is None else mask & matched
+        return mask
+
+    def _select(self, column, mask):
+        return self.columns[column] if mask is None else self.columns[column][mask]
+
+    def summary(self, filters):
+        """ Trip count and averages, as /api/stats/summary """
+        mask = self.mask(filters)
+        trips = self.rows if mask is None else int(np.count_nonzero(mask))
+        if not trips:
+            return {'total_trips': 0, 'avg_duration_seconds': None, 'avg_distance_km': None, 'avg_fare': None,
+                    'avg_passengers': None}
+        total = {column: float(self._select(column, mask).sum(dtype=np.float64))
+                 for column in ['trip_duration_seconds', 'trip_distance_km', 'estimated_fare', 'passenger_count']}
+        return {'total_trips': trips,
+                'avg_duration_seconds': total['trip_duration_seconds'] / trips,
+                'avg_distance_km': total['trip_distance_km'] / trips,
+                'avg_fare': total['estimated_fare'] / trips,
+                'avg_passengers': total['passenger_count'] / trips}
+
+    def counts(self, column, filters):
+        """ (value, trips) for every value of a small integer column that has trips """
+        counts = np.bincount(self._select(column, self.mask(filters)).astype(np.intp))
+        return [(int(value), int(counts[value])) for value in np.flatnonzero(counts)]
+
+    def hourly(self, filters):
+        return [{'hour': hour, 'trips': trips} for hour, trips in self.counts('pickup_hour', filters)]
+
+    def vendor_shares(self, filters):
+        counts = sorted(self.counts('vendor_id', filters), key=lambda item: (-item[1], item[0]))
+        total = sum(trips for _, trips in counts)
+        return [{'vendor_id': vendor_id, 'vendor_name': self.vendors[vendor_id], 'trips': trips,
+                 'share': trips / total} for vendor_id, trips in counts]
+
+    def passengers(self, filters):
+        return [{'passenger_count': count, 'trips': trips} for count, trips in self.counts('passenger_count', filters)]
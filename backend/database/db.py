@@ -1,74 +1,387 @@
 #!/usr/bin/env python3
 """ Create an SQLite database and load the cleaned NYC Taxi data """
 
+import argparse
+import hashlib
+import re
 import sqlite3
+import sys
+import time
 import pandas as pd
 from pathlib import Path
 
+# Make the backend package importable when run as a script (python backend/database/db.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
 
-def create_database(db_path='backend/database/nyc_taxi.db', data_path='data/processed/clean_trips.csv',
-                    schema_path='backend/database/schema.sql'):
-    """ Initialize the database schema and load data """
+from backend.database.columns import columns_dir, export_columns  # noqa: E402
+from backend.database.heatmap import refresh_heatmap  # noqa: E402
+from backend.database.zones import load_zones  # noqa: E402
 
-    # Validate files exist
-    if not Path(data_path).exists():
-        raise FileNotFoundError(f"Data file not found: {data_path}")
-    if not Path(schema_path).exists():
-        raise FileNotFoundError(f"Schema file not found: {schema_path}")
+REQUIRED_COLUMNS = ['id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'pickup_date', 'pickup_month',
+    'pickup_hour', 'pickup_day_of_week', 'pickup_day_name', 'is_pickup_weekend', 'is_pickup_peak_hour',
+    'time_of_day', 'pickup_longitude', 'pickup_latitude', 'dropoff_longitude', 'dropoff_latitude', 'pickup_zone',
+    'dropoff_zone', 'passenger_count', 'store_and_fwd_flag', 'trip_distance_km', 'trip_duration_seconds',
+    'trip_duration_minutes', 'trip_speed_kmh', 'fare_per_km', 'idle_time_ratio', 'estimated_fare']
 
-    # Connect to database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('PRAGMA foreign_keys = ON')
-    cursor.execute('PRAGMA journal_mode = WAL')
+# Cleaned columns the trips table is encoded from; pickup_date, pickup_day_name, time_of_day and
+# trip_duration_minutes are recomputed from the others when read
+SOURCE_COLUMNS = [col for col in REQUIRED_COLUMNS
+                  if col not in ('pickup_date', 'pickup_day_name', 'time_of_day', 'trip_duration_minutes')]
 
-    # Performance optimizations for faster queries
-    cursor.execute('PRAGMA cache_size = -64000')
-    cursor.execute('PRAGMA temp_store = MEMORY')
+# Columns of the trips table, in schema order
+TRIP_COLUMNS = ['trip_id', 'vendor_id', 'pickup_at', 'dropoff_at', 'pickup_month', 'pickup_hour',
+    'pickup_day_of_week', 'is_pickup_weekend', 'is_pickup_peak_hour', 'pickup_longitude', 'pickup_latitude',
+    'dropoff_longitude', 'dropoff_latitude', 'pickup_zone_id', 'dropoff_zone_id', 'passenger_count',
+    'is_store_and_fwd', 'trip_distance_km', 'trip_duration_seconds', 'trip_speed_kmh', 'fare_per_km',
+    'idle_time_ratio', 'estimated_fare']
 
-    # Apply the schema
-    print(f"\nLoading schema from {schema_path}")
+SECONDS_PER_DAY = 86400
+
+# Rows per executemany() transaction during the bulk load
+BULK_BATCH_ROWS = 500000
+
+# Load-time settings: the database is rebuilt from scratch, so durability is traded for speed
+LOAD_PRAGMAS = ['PRAGMA synchronous = OFF', 'PRAGMA locking_mode = EXCLUSIVE', 'PRAGMA cache_size = -512000',
+                'PRAGMA foreign_keys = OFF']
+# The same for the build steps after the load, minus the exclusive lock so several can share the database
+BUILD_PRAGMAS = ['PRAGMA synchronous = OFF', 'PRAGMA cache_size = -512000', 'PRAGMA foreign_keys = OFF']
+
+# Seconds a build connection waits for another one to finish writing
+BUILD_LOCK_TIMEOUT = 3600
+
+# R*Tree tables of schema.sql -> the trip point each one indexes
+SPATIAL_INDEXES = {'trip_pickup_points': 'pickup', 'trip_dropoff_points': 'dropoff'}
+
+CREATE_INDEX_PATTERN = re.compile(r'^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\b[^;]*;', re.IGNORECASE | re.MULTILINE)
+INDEX_NAME_PATTERN = re.compile(r'INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+INDEX_TABLE_PATTERN = re.compile(r'\bON\s+(\w+)', re.IGNORECASE)
+
+
+def available_columns(data_path):
+    """ Column names of a cleaned trips file, without reading its rows """
+    if Path(data_path).suffix == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.read_schema(data_path).names
+    return pd.read_csv(data_path, nrows=0).columns.tolist()
+
+
+def read_trips(data_path, columns):
+    """ Read the given columns of a cleaned trips file (.csv or .parquet) """
+    if Path(data_path).suffix != '.parquet':
+        return pd.read_csv(data_path, usecols=columns)[columns]
+
+    import pyarrow.parquet as pq
+    return pq.read_table(data_path, columns=columns).to_pandas()
+
+
+def epoch_seconds(values):
+    """ Seconds since 1970-01-01 of datetimes or of '%Y-%m-%d %H:%M:%S' strings """
+    if not pd.api.types.is_datetime64_dtype(values):
+        values = pd.to_datetime(values, format='%Y-%m-%d %H:%M:%S')
+    return (values - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+
+def zone_ids(conn):
+    """ zone_code -> zone_id of location_zones """
+    return dict(conn.execute("SELECT zone_code, zone_id FROM location_zones"))
+
+
+def encode_trips(df, zones):
+    """ Cleaned trips (SOURCE_COLUMNS, id or trip_id) as the compact columns of the trips table
+
+    zones maps zone codes to their zone_id (see zone_ids).
+    """
+    encoded = pd.DataFrame({
+        'trip_id': df['trip_id' if 'trip_id' in df else 'id'],
+        'vendor_id': df['vendor_id'],
+        'pickup_at': epoch_seconds(df['pickup_datetime']),
+        'dropoff_at': epoch_seconds(df['dropoff_datetime']),
+    })
+    for col in ['pickup_month', 'pickup_hour', 'pickup_day_of_week', 'is_pickup_weekend', 'is_pickup_peak_hour',
+                'pickup_longitude', 'pickup_latitude', 'dropoff_longitude', 'dropoff_latitude']:
+        encoded[col] = df[col]
+    # Trips outside every zone keep a NULL zone
+    encoded['pickup_zone_id'] = df['pickup_zone'].map(zones).astype('Int64')
+    encoded['dropoff_zone_id'] = df['dropoff_zone'].map(zones).astype('Int64')
+    encoded['passenger_count'] = df['passenger_count']
+    encoded['is_store_and_fwd'] = (df['store_and_fwd_flag'] == 'Y').astype('int8')
+    encoded['trip_distance_km'] = df['trip_distance_km']
+    encoded['trip_duration_seconds'] = df['trip_duration_seconds'].astype('int64')
+    for col in ['trip_speed_kmh', 'fare_per_km', 'idle_time_ratio', 'estimated_fare']:
+        encoded[col] = df[col]
+    return encoded[TRIP_COLUMNS]
+
+
+def insert_zones(conn, zones):
+    """ Load the zones (in precedence order) into location_zones """
+    conn.executemany("""
+        INSERT INTO location_zones (zone_code, min_latitude, max_latitude, min_longitude, max_longitude)
+        VALUES (?, ?, ?, ?, ?)
+        """, [(zone.code, zone.min_latitude, zone.max_latitude, zone.min_longitude, zone.max_longitude)
+              for zone in zones])
+
+
+def split_schema(schema_sql):
+    """ Split schema.sql into the table statements and the CREATE INDEX statements run after the load """
+    index_statements = [statement.strip() for statement in CREATE_INDEX_PATTERN.findall(schema_sql)]
+    return CREATE_INDEX_PATTERN.sub('', schema_sql), index_statements
+
+
+def file_fingerprint(path):
+    """ SHA-256 of a file's contents, read in 1MB blocks """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def record_ingested_file(conn, path, trip_count, fingerprint=None):
+    """ Add or refresh a raw file in the ingestion manifest """
+    conn.execute("""
+        INSERT INTO ingested_files (file_name, fingerprint, trip_count, ingested_at)
+        VALUES (?, ?, ?, datetime('now'))
+        ON CONFLICT (file_name) DO UPDATE SET fingerprint = excluded.fingerprint, trip_count = excluded.trip_count,
+                                              ingested_at = excluded.ingested_at
+        """, (Path(path).name, fingerprint or file_fingerprint(path), trip_count))
+
+
+def rate(rows, seconds):
+    """ Rows per second, for the phase reports """
+    return f"{rows / seconds:,.0f} rows/s" if seconds > 0 else "n/a"
+
+
+def insert_trips(conn, df, batch_size=BULK_BATCH_ROWS, table='trips'):
+    """ Bulk insert trips with executemany, one transaction per batch """
+    columns = df.columns.tolist()
+    insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    for start in range(0, len(df), batch_size):
+        batch = df.iloc[start:start + batch_size]
+        # Plain Python values bind faster than numpy scalars; missing values must bind as NULL
+        values = [batch[col].astype(object).where(batch[col].notna(), None).tolist() if batch[col].hasnans
+                  else batch[col].tolist() for col in columns]
+        with conn:
+            conn.executemany(insert_sql, zip(*values))
+        print(f"Inserted {min(start + batch_size, len(df)):,} / {len(df):,} trips", end='\r')
+    print()
+
+
+def build_indexes(conn, index_statements, rows):
+    """ Create the deferred indexes one by one, reporting the build rate of each
+
+    rows is the trip count; the rate of an index on another table is over that table's rows.
+    Returns the rows indexed across all the indexes.
+    """
+    table_rows = {'trips': rows}
+    indexed = 0
+    for statement in index_statements:
+        name = INDEX_NAME_PATTERN.search(statement).group(1)
+        table = INDEX_TABLE_PATTERN.search(statement).group(1)
+        if table not in table_rows:
+            table_rows[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        started = time.perf_counter()
+        conn.execute(statement)
+        elapsed = time.perf_counter() - started
+        print(f"  {name}: {elapsed:.2f}s ({rate(table_rows[table], elapsed)})")
+        indexed += table_rows[table]
+    conn.commit()
+    return indexed
+
+
+def refresh_rollups(conn, days=None):
+    """ Rebuild the rollup tables from trips, for every day or only the given days (epoch seconds of midnight)
+
+    The caller commits, so an ingest can update trips and rollups in one transaction.
+    """
+    source, rollup_filter = 'trips', ''
+    if days is not None:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_days (day_start INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM rollup_days")
+        conn.executemany("INSERT INTO rollup_days VALUES (?)", ((day,) for day in days))
+        # Each day is a range of idx_trips_pickup_at
+        source = f"rollup_days JOIN trips ON pickup_at >= day_start AND pickup_at < day_start + {SECONDS_PER_DAY}"
+        rollup_filter = f"WHERE pickup_at - pickup_at % {SECONDS_PER_DAY} IN (SELECT day_start FROM rollup_days)"
+
+    conn.execute(f"DELETE FROM trip_rollups {rollup_filter}")
+    conn.execute(f"""
+        INSERT INTO trip_rollups
+        SELECT pickup_at - pickup_at % 3600 AS pickup_hour_at, pickup_month, pickup_hour, pickup_zone_id, vendor_id,
+               COUNT(*), SUM(trip_distance_km), SUM(trip_duration_seconds), SUM(estimated_fare), SUM(passenger_count)
+        FROM {source}
+        GROUP BY pickup_hour_at, pickup_month, pickup_hour, pickup_zone_id, vendor_id
+        """)
+
+    conn.execute(f"DELETE FROM trip_passenger_rollups {rollup_filter}")
+    conn.execute(f"""
+        INSERT INTO trip_passenger_rollups
+        SELECT pickup_at - pickup_at % 3600 AS pickup_hour_at, pickup_month, pickup_hour, pickup_zone_id, vendor_id,
+               passenger_count, COUNT(*)
+        FROM {source}
+        GROUP BY pickup_hour_at, pickup_month, pickup_hour, pickup_zone_id, vendor_id, passenger_count
+        """)
+
+
+def refresh_spatial_index(conn, rowids_sql=None):
+    """ Index the pickup and dropoff points of every trip, or of the trips whose rowids rowids_sql selects
+
+    The caller commits, like refresh_rollups.
+    """
+    for table, point in SPATIAL_INDEXES.items():
+        if rowids_sql is None:
+            conn.execute(f"DELETE FROM {table}")
+            trip_filter = ''
+        else:
+            conn.execute(f"DELETE FROM {table} WHERE id IN ({rowids_sql})")
+            trip_filter = f"WHERE rowid IN ({rowids_sql})"
+        conn.execute(f"""
+            INSERT INTO {table}
+            SELECT rowid, {point}_longitude, {point}_longitude, {point}_latitude, {point}_latitude
+            FROM trips {trip_filter}
+            """)
+
+
+def connect_for_build(db_path, load=False):
+    """ Connection for building the database: WAL, in-memory temp tables and no syncs
+
+    load=True adds LOAD_PRAGMAS for the bulk load, which holds the database exclusively. Otherwise the
+    connection waits up to BUILD_LOCK_TIMEOUT seconds for other writers, so build steps on separate
+    connections (see scripts/pipeline.py) take turns writing while they read concurrently.
+    """
+    conn = sqlite3.connect(db_path, timeout=BUILD_LOCK_TIMEOUT)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    for pragma in LOAD_PRAGMAS if load else BUILD_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def read_schema(schema_path):
+    """ The table statements and the CREATE INDEX statements of schema.sql """
+    if not Path(schema_path).exists():
+        raise FileNotFoundError(f"Schema file not found: {schema_path}")
     with open(schema_path, 'r') as f:
-        cursor.executescript(f.read())
-    cursor.close()
+        return split_schema(f.read())
+
+
+def apply_schema(conn, table_sql):
+    """ (Re)create the tables and load the zones """
+    conn.executescript(table_sql)
+    insert_zones(conn, load_zones())
     conn.commit()
-    print("Schema applied")
 
-    # Load the data
-    print(f"\nLoading trip data from {data_path}")
-    df = pd.read_csv(data_path)
-    print(f"Loaded {len(df):,} rows")
 
-    # Validate required columns
-    required_columns = ['id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'pickup_date', 'pickup_month',
-        'pickup_hour', 'pickup_day_of_week', 'pickup_day_name', 'is_pickup_weekend', 'is_pickup_peak_hour',
-        'time_of_day', 'pickup_longitude', 'pickup_latitude', 'dropoff_longitude', 'dropoff_latitude', 'pickup_zone',
-        'dropoff_zone', 'passenger_count', 'store_and_fwd_flag', 'trip_distance_km', 'trip_duration_seconds',
-        'trip_duration_minutes', 'trip_speed_kmh', 'fare_per_km', 'idle_time_ratio', 'estimated_fare']
+def load_trips(conn, data_path):
+    """ Insert the cleaned trips into the empty trips table and check their foreign keys; returns the trip count """
+    if not Path(data_path).exists():
+        raise FileNotFoundError(f"Data file not found: {data_path}")
 
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    # Validate required columns
+    missing_columns = [col for col in SOURCE_COLUMNS if col not in available_columns(data_path)]
     if missing_columns:
         raise ValueError(f"Missing required columns in {data_path}: {missing_columns}\n\n"
                          f"Please run data cleaning first")
 
-    # Rename id to trip_id for database key identification
-    df = df.rename(columns={'id': 'trip_id'})
-    required_columns[0] = 'trip_id'
+    # Load only the columns the trips table is encoded from
+    print(f"\nLoading trip data from {data_path}")
+    df = encode_trips(read_trips(data_path, SOURCE_COLUMNS), zone_ids(conn))
+    print(f"Loaded {len(df):,} rows")
 
-    # Insert into database in batches of 150,000 rows
+    # Insert into the bare table, then check the foreign keys once instead of per row
     print(f"\nInserting {len(df):,} trips into database")
-    batch_size = 150000
-    for i in range(0, len(df), batch_size):
-        batch = df[required_columns].iloc[i:i + batch_size]
-        batch.to_sql('trips', conn, if_exists='append', index=False)
-        print(f"Inserted {min(i + batch_size, len(df)):,} / {len(df):,} trips", end='\r')
+    started = time.perf_counter()
+    insert_trips(conn, df)
+    elapsed = time.perf_counter() - started
+    print(f"All trips inserted successfully in {elapsed:.2f}s ({rate(len(df), elapsed)})")
+
+    violations = conn.execute('PRAGMA foreign_key_check(trips)').fetchall()
+    if violations:
+        raise sqlite3.IntegrityError(f"{len(violations):,} trips violate foreign key constraints")
+    return len(df)
+
+
+def drop_indexes(conn):
+    """ Drop every index created by schema.sql, before building them again """
+    names = [name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+    for name in names:
+        conn.execute(f"DROP INDEX {name}")
+    conn.commit()
 
-    print(f"\nAll trips inserted successfully")
 
+def analyze(conn):
+    """ Gather the planner statistics, then fold the write-ahead log back into the database file """
+    conn.execute('ANALYZE')
     conn.commit()
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def record_raw_files(conn, raw_paths, trip_count):
+    """ Record the raw files the cleaned data came from in the ingestion manifest """
+    for raw_path in raw_paths:
+        if Path(raw_path).exists():
+            record_ingested_file(conn, raw_path, trip_count)
+    conn.commit()
+
+
+def run_phase(conn, description, rows, build, *args):
+    """ Run one build step on conn, commit it and report its time and rate """
+    started = time.perf_counter()
+    build(conn, *args)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    print(f"{description} in {elapsed:.2f}s ({rate(rows, elapsed)})")
+
+
+def create_database(db_path='backend/database/nyc_taxi.db', data_path='data/processed/clean_trips.csv',
+                    schema_path='backend/database/schema.sql', raw_paths=()):
+    """ Initialize the database schema and load data
+
+    raw_paths are the raw files the cleaned data came from; they are recorded
+    in the ingestion manifest so scripts/ingest.py does not load them again.
+    """
+
+    # Validate files exist
+    if not Path(data_path).exists():
+        raise FileNotFoundError(f"Data file not found: {data_path}")
+    table_sql, index_statements = read_schema(schema_path)
+
+    conn = connect_for_build(db_path, load=True)
+
+    # Apply the schema; its indexes are built once the data is in
+    print(f"\nLoading schema from {schema_path}")
+    apply_schema(conn, table_sql)
+    print("Schema applied")
+
+    try:
+        rows = load_trips(conn, data_path)
+    except sqlite3.IntegrityError:
+        conn.close()
+        raise
+
+    print(f"\nBuilding {len(index_statements)} indexes")
+    started = time.perf_counter()
+    indexed = build_indexes(conn, index_statements, rows)
+    elapsed = time.perf_counter() - started
+    print(f"Indexes built in {elapsed:.2f}s ({rate(indexed, elapsed)} across all indexes)")
+
+    run_phase(conn, "Rollups built", rows, refresh_rollups)
+    run_phase(conn, "Spatial indexes built", rows, refresh_spatial_index)
+    run_phase(conn, "Heatmap cells built", rows, refresh_heatmap)
+    run_phase(conn, "Statistics analyzed", rows, analyze)
+    record_raw_files(conn, raw_paths, rows)
+
+    # After the manifest, which is part of the signature the columns are matched on
+    run_phase(conn, "Trip columns exported", rows, export_columns, columns_dir(db_path))
+
     conn.close()
     print(f"Database created")
 
 
 if __name__ == "__main__":
-    create_database()
+    parser = argparse.ArgumentParser(description="Create the SQLite database from the cleaned trips")
+    parser.add_argument('--data', default='data/processed/clean_trips.csv',
+                        help="cleaned trips file, .csv or .parquet")
+    parser.add_argument('--raw', nargs='*', default=['data/raw/train.csv'],
+                        help="raw files the cleaned data came from, recorded as already ingested")
+    args = parser.parse_args()
+    create_database(data_path=args.data, raw_paths=args.raw)
@@ -0,0 +1,163 @@
+""" Trip counts on a multi-resolution grid, for the density map
+
+Cells are Web Mercator tiles (the quadkey grid of slippy maps): at level L the world is 2^L x 2^L cells,
+and every cell splits into four at level L + 1. Each heatmap table holds, for every level in
+HEATMAP_LEVELS, the trips whose pickup (or dropoff) lies in a cell, split by pickup hour and vendor.
+A viewport at one level therefore reads a bounded number of cells, whatever the number of trips.
+
+The counts are additive, so ingesting trips adds theirs and replacing trips subtracts the old ones.
+"""
+
+import numpy as np
+
+# Heatmap tables of schema.sql -> the trip point each one counts
+HEATMAP_TABLES = {'pickup_heatmap_cells': 'pickup', 'dropoff_heatmap_cells': 'dropoff'}
+
+# Grid levels held, coarsest first; at New York's latitude a level-17 cell is about 230 m wide
+HEATMAP_LEVELS = range(9, 18)
+
+# Bits of the packed cell keys taken by the pickup hour and the vendor id
+HOUR_BITS = 5
+VENDOR_BITS = 8
+
+# Trips read from SQLite per batch
+HEATMAP_BATCH_ROWS = 250000
+
+# Web Mercator is cut off at this latitude, where the projection reaches the edge of the square world
+MAX_LATITUDE = 85.05112878
+
+
+def cell_x(longitude, level):
+    """ Grid column of longitudes at a level """
+    return np.floor((np.asarray(longitude, dtype=float) + 180) / 360 * 2 ** level).astype(np.int64)
+
+
+def cell_y(latitude, level):
+    """ Grid row of latitudes at a level (row 0 is the north edge) """
+    latitude = np.radians(np.clip(np.asarray(latitude, dtype=float), -MAX_LATITUDE, MAX_LATITUDE))
+    return np.floor((1 - np.arcsinh(np.tan(latitude)) / np.pi) / 2 * 2 ** level).astype(np.int64)
+
+
+def cell_longitude(x, level):
+    """ Longitude of the west edge of grid column x """
+    return np.asarray(x) / 2 ** level * 360 - 180
+
+
+def cell_latitude(y, level):
+    """ Latitude of the north edge of grid row y """
+    return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y) / 2 ** level))))
+
+
+def cell_keys(longitude, latitude, hour, vendor):
+    """ Sorted distinct finest-level cell keys of the given points, and the trips in each
+
+    A key packs (x, y, hour, vendor) into one int64, which np.unique handles much faster than rows of
+    four columns.
+    """
+    finest = HEATMAP_LEVELS[-1]
+    keys = (((cell_x(longitude, finest) << finest | cell_y(latitude, finest)) << HOUR_BITS
+             | np.asarray(hour, dtype=np.int64)) << VENDOR_BITS | np.asarray(vendor, dtype=np.int64))
+    return np.unique(keys, return_counts=True)
+
+
+def merge_cell_keys(keys, trips, more_keys, more_trips):
+    """ Sum two sets of sorted distinct cell keys and their trips """
+    keys, trips = np.concatenate([keys, more_keys]), np.concatenate([trips, more_trips])
+    if not len(keys):
+        return keys, trips
+    # Two sorted runs: the stable sort (timsort) merges them in linear time
+    order = np.argsort(keys, kind='stable')
+    keys, trips = keys[order], trips[order]
+    first = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[first], np.add.reduceat(trips, first)
+
+
+def level_counts(keys, trips):
+    """ {level: (x, y, hour, vendor, trips) arrays} of finest-level cell keys (see cell_keys)
+
+    Every coarser level is the sum of its children.
+    """
+    counts = {}
+    for level in reversed(HEATMAP_LEVELS):
+        attributes = keys & ((1 << HOUR_BITS + VENDOR_BITS) - 1)
+        y = keys >> HOUR_BITS + VENDOR_BITS & ((1 << level) - 1)
+        x = keys >> HOUR_BITS + VENDOR_BITS + level
+        counts[level] = (x, y, attributes >> VENDOR_BITS, attributes & ((1 << VENDOR_BITS) - 1), trips)
+        # The parent cells, one level coarser
+        keys, inverse = np.unique(((x >> 1) << level - 1 | y >> 1) << HOUR_BITS + VENDOR_BITS | attributes,
+                                  return_inverse=True)
+        trips = np.bincount(inverse, weights=trips).astype(np.int64)
+    return counts
+
+
+def cell_counts(longitude, latitude, hour, vendor):
+    """ {level: (x, y, hour, vendor, trips) arrays} of the distinct cells of the given points
+
+    The points are counted once at the finest level; every coarser level is the sum of its children.
+    """
+    return level_counts(*cell_keys(longitude, latitude, hour, vendor))
+
+
+def heatmap_rows(conn, rowids_sql=None, sign=1):
+    """ {heatmap table: (level, x, y, hour, vendor, trips) rows} of the trips whose rowids rowids_sql selects
+
+    Default: every trip. With sign=-1 the trip counts are negative, to subtract the trips.
+    The trips are read in batches, each reduced to its cell counts and merged into the running
+    counts, so memory follows the number of distinct cells rather than the number of trips.
+    """
+    trip_filter = '' if rowids_sql is None else f"WHERE rowid IN ({rowids_sql})"
+    cells = {table: (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)) for table in HEATMAP_TABLES}
+    cursor = conn.execute(f"""
+        SELECT pickup_longitude, pickup_latitude, dropoff_longitude, dropoff_latitude, pickup_hour, vendor_id
+        FROM trips {trip_filter}
+        """)
+    while True:
+        batch = cursor.fetchmany(HEATMAP_BATCH_ROWS)
+        if not batch:
+            break
+        values = np.array(batch, dtype=float)
+        for table, point in HEATMAP_TABLES.items():
+            longitude, latitude = (values[:, 0], values[:, 1]) if point == 'pickup' else (values[:, 2], values[:, 3])
+            cells[table] = merge_cell_keys(*cells[table], *cell_keys(longitude, latitude, values[:, 4], values[:, 5]))
+        del batch, values
+
+    rows = {}
+    for table, (keys, trips) in cells.items():
+        rows[table] = []
+        for level, (x, y, cell_hour, cell_vendor, level_trips) in level_counts(keys, trips).items():
+            rows[table] += zip([level] * len(x), x.tolist(), y.tolist(), cell_hour.tolist(), cell_vendor.tolist(),
+                               (level_trips * sign).tolist())
+    return rows
+
+
+def write_heatmap_rows(conn, rows, prune=False):
+    """ Add heatmap_rows() to the cell counts; prune=True removes the cells left empty """
+    for table, table_rows in rows.items():
+        conn.executemany(f"""
+            INSERT INTO {table} (level, cell_x, cell_y, pickup_hour, vendor_id, trip_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO UPDATE SET trip_count = trip_count + excluded.trip_count
+            """, table_rows)
+        if prune:
+            conn.execute(f"DELETE FROM {table} WHERE trip_count <= 0")
+
+
+def add_heatmap_trips(conn, rowids_sql=None, sign=1):
+    """ Add the trips whose rowids rowids_sql selects (default: every trip) to the heatmap tables
+
+    With sign=-1 the trips are subtracted instead, and cells left empty are removed. The caller
+    commits, like refresh_spatial_index.
+    """
+    write_heatmap_rows(conn, heatmap_rows(conn, rowids_sql, sign), prune=sign < 0)
+
+
+def refresh_heatmap(conn):
+    """ Rebuild the heatmap tables from every trip; the caller commits
+
+    The trips are all read before the first write, so on its own connection the rebuild only holds
+    the database's write lock for the short insert.
+    """
+    rows = heatmap_rows(conn)
+    for table in HEATMAP_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    write_heatmap_rows(conn, rows)
@@ -0,0 +1,129 @@
+""" Pool of read-only SQLite connections for the API """
+
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Serving-side settings; the load-time pragmas in db.py do not carry over to new connections
+MMAP_SIZE = 1024 * 1024 * 1024
+CACHE_SIZE_KB = 64000
+CACHED_STATEMENTS = 256
+
+# Virtual machine instructions between deadline checks, a fraction of a millisecond of work
+PROGRESS_OPCODES = 10000
+
+
+class PoolTimeout(RuntimeError):
+    """ Raised when no connection frees up within the acquire timeout """
+
+
+class LimitedCursor(sqlite3.Cursor):
+    """ Cursor whose execute and fetch calls each get query_timeout seconds before SQLite interrupts them """
+
+    def _start(self):
+        timeout = self.connection.query_timeout
+        self.connection.deadline = time.monotonic() + timeout if timeout else None
+
+    def execute(self, sql, parameters=()):
+        self._start()
+        return super().execute(sql, parameters)
+
+    def fetchone(self):
+        self._start()
+        return super().fetchone()
+
+    def fetchmany(self, size=None):
+        self._start()
+        return super().fetchmany(self.arraysize if size is None else size)
+
+    def fetchall(self):
+        self._start()
+        return super().fetchall()
+
+    def __next__(self):
+        self._start()
+        return super().__next__()
+
+
+class LimitedConnection(sqlite3.Connection):
+    """ Connection that aborts a runaway statement (sqlite3.OperationalError: interrupted) once its deadline passes
+
+    A progress handler checks the deadline every PROGRESS_OPCODES instructions, so a scan is stopped
+    inside SQLite instead of holding a worker thread and a pooled connection until it finishes.
+    """
+
+    query_timeout = None
+    deadline = None
+
+    def _past_deadline(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def cursor(self, factory=LimitedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+
+class ConnectionPool:
+    """ Bounded pool of read-only connections, reused across requests and threads
+
+    Connections are opened lazily up to `size`, as instances of `factory` (a LimitedConnection subclass);
+    callers beyond that wait for one to be released. With a query_timeout, each execute or fetch that
+    runs longer than that many seconds is interrupted.
+    The most recently released connection is handed out first, so its page cache stays warm.
+    """
+
+    def __init__(self, db_path, size=8, factory=LimitedConnection, query_timeout=None):
+        self.db_path = Path(db_path).resolve()
+        self.size = size
+        self.factory = factory
+        self.query_timeout = query_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(f"{self.db_path.as_uri()}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=CACHED_STATEMENTS, factory=self.factory)
+        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA query_only = ON')
+        if self.query_timeout:
+            conn.query_timeout = self.query_timeout
+            conn.set_progress_handler(conn._past_deadline, PROGRESS_OPCODES)
+        return conn
+
+    def acquire(self, timeout=None):
+        """ Check out a connection, opening one if the pool is not yet full """
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(f"No database connection available after {timeout}s")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def release(self, conn):
+        """ Return a connection to the pool (or close it, if the pool has been closed) """
+        if self.closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    def close(self):
+        """ Close the idle connections; connections still checked out are closed when released """
+        self.closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
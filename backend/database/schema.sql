@@ -1,7 +1,16 @@
 -- Drop existing tables
+DROP TABLE IF EXISTS dropoff_heatmap_cells;
+DROP TABLE IF EXISTS pickup_heatmap_cells;
+DROP TABLE IF EXISTS trip_dropoff_points;
+DROP TABLE IF EXISTS trip_pickup_points;
+DROP TABLE IF EXISTS trip_passenger_rollups;
+DROP TABLE IF EXISTS trip_rollups;
 DROP TABLE IF EXISTS trips;
 DROP TABLE IF EXISTS location_zones;
+DROP TABLE IF EXISTS times_of_day;
+DROP TABLE IF EXISTS day_names;
 DROP TABLE IF EXISTS vendors;
+DROP TABLE IF EXISTS ingested_files;
 
 -- Create vendors table
 CREATE TABLE vendors
@@ -15,7 +24,7 @@ INSERT INTO vendors
 VALUES (1, 'Uber'),
        (2, 'Taxicab');
 
--- Location zones for geographic filtering
+-- Location zones for geographic filtering, loaded from zones.geojson by create_database (bounding boxes of the zones)
 CREATE TABLE location_zones
 (
     zone_id       INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -26,40 +35,70 @@ CREATE TABLE location_zones
     max_longitude REAL NOT NULL
 );
 
-INSERT INTO location_zones (zone_code, min_latitude, max_latitude, min_longitude, max_longitude)
-VALUES ('midtown', 40.750, 40.765, -73.995, -73.970),
-       ('downtown', 40.700, 40.745, -74.020, -73.975),
-       ('uptown', 40.765, 40.810, -73.980, -73.940),
-       ('brooklyn', 40.600, 40.740, -74.050, -73.850),
-       ('queens', 40.690, 40.800, -73.950, -73.700),
-       ('bronx', 40.800, 40.920, -73.930, -73.750);
+-- Raw files already loaded, so incremental ingestion can skip them
+CREATE TABLE ingested_files
+(
+    file_name   TEXT PRIMARY KEY,
+    fingerprint TEXT    NOT NULL,
+    trip_count  INTEGER NOT NULL,
+    ingested_at TEXT    NOT NULL
+);
+
+-- Weekday names, by pickup_day_of_week (0 = Monday)
+CREATE TABLE day_names
+(
+    day_of_week INTEGER PRIMARY KEY,
+    day_name    TEXT NOT NULL
+);
+
+INSERT INTO day_names
+VALUES (0, 'Monday'),
+       (1, 'Tuesday'),
+       (2, 'Wednesday'),
+       (3, 'Thursday'),
+       (4, 'Friday'),
+       (5, 'Saturday'),
+       (6, 'Sunday');
+
+-- Time of day category of every pickup hour
+CREATE TABLE times_of_day
+(
+    hour        INTEGER PRIMARY KEY,
+    time_of_day TEXT NOT NULL
+);
+
+INSERT INTO times_of_day
+VALUES (0, 'Night'), (1, 'Night'), (2, 'Night'), (3, 'Night'), (4, 'Night'), (5, 'Night'),
+       (6, 'Morning'), (7, 'Morning'), (8, 'Morning'), (9, 'Morning'), (10, 'Morning'), (11, 'Morning'),
+       (12, 'Afternoon'), (13, 'Afternoon'), (14, 'Afternoon'), (15, 'Afternoon'), (16, 'Afternoon'),
+       (17, 'Evening'), (18, 'Evening'), (19, 'Evening'), (20, 'Evening'),
+       (21, 'Night'), (22, 'Night'), (23, 'Night');
 
 -- Create trips table
+-- Times are seconds since 1970-01-01 (in the data's local time) and zones, weekday names and times of day are
+-- integer codes; the API decodes them back to the text columns of the cleaned data (pickup_datetime, pickup_date,
+-- pickup_zone, store_and_fwd_flag, trip_duration_minutes, ...)
 CREATE TABLE trips
 (
     trip_id               TEXT PRIMARY KEY,
     vendor_id             INTEGER NOT NULL,
-    pickup_datetime       TEXT    NOT NULL,
-    dropoff_datetime      TEXT    NOT NULL,
-    pickup_date           TEXT    NOT NULL,
+    pickup_at             INTEGER NOT NULL,
+    dropoff_at            INTEGER NOT NULL,
     pickup_month          INTEGER NOT NULL,
     pickup_hour           INTEGER NOT NULL,
     pickup_day_of_week    INTEGER NOT NULL,
-    pickup_day_name       TEXT    NOT NULL,
     is_pickup_weekend     INTEGER NOT NULL CHECK (is_pickup_weekend IN (0, 1)),
     is_pickup_peak_hour   INTEGER NOT NULL CHECK (is_pickup_peak_hour IN (0, 1)),
-    time_of_day           TEXT    NOT NULL,
     pickup_longitude      REAL    NOT NULL,
     pickup_latitude       REAL    NOT NULL,
     dropoff_longitude     REAL    NOT NULL,
     dropoff_latitude      REAL    NOT NULL,
-    pickup_zone           TEXT,
-    dropoff_zone          TEXT,
+    pickup_zone_id        INTEGER,
+    dropoff_zone_id       INTEGER,
     passenger_count       INTEGER NOT NULL CHECK (passenger_count > 0 AND passenger_count <= 9),
-    store_and_fwd_flag    TEXT    NOT NULL CHECK (store_and_fwd_flag IN ('Y', 'N')),
+    is_store_and_fwd      INTEGER NOT NULL CHECK (is_store_and_fwd IN (0, 1)),
     trip_distance_km      REAL    NOT NULL CHECK (trip_distance_km >= 0),
     trip_duration_seconds INTEGER NOT NULL CHECK (trip_duration_seconds > 0),
-    trip_duration_minutes REAL    NOT NULL,
     -- Derived features
     trip_speed_kmh        REAL CHECK (trip_speed_kmh >= 0),
     fare_per_km           REAL CHECK (fare_per_km >= 0),
@@ -67,32 +106,91 @@ CREATE TABLE trips
     estimated_fare        REAL CHECK (estimated_fare >= 0),
 
     FOREIGN KEY (vendor_id) REFERENCES vendors (vendor_id),
-    FOREIGN KEY (pickup_zone) REFERENCES location_zones (zone_code),
-    FOREIGN KEY (dropoff_zone) REFERENCES location_zones (zone_code)
+    FOREIGN KEY (pickup_day_of_week) REFERENCES day_names (day_of_week),
+    FOREIGN KEY (pickup_hour) REFERENCES times_of_day (hour),
+    FOREIGN KEY (pickup_zone_id) REFERENCES location_zones (zone_id),
+    FOREIGN KEY (dropoff_zone_id) REFERENCES location_zones (zone_id)
 );
 
 -- Create indexes
+-- idx_trips_pickup_at serves both pickup time ordering and date ranges (a date, or a date and hour, is a range of it)
 CREATE INDEX idx_trips_vendor ON trips (vendor_id);
-CREATE INDEX idx_trips_pickup_datetime ON trips (pickup_datetime);
-CREATE INDEX idx_trips_pickup_date ON trips (pickup_date);
+CREATE INDEX idx_trips_pickup_at ON trips (pickup_at);
 CREATE INDEX idx_trips_pickup_month ON trips (pickup_month);
 CREATE INDEX idx_trips_pickup_hour ON trips (pickup_hour);
 CREATE INDEX idx_trips_day_of_week ON trips (pickup_day_of_week);
 CREATE INDEX idx_trips_weekend ON trips (is_pickup_weekend);
 CREATE INDEX idx_trips_peak_hour ON trips (is_pickup_peak_hour);
-CREATE INDEX idx_trips_time_of_day ON trips (time_of_day);
 CREATE INDEX idx_trips_pickup_coords ON trips (pickup_latitude, pickup_longitude);
 CREATE INDEX idx_trips_dropoff_coords ON trips (dropoff_latitude, dropoff_longitude);
-CREATE INDEX idx_trips_pickup_zone ON trips (pickup_zone);
-CREATE INDEX idx_trips_dropoff_zone ON trips (dropoff_zone);
+CREATE INDEX idx_trips_pickup_zone ON trips (pickup_zone_id);
+CREATE INDEX idx_trips_dropoff_zone ON trips (dropoff_zone_id);
 CREATE INDEX idx_trips_passenger_count ON trips (passenger_count);
 CREATE INDEX idx_trips_distance ON trips (trip_distance_km);
 CREATE INDEX idx_trips_duration ON trips (trip_duration_seconds);
-CREATE INDEX idx_trips_duration_minutes ON trips (trip_duration_minutes);
 CREATE INDEX idx_trips_speed ON trips (trip_speed_kmh);
 CREATE INDEX idx_trips_fare_per_km ON trips (fare_per_km);
 CREATE INDEX idx_trips_estimated_fare ON trips (estimated_fare);
-CREATE INDEX idx_trips_date_hour ON trips (pickup_date, pickup_hour);
-CREATE INDEX idx_trips_zone_month ON trips (pickup_zone, pickup_month);
-CREATE INDEX idx_trips_vendor_date ON trips (vendor_id, pickup_date);
+CREATE INDEX idx_trips_zone_month ON trips (pickup_zone_id, pickup_month);
+CREATE INDEX idx_trips_zone_pickup_at ON trips (pickup_zone_id, pickup_at);
+CREATE INDEX idx_trips_vendor_pickup_at ON trips (vendor_id, pickup_at);
+
+-- Rollups for the dashboard statistics, one row per pickup hour (pickup_at: start of the hour) x zone x vendor
+-- Kept in step with trips by create_database and scripts/ingest.py
+CREATE TABLE trip_rollups
+(
+    pickup_at              INTEGER NOT NULL,
+    pickup_month           INTEGER NOT NULL,
+    pickup_hour            INTEGER NOT NULL,
+    pickup_zone_id         INTEGER,
+    vendor_id              INTEGER NOT NULL,
+    trip_count             INTEGER NOT NULL,
+    total_distance_km      REAL    NOT NULL,
+    total_duration_seconds REAL    NOT NULL,
+    total_fare             REAL    NOT NULL,
+    total_passengers       INTEGER NOT NULL
+);
+
+-- Passenger count histogram at the same grain
+CREATE TABLE trip_passenger_rollups
+(
+    pickup_at       INTEGER NOT NULL,
+    pickup_month    INTEGER NOT NULL,
+    pickup_hour     INTEGER NOT NULL,
+    pickup_zone_id  INTEGER,
+    vendor_id       INTEGER NOT NULL,
+    passenger_count INTEGER NOT NULL,
+    trip_count      INTEGER NOT NULL
+);
+
+-- R*Tree spatial indexes over the pickup and dropoff points, keyed by trips.rowid
+-- Bounds are stored as 32-bit floats (rounded outwards), so lookups are refined on the trips coordinates
+CREATE VIRTUAL TABLE trip_pickup_points USING rtree(id, min_longitude, max_longitude, min_latitude, max_latitude);
+CREATE VIRTUAL TABLE trip_dropoff_points USING rtree(id, min_longitude, max_longitude, min_latitude, max_latitude);
+
+-- Trip counts per Web Mercator grid cell at every level of backend/database/heatmap.py, by pickup hour and vendor
+-- Kept in step with trips by create_database and scripts/ingest.py
+CREATE TABLE pickup_heatmap_cells
+(
+    level       INTEGER NOT NULL,
+    cell_x      INTEGER NOT NULL,
+    cell_y      INTEGER NOT NULL,
+    pickup_hour INTEGER NOT NULL,
+    vendor_id   INTEGER NOT NULL,
+    trip_count  INTEGER NOT NULL,
+    PRIMARY KEY (level, cell_x, cell_y, pickup_hour, vendor_id)
+) WITHOUT ROWID;
+
+CREATE TABLE dropoff_heatmap_cells
+(
+    level       INTEGER NOT NULL,
+    cell_x      INTEGER NOT NULL,
+    cell_y      INTEGER NOT NULL,
+    pickup_hour INTEGER NOT NULL,
+    vendor_id   INTEGER NOT NULL,
+    trip_count  INTEGER NOT NULL,
+    PRIMARY KEY (level, cell_x, cell_y, pickup_hour, vendor_id)
+) WITHOUT ROWID;
 
+CREATE INDEX idx_trip_rollups_pickup_at ON trip_rollups (pickup_at);
+CREATE INDEX idx_trip_passenger_rollups_pickup_at ON trip_passenger_rollups (pickup_at);
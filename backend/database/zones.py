@@ -0,0 +1,164 @@
+""" Zone geometries and a grid index that assigns coordinates to zones
+
+zones.geojson is the single source of truth for the zones: data cleaning assigns trips to them and
+create_database loads them into location_zones. Each feature is a Polygon or MultiPolygon with a
+zone_code property; where zones overlap, the feature listed first wins.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+ZONES_PATH = Path(__file__).resolve().parent / 'zones.geojson'
+
+# Side of a grid cell in degrees, about 100 m north-south
+GRID_CELL_DEGREES = 0.001
+
+# Slack when deciding whether a zone edge touches a cell, larger than any rounding of a point into a neighbouring cell
+CELL_MARGIN = 1e-9
+
+
+class Zone:
+    """ One zone: its code and polygon rings as (n, 2) arrays of longitude, latitude """
+
+    def __init__(self, code, rings):
+        self.code = code
+        self.rings = [np.asarray(ring, dtype=float) for ring in rings]
+        points = np.concatenate(self.rings)
+        self.min_longitude, self.min_latitude = points.min(axis=0)
+        self.max_longitude, self.max_latitude = points.max(axis=0)
+        # An axis-aligned rectangle is matched on its bounds, borders included
+        corners = {tuple(point) for point in self.rings[0]}
+        self.is_rectangle = (len(self.rings) == 1 and len(corners) == 4 and corners == {
+            (x, y) for x in (self.min_longitude, self.max_longitude) for y in (self.min_latitude, self.max_latitude)})
+
+    def edges(self):
+        """ (x1, y1, x2, y2) of every ring edge """
+        for ring in self.rings:
+            yield from zip(ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1])
+
+    def contains(self, longitude, latitude):
+        """ Boolean mask of the points inside the zone (even-odd rule across all rings) """
+        if self.is_rectangle:
+            return ((longitude >= self.min_longitude) & (longitude <= self.max_longitude) &
+                    (latitude >= self.min_latitude) & (latitude <= self.max_latitude))
+        inside = np.zeros(len(longitude), dtype=bool)
+        for x1, y1, x2, y2 in self.edges():
+            if y1 == y2:
+                continue
+            crosses = (y1 > latitude) != (y2 > latitude)
+            inside ^= crosses & (longitude < x1 + (x2 - x1) * (latitude - y1) / (y2 - y1))
+        return inside
+
+
+def load_zones(path=ZONES_PATH):
+    """ Zones of a GeoJSON FeatureCollection, in precedence order """
+    with open(path) as f:
+        features = json.load(f)['features']
+    zones = []
+    for feature in features:
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            rings = geometry['coordinates']
+        elif geometry['type'] == 'MultiPolygon':
+            rings = [ring for polygon in geometry['coordinates'] for ring in polygon]
+        else:
+            raise ValueError(f"Unsupported zone geometry: {geometry['type']}")
+        zones.append(Zone(feature['properties']['zone_code'], rings))
+    return zones
+
+
+class ZoneIndex:
+    """ Uniform grid over the zones, for assigning zones to many points at once
+
+    Each cell records the zone that covers it entirely (if any) and, before that one in precedence
+    order, the zones whose border crosses it. A point costs one cell lookup, plus exact tests against
+    the few zones crossing its cell, so throughput does not depend on how many zones there are.
+    """
+
+    def __init__(self, zones, cell_degrees=GRID_CELL_DEGREES):
+        self.zones = zones
+        self.codes = np.array([zone.code for zone in zones] + [None], dtype=object)  # code -1 -> None
+        self.cell = cell_degrees
+        self.min_longitude = min(zone.min_longitude for zone in zones)
+        self.min_latitude = min(zone.min_latitude for zone in zones)
+        self.max_longitude = max(zone.max_longitude for zone in zones)
+        self.max_latitude = max(zone.max_latitude for zone in zones)
+        self.columns = max(1, int(np.ceil((self.max_longitude - self.min_longitude) / cell_degrees)))
+        self.rows = max(1, int(np.ceil((self.max_latitude - self.min_latitude) / cell_degrees)))
+
+        # Zone covering each cell (-1: none), and the border zones to test first in the open cells
+        self.cell_zone = np.full(self.rows * self.columns, -1, dtype=np.int32)
+        open_cells = np.ones(self.rows * self.columns, dtype=bool)
+        candidates = {}
+        for number, zone in enumerate(zones):
+            col0, row0 = self._cell_of(zone.min_longitude - CELL_MARGIN, zone.min_latitude - CELL_MARGIN)
+            col1, row1 = self._cell_of(zone.max_longitude + CELL_MARGIN, zone.max_latitude + CELL_MARGIN)
+            border = np.zeros((row1 - row0 + 1, col1 - col0 + 1), dtype=bool)
+            for x1, y1, x2, y2 in zone.edges():
+                ecol0, erow0 = self._cell_of(min(x1, x2) - CELL_MARGIN, min(y1, y2) - CELL_MARGIN)
+                ecol1, erow1 = self._cell_of(max(x1, x2) + CELL_MARGIN, max(y1, y2) + CELL_MARGIN)
+                border[erow0 - row0:erow1 - row0 + 1, ecol0 - col0:ecol1 - col0 + 1] = True
+
+            rows, cols = np.mgrid[row0:row1 + 1, col0:col1 + 1]
+            cells = rows * self.columns + cols
+            # A cell no edge touches is either wholly inside the zone or wholly outside; its centre tells which
+            centres_x = self.min_longitude + (cols + 0.5) * cell_degrees
+            centres_y = self.min_latitude + (rows + 0.5) * cell_degrees
+            inside = ~border & zone.contains(centres_x.ravel(), centres_y.ravel()).reshape(border.shape)
+
+            for cell in cells[border & open_cells[cells]]:
+                candidates.setdefault(int(cell), []).append(number)
+            covered = cells[inside & open_cells[cells]]
+            self.cell_zone[covered] = number
+            open_cells[covered] = False
+
+        # Pack the border candidates into a (cells with candidates x most candidates) table
+        self.cell_slot = np.full(self.rows * self.columns, -1, dtype=np.int32)
+        width = max((len(zone_numbers) for zone_numbers in candidates.values()), default=0)
+        self.candidates = np.full((len(candidates), width), -1, dtype=np.int32)
+        for slot, (cell, zone_numbers) in enumerate(candidates.items()):
+            self.cell_slot[cell] = slot
+            self.candidates[slot, :len(zone_numbers)] = zone_numbers
+
+    def _cell_of(self, longitude, latitude):
+        col = int(np.clip(np.floor((longitude - self.min_longitude) / self.cell), 0, self.columns - 1))
+        row = int(np.clip(np.floor((latitude - self.min_latitude) / self.cell), 0, self.rows - 1))
+        return col, row
+
+    def assign(self, longitude, latitude):
+        """ Zone number (position in zones, -1 for none) of every point """
+        longitude = np.asarray(longitude, dtype=float)
+        latitude = np.asarray(latitude, dtype=float)
+        numbers = np.full(len(longitude), -1, dtype=np.int32)
+        in_grid = np.flatnonzero((longitude >= self.min_longitude) & (longitude <= self.max_longitude) &
+                                 (latitude >= self.min_latitude) & (latitude <= self.max_latitude))
+        x, y = longitude[in_grid], latitude[in_grid]
+        cols = np.minimum(((x - self.min_longitude) / self.cell).astype(np.int64), self.columns - 1)
+        rows = np.minimum(((y - self.min_latitude) / self.cell).astype(np.int64), self.rows - 1)
+        cells = rows * self.columns + cols
+        numbers[in_grid] = self.cell_zone[cells]
+
+        # Points in border cells: test their candidate zones in precedence order, grouped by zone
+        slots = self.cell_slot[cells]
+        pending = np.flatnonzero(slots >= 0)
+        for rank in range(self.candidates.shape[1]):
+            zone_numbers = self.candidates[slots[pending], rank]
+            pending, zone_numbers = pending[zone_numbers >= 0], zone_numbers[zone_numbers >= 0]
+            if not len(pending):
+                break
+            order = np.argsort(zone_numbers, kind='stable')
+            pending, zone_numbers = pending[order], zone_numbers[order]
+            matched = np.zeros(len(pending), dtype=bool)
+            starts = np.flatnonzero(np.r_[True, zone_numbers[1:] != zone_numbers[:-1]])
+            for start, end in zip(starts, np.r_[starts[1:], len(pending)]):
+                points = pending[start:end]
+                matched[start:end] = self.zones[zone_numbers[start]].contains(x[points], y[points])
+            numbers[in_grid[pending[matched]]] = zone_numbers[matched]
+            pending = pending[~matched]
+        return numbers
+
+    def assign_codes(self, longitude, latitude):
+        """ Zone code of every point, None outside all zones """
+        return self.codes[self.assign(longitude, latitude)]
@@ -0,0 +1,261 @@
+""" Latency histograms and counters for the API, rendered in the Prometheus text format
+
+Requests are timed by hooks in app.py; SQL statements are timed by TimedConnection, the connection
+class the pool opens while metrics are enabled. A statement's time covers its execute and every fetch
+until the cursor is exhausted, closed or re-executed, and is labelled with the route that ran it and
+a short hash of its normalised SQL (sql_query_info maps the hash back to the statement text).
+"""
+
+import bisect
+import contextvars
+import functools
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from backend.database.pool import LimitedConnection, LimitedCursor
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statement text shown in sql_query_info
+STATEMENT_LABEL_CHARS = 1000
+
+logger = logging.getLogger(__name__)
+
+# Route of the request being served, set by the request hooks; SQL run outside a request is "none"
+current_route = contextvars.ContextVar("current_route", default="none")
+
+# Statements at or above this many seconds are logged with their query plan (None: no slow-query log)
+slow_query_seconds = None
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def label_text(names, values):
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """ Monotonic counter per label combination """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name, label_values, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, label_values, value in self.samples():
+            labels = label_text(self.labels, label_values)
+            lines.append(f"{name}{{{labels}}} {format_value(value)}" if labels else f"{name} {format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """ Value that is set rather than counted """
+
+    kind = "gauge"
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(Counter):
+    """ Bucketed latency distribution per label combination """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((label_values, (list(counts), total)) for label_values, (counts, total)
+                            in self._values.items())
+        for label_values, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", label_values + (bound,), cumulative
+            yield f"{self.name}_sum", label_values, total
+            yield f"{self.name}_count", label_values, cumulative
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, label_values, value in self.samples():
+            names = self.labels + ("le",) if name.endswith("_bucket") else self.labels
+            lines.append(f"{name}{{{label_text(names, label_values)}}} {format_value(value)}")
+        return lines
+
+
+request_duration = Histogram("http_request_duration_seconds", "Time to handle a request, until the response is returned",
+                             ["method", "route"])
+requests_total = Counter("http_requests_total", "Requests handled", ["method", "route", "status"])
+query_duration = Histogram("sql_query_duration_seconds", "Time to execute a SQL statement and fetch its rows",
+                           ["route", "query"])
+rows_returned = Counter("sql_rows_returned_total", "Rows fetched from SQL statements", ["route", "query"])
+slow_queries = Counter("sql_slow_queries_total", "SQL statements slower than the slow-query threshold",
+                       ["route", "query"])
+query_info = Gauge("sql_query_info", "Normalised text of each query hash", ["query", "statement"])
+
+REGISTRY = [request_duration, requests_total, query_duration, rows_returned, slow_queries, query_info]
+
+
+def render(extra=()):
+    """ Every registered metric (and any extra ones) in the Prometheus text exposition format """
+    lines = []
+    for metric in [*REGISTRY, *extra]:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+@functools.lru_cache(maxsize=1024)
+def query_label(sql):
+    """ Short stable hash of a statement, ignoring whitespace; records the statement in sql_query_info """
+    normalised = re.sub(r"\s+", " ", sql).strip()
+    label = hashlib.sha1(normalised.encode()).hexdigest()[:8]
+    query_info.set(label, normalised[:STATEMENT_LABEL_CHARS], value=1)
+    return label
+
+
+class TimedCursor(LimitedCursor):
+    """ Cursor that records the time and row count of each statement it runs """
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._sql, self._parameters, self._route = sql, parameters, current_route.get()
+        self._rows = 0
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+
+    def _fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            rows = fetch(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+        return rows
+
+    def fetchone(self):
+        if not self._sql:
+            return super().fetchone()
+        row = self._fetch(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if not self._sql:
+            return super().fetchmany(size)
+        rows = self._fetch(super().fetchmany, size)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if not self._sql:
+            return super().fetchall()
+        rows = self._fetch(super().fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        if not self._sql:
+            return super().__next__()
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._elapsed += time.perf_counter() - started
+            self._finish()
+            raise
+        self._elapsed += time.perf_counter() - started
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        """ Record the statement in progress, once """
+        sql, self._sql = self._sql, None
+        if sql is None:
+            return
+        label = query_label(sql)
+        query_duration.observe(self._route, label, value=self._elapsed)
+        rows_returned.inc(self._route, label, amount=self._rows)
+        if slow_query_seconds is not None and self._elapsed >= slow_query_seconds:
+            slow_queries.inc(self._route, label)
+            log_slow_query(self.connection, sql, self._parameters, self._route, self._elapsed, self._rows)
+
+
+def log_slow_query(conn, sql, parameters, route, elapsed, rows):
+    """ Log a slow statement with its EXPLAIN QUERY PLAN """
+    plan = ""
+    if re.match(r"\s*(SELECT|WITH)\b", sql, re.IGNORECASE):
+        try:
+            steps = conn.cursor(LimitedCursor).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+            plan = "; ".join(step[-1] for step in steps)
+        except sqlite3.Error as error:
+            plan = f"unavailable ({error})"
+    logger.warning("Slow query on %s: %.1f ms, %d rows [%s]\n%s%s", route, elapsed * 1000, rows, query_label(sql),
+                   re.sub(r"\s+", " ", sql).strip(), f"\nPlan: {plan}" if plan else "")
+
+
+class TimedConnection(LimitedConnection):
+    """ Connection whose statements (conn.execute and its cursors) are timed by TimedCursor """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
@@ -1,6 +1,20 @@
 #!/usr/bin/env python3
-"""Start the API server"""
+"""Start the API server
 
+By default the app is served by waitress: a fixed pool of worker threads handles requests and their
+SQLite queries, with one pooled connection per thread, and further connections queue until a thread
+is free. Slow statements are interrupted after QUERY_TIMEOUT seconds (see backend/app.py), so one
+runaway scan cannot hold a thread for long. --dev starts Flask's development server with the debugger.
+
+Usage:
+    python run.py                                # 16 threads on port 5000
+    python run.py --threads 32 --port 8000       # or SERVER_THREADS / SERVER_CONNECTIONS
+    python run.py --dev
+"""
+
+import argparse
+import logging
+import os
 import subprocess
 import sys
 from pathlib import Path
@@ -8,10 +22,38 @@ from pathlib import Path
 BASE_DIR = Path(__file__).parent
 DB_FILE = BASE_DIR / "backend" / "database" / "nyc_taxi.db"
 
+parser = argparse.ArgumentParser(description="Start the API server")
+parser.add_argument("--host", default="0.0.0.0")
+parser.add_argument("--port", type=int, default=5000)
+parser.add_argument("--threads", type=int, default=int(os.environ.get("SERVER_THREADS", 16)),
+                    help="worker threads, and pooled database connections (default 16)")
+parser.add_argument("--connection-limit", type=int, default=int(os.environ.get("SERVER_CONNECTIONS", 1000)),
+                    help="open client connections accepted before new ones wait (default 1000)")
+parser.add_argument("--dev", action="store_true", help="run Flask's development server with the debugger")
+args = parser.parse_args()
+
 # Check if setup was done
 if not DB_FILE.exists():
     print("No Database found. Please run: python setup.py")
     sys.exit(1)
 
 # Start the app
-subprocess.run([sys.executable, "backend/app.py"], cwd=BASE_DIR)
+if args.dev:
+    subprocess.run([sys.executable, "backend/app.py"], cwd=BASE_DIR, env={**os.environ, "FLASK_DEBUG": "1"})
+    sys.exit()
+
+try:
+    from waitress import serve
+except ImportError:
+    sys.exit("waitress is not installed. Please run: pip install -r requirements.txt (or use --dev)")
+
+# Every worker thread gets its own connection, so requests never wait on the pool
+os.environ.setdefault("DB_POOL_SIZE", str(args.threads))
+sys.path.insert(0, str(BASE_DIR))
+from backend.app import app  # noqa: E402
+
+# Requests queueing behind busy threads is expected under load, not worth a warning each
+logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+
+print(f"Serving on http://{args.host}:{args.port} with {args.threads} threads")
+serve(app, host=args.host, port=args.port, threads=args.threads, connection_limit=args.connection_limit)
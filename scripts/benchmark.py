@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the cleaning stages, the database load and the API endpoints
+Each size gets a synthetic raw file (scripts/generate_trips.py), which is cleaned stage by stage,
+loaded with create_database and queried through the Flask test client. Results are written as
+JSON, one run per size, so they can be compared across commits and machines.
+
+Usage:
+    python scripts/benchmark.py                                  # 100k rows
+    python scripts/benchmark.py --rows 100000 1000000 10000000 --output bench.json
+    python scripts/benchmark.py --workdir /tmp/bench             # keep and reuse the generated files
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import data_cleaning
+import generate_trips
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from backend import app as api  # noqa: E402
+from backend.database.db import create_database  # noqa: E402
+
+SCHEMA_PATH = BASE_DIR / 'backend' / 'database' / 'schema.sql'
+
+# Requests per endpoint
+ENDPOINT_REPEAT = 20
+
+
+def timed(function, *args, **kwargs):
+    """(result, seconds) of one call"""
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def stage_result(seconds, rows_in, rows_out=None):
+    return {'seconds': round(seconds, 4), 'rows_in': rows_in, 'rows_out': rows_in if rows_out is None else rows_out,
+            'rows_per_second': round(rows_in / seconds) if seconds > 0 else None}
+
+
+def benchmark_cleaning(raw_path, clean_path):
+    """Time every cleaning stage on the whole file, in pipeline order"""
+    stats = data_cleaning.new_stats()
+    results = {}
+
+    df, seconds = timed(pd.read_csv, raw_path, dtype=data_cleaning.RAW_DTYPES)
+    results['read_csv'] = stage_result(seconds, len(df))
+    stats['loaded'] = len(df)
+
+    for name, stage in [('drop_duplicates', data_cleaning.drop_duplicates),
+                        ('drop_missing', data_cleaning.drop_missing),
+                        ('drop_invalid_coordinates', data_cleaning.drop_invalid_coordinates),
+                        ('add_temporal_features', lambda df, stats: data_cleaning.add_temporal_features(df)),
+                        ('add_zones', lambda df, stats: data_cleaning.add_zones(df)),
+                        ('add_trip_metrics', lambda df, stats: data_cleaning.add_trip_metrics(df)),
+                        ('drop_invalid_trips', data_cleaning.drop_invalid_trips),
+                        ('finalize', lambda df, stats: data_cleaning.finalize(df))]:
+        rows_in = len(df)
+        df, seconds = timed(stage, df, stats)
+        results[name] = stage_result(seconds, rows_in, len(df))
+
+    writers = [('write_csv', data_cleaning.CsvTripWriter, clean_path),
+               ('write_parquet', data_cleaning.ParquetTripWriter, clean_path.with_suffix('.parquet'))]
+    for name, writer_class, path in writers:
+        started = time.perf_counter()
+        writer = writer_class(path)
+        writer.write(df)
+        writer.close()
+        results[name] = stage_result(time.perf_counter() - started, len(df))
+        results[name]['bytes'] = path.stat().st_size
+    return results, len(df)
+
+
+def benchmark_database(clean_path, db_path):
+    """Time create_database from the cleaned CSV"""
+    for path in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+        if path.exists():
+            path.unlink()
+    _, seconds = timed(create_database, str(db_path), str(clean_path), str(SCHEMA_PATH))
+    with closing(sqlite3.connect(db_path)) as conn:
+        trips = conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+    return {**stage_result(seconds, trips), 'bytes': db_path.stat().st_size}
+
+
+def endpoint_urls(db_path):
+    """Representative request per endpoint, with parameters taken from the data"""
+    with closing(sqlite3.connect(db_path)) as conn:
+        trip_id, date = conn.execute(
+            "SELECT trip_id, date(pickup_at, 'unixepoch') FROM trips ORDER BY rowid LIMIT 1").fetchone()
+    return {
+        'index': '/',
+        'trips': '/api/trips',
+        'trip_by_id': f'/api/trips/{trip_id}',
+        'trips_by_date': f'/api/trips/by_date?date={date}',
+        'trips_by_distance': '/api/trips/by_distance?min=2&max=5',
+        'trips_by_location': '/api/trips/by_location?location=midtown',
+        'search_zone_month': '/api/trips/search?zone=midtown&month=3',
+        'search_date_range_vendor': '/api/trips/search?start_date=2016-03-01&end_date=2016-03-31&vendor=2',
+        'search_fare_range': '/api/trips/search?min_fare=20&max_fare=30',
+        'within_bbox': '/api/trips/within_bbox?min_lat=40.75&min_lon=-73.99&max_lat=40.76&max_lon=-73.98',
+        'near': '/api/trips/near?lat=40.758&lon=-73.9855&radius_km=0.5',
+        'heatmap': '/api/heatmap',
+        'export_date_csv': f'/api/trips/export?format=csv&date={date}',
+        'stats_summary': '/api/stats/summary',
+        'stats_hourly': '/api/stats/hourly?month=3',
+        'stats_vendors': '/api/stats/vendors',
+        'stats_passengers': '/api/stats/passengers?zone=midtown',
+    }
+
+
+def benchmark_endpoints(db_path, repeat=ENDPOINT_REPEAT):
+    """Latency of each endpoint through the Flask test client, with the result cache disabled"""
+    api.DB_PATH = db_path
+    api.result_cache.ttl = 0
+    client = api.app.test_client()
+    results = {}
+    try:
+        for name, url in endpoint_urls(db_path).items():
+            timings, size = [], 0
+            for _ in range(repeat + 1):
+                started = time.perf_counter()
+                with client.get(url) as response:
+                    size = len(response.get_data())
+                    timings.append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"{url} returned {response.status_code}")
+            timings = timings[1:]  # the first request warms the connection and page cache
+            results[name] = {'url': url, 'repeat': repeat, 'bytes': size,
+                             'median_ms': round(statistics.median(timings), 3),
+                             'p95_ms': round(float(np.percentile(timings, 95)), 3),
+                             'min_ms': round(min(timings), 3), 'max_ms': round(max(timings), 3)}
+    finally:
+        api.get_pool().close()
+        api.pool = None
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__, 'numpy': np.__version__, 'sqlite': sqlite3.sqlite_version, 'commit': commit}
+
+
+def run(rows, workdir, seed, repeat):
+    raw_path = workdir / f'synthetic_{rows}_{seed}.csv'
+    if not raw_path.exists():
+        print(f"Generating {rows:,} trips")
+        generate_trips.write_trips(raw_path, rows, seed)
+    with open(raw_path) as f:
+        raw_rows = sum(1 for _ in f) - 1
+
+    print(f"Benchmarking cleaning of {raw_rows:,} raw rows")
+    cleaning, clean_rows = benchmark_cleaning(raw_path, workdir / f'clean_{rows}_{seed}.csv')
+    print("Benchmarking create_database")
+    database = benchmark_database(workdir / f'clean_{rows}_{seed}.csv', workdir / f'trips_{rows}_{seed}.db')
+    print("Benchmarking API endpoints")
+    endpoints = benchmark_endpoints(workdir / f'trips_{rows}_{seed}.db', repeat)
+    return {'rows': rows, 'seed': seed, 'raw_rows': raw_rows, 'clean_rows': clean_rows,
+            'cleaning': cleaning, 'create_database': database, 'endpoints': endpoints}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cleaning, loading and the API on synthetic trips")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000], help="trip counts to benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=ENDPOINT_REPEAT, help="requests per endpoint")
+    parser.add_argument('--workdir', type=Path, default=None,
+                        help="directory for the generated files (default: a temporary directory)")
+    parser.add_argument('--output', type=Path, default=Path('benchmark_results.json'), help="JSON results file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or Path(tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        results = {'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                   'environment': environment(),
+                   'runs': [run(rows, workdir, args.seed, args.repeat) for rows in args.rows]}
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
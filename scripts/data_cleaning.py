@@ -1,299 +1,804 @@
-#!/usr/bin/env python3
-"""
-Data cleaning script for NYC taxi data
-This script processes raw taxi data and creates clean dataset for analysis
-Author: Student
-"""
-
-import urllib.request
-import pandas as pd
-import numpy as np
-import logging
-from datetime import datetime
-from math import radians, cos, sin, asin, sqrt
-from pathlib import Path
-import os
-
-# Get the project root directory
-BASE_DIR = Path(__file__).resolve().parent.parent
-
-# Create logs directory if it doesn't exist
-LOG_DIR = BASE_DIR / 'backend' / 'logs'
-LOG_DIR.mkdir(parents=True, exist_ok=True)
-LOG_PATH = LOG_DIR / 'excluded_records.log'
-
-# Setup logging to track excluded records
-logging.basicConfig(filename=str(LOG_PATH), level=logging.INFO, format='%(asctime)s - %(message)s')
-
-# Create data directories
-DATA_DIR = BASE_DIR / 'data' / 'raw'
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-DATA_PATH = DATA_DIR / 'train.csv'
-
-# Download raw data if not present
-try:
-    if not DATA_PATH.exists():
-        print("Downloading raw data...")
-        url = "https://github.com/Masalale/urban_mobility_data_explorer/releases/download/Raw/train.csv"
-        urllib.request.urlretrieve(url, DATA_PATH)
-        print(f"Data downloaded to '{DATA_PATH}'")
-    else:
-        print(f"Data file already exists at '{DATA_PATH}'")
-except Exception as e:
-    print(f"Error downloading data: {e}")
-    exit(1)
-
-
-# Haversine formula for distance calculation
-def haversine_vectorized(lon1, lat1, lon2, lat2):
-    """Calculate distance between two GPS points"""
-    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
-    return 6371 * 2 * np.arcsin(np.sqrt(a))
-
-
-# Load data
-print("Loading raw data...")
-try:
-    df = pd.read_csv(DATA_PATH)
-    initial_load_count = len(df)
-    print(f"Loaded {len(df):,} records")
-    logging.info(f"Initial records loaded: {initial_load_count}")
-except Exception as e:
-    print(f"Error loading data: {e}")
-    exit(1)
-
-# Remove duplicates
-print("Removing duplicates...")
-duplicates = df.duplicated().sum()
-if duplicates > 0:
-    print(f"Found {duplicates:,} duplicates")
-    logging.info(f"Dropped {duplicates} duplicate rows")
-    df = df.drop_duplicates()
-    print(f"Records remaining: {len(df):,}")
-else:
-    print("No duplicates found")
-
-# Handle missing values
-print("Checking for missing values...")
-missing_values = df.isnull().sum()
-total_missing = missing_values.sum()
-
-if total_missing > 0:
-    print("Found missing values:")
-    for col in df.columns:
-        if df[col].isnull().sum() > 0:
-            missing_count = df[col].isnull().sum()
-            print(f"  {col}: {missing_count:,} missing")
-            logging.info(f"Column '{col}' has {missing_count} missing values")
-    
-    # Log some examples of records with missing values
-    records_with_missing = df[df.isnull().any(axis=1)]
-    for idx, row in records_with_missing.head(10).iterrows():
-        logging.info(f"Excluded trip {row['id']} due to missing values")
-    logging.info(f"Total records with missing values removed: {len(records_with_missing)}")
-    
-    df = df.dropna()
-    print(f"Records remaining: {len(df):,}")
-else:
-    print("No missing values found")
-
-# Validate coordinates
-print("Validating coordinates...")
-valid_trips = (df['pickup_latitude'].between(40.5, 41.0)) & (df['pickup_longitude'].between(-74.5, -73.5)) & (
-    df['dropoff_latitude'].between(40.5, 41.0)) & (df['dropoff_longitude'].between(-74.5, -73.5))
-
-invalid_count = (~valid_trips).sum()
-if invalid_count > 0:
-    print(f"Found {invalid_count:,} trips with invalid coordinates")
-    invalid_trips = df[~valid_trips]
-    for idx, row in invalid_trips.head(10).iterrows():
-        logging.info(f"Excluded trip {row['id']} due to invalid coordinates")
-    logging.info(f"Total records with invalid coordinates removed: {invalid_count}")
-    df = df[valid_trips]
-    print(f"Records remaining: {len(df):,}")
-else:
-    print("All trips have valid coordinates")
-
-# Convert datetime
-print("Converting datetime columns...")
-try:
-    df['pickup_datetime'] = pd.to_datetime(df['pickup_datetime'])
-    df['dropoff_datetime'] = pd.to_datetime(df['dropoff_datetime'])
-    print("Datetime conversion complete")
-except Exception as e:
-    print(f"Error converting datetime: {e}")
-    exit(1)
-
-# Create temporal features
-print("Creating temporal features...")
-df['pickup_date'] = df['pickup_datetime'].dt.date.astype(str)
-df['pickup_month'] = df['pickup_datetime'].dt.month
-df['pickup_hour'] = df['pickup_datetime'].dt.hour
-df['pickup_day_of_week'] = df['pickup_datetime'].dt.weekday
-df['pickup_day_name'] = df['pickup_datetime'].dt.day_name()
-df['is_pickup_weekend'] = (df['pickup_day_of_week'] >= 5).astype(int)
-df['is_pickup_peak_hour'] = df['pickup_hour'].isin([7, 8, 9, 16, 17, 18]).astype(int)
-
-# Time of day categories
-df['time_of_day'] = np.select(
-    [df['pickup_hour'].between(6, 11), df['pickup_hour'].between(12, 16), df['pickup_hour'].between(17, 20)],
-    ['Morning', 'Afternoon', 'Evening'], 'Night')
-
-print("Temporal features created")
-
-# Map coordinates to zones
-print("Mapping coordinates to zones...")
-pickup_conditions = [(df['pickup_latitude'].between(40.74, 40.77)) & (df['pickup_longitude'].between(-74.00, -73.97)),
-                     (df['pickup_latitude'].between(40.70, 40.73)) & (df['pickup_longitude'].between(-74.02, -73.99)),
-                     (df['pickup_latitude'].between(40.77, 40.82)) & (df['pickup_longitude'].between(-73.98, -73.93)),
-                     (df['pickup_latitude'].between(40.60, 40.70)) & (df['pickup_longitude'].between(-74.02, -73.90)),
-                     (df['pickup_latitude'].between(40.68, 40.78)) & (df['pickup_longitude'].between(-73.95, -73.75)),
-                     (df['pickup_latitude'].between(40.82, 40.90)) & (df['pickup_longitude'].between(-73.93, -73.85))]
-pickup_choices = ['midtown', 'downtown', 'uptown', 'brooklyn', 'queens', 'bronx']
-df['pickup_zone'] = np.select(pickup_conditions, pickup_choices, default=np.nan)
-
-dropoff_conditions = [
-    (df['dropoff_latitude'].between(40.74, 40.77)) & (df['dropoff_longitude'].between(-74.00, -73.97)),
-    (df['dropoff_latitude'].between(40.70, 40.73)) & (df['dropoff_longitude'].between(-74.02, -73.99)),
-    (df['dropoff_latitude'].between(40.77, 40.82)) & (df['dropoff_longitude'].between(-73.98, -73.93)),
-    (df['dropoff_latitude'].between(40.60, 40.70)) & (df['dropoff_longitude'].between(-74.02, -73.90)),
-    (df['dropoff_latitude'].between(40.68, 40.78)) & (df['dropoff_longitude'].between(-73.95, -73.75)),
-    (df['dropoff_latitude'].between(40.82, 40.90)) & (df['dropoff_longitude'].between(-73.93, -73.85))]
-df['dropoff_zone'] = np.select(dropoff_conditions, pickup_choices, default=np.nan)
-
-print("Zone mapping complete")
-
-# Calculate trip distance
-print("Calculating trip distances...")
-df['trip_distance_km'] = haversine_vectorized(df['pickup_longitude'], df['pickup_latitude'], df['dropoff_longitude'],
-                                              df['dropoff_latitude'])
-
-# Calculate trip duration
-print("Calculating trip durations...")
-df['trip_duration_seconds'] = (df['dropoff_datetime'] - df['pickup_datetime']).dt.total_seconds()
-df['trip_duration_minutes'] = df['trip_duration_seconds'] / 60
-
-# Calculate trip speed
-print("Calculating trip speeds...")
-df['trip_speed_kmh'] = np.where(df['trip_duration_seconds'] > 0,
-                                (df['trip_distance_km'] / df['trip_duration_seconds']) * 3600, 0)
-
-# Estimate fare
-print("Estimating fares...")
-df['estimated_fare'] = (2.50 + (df['trip_distance_km'] * 2.50) + (df['trip_duration_minutes'] * 0.50))
-
-# Calculate fare per km
-print("Calculating fare per km...")
-df['fare_per_km'] = np.where(df['trip_distance_km'] > 0, df['estimated_fare'] / df['trip_distance_km'], 0)
-
-# Calculate idle time ratio
-print("Calculating idle time ratios...")
-expected_time = np.where(df['trip_speed_kmh'] > 0, df['trip_distance_km'] / df['trip_speed_kmh'] * 3600,
-                         df['trip_duration_seconds'])
-
-df['idle_time_ratio'] = np.where(df['trip_duration_seconds'] > 0,
-                                 np.clip(1 - (expected_time / df['trip_duration_seconds']), 0, 1), 0)
-
-# Data validation
-print("Validating data...")
-initial_count = len(df)
-
-# Find invalid trips before removing them
-invalid_mask = ~(
-    (df['trip_speed_kmh'] > 0) & (df['trip_speed_kmh'] <= 120) &
-    (df['trip_duration_seconds'] > 0) &
-    (df['trip_distance_km'] > 0) &
-    (df['passenger_count'] > 0) & (df['passenger_count'] <= 9) &
-    (df['pickup_latitude'].between(40.5, 41.0)) &
-    (df['pickup_longitude'].between(-74.5, -73.5)) &
-    (df['dropoff_latitude'].between(40.5, 41.0)) &
-    (df['dropoff_longitude'].between(-74.5, -73.5))
-)
-
-invalid_trips_validation = df[invalid_mask]
-
-# Log examples with reasons
-for idx, row in invalid_trips_validation.head(20).iterrows():
-    reasons = []
-    if not (row['trip_speed_kmh'] > 0 and row['trip_speed_kmh'] <= 120):
-        reasons.append(f"invalid speed {row['trip_speed_kmh']:.1f} km/h")
-    if not row['trip_duration_seconds'] > 0:
-        reasons.append("invalid duration")
-    if not row['trip_distance_km'] > 0:
-        reasons.append("invalid distance")
-    if not (row['passenger_count'] > 0 and row['passenger_count'] <= 9):
-        reasons.append(f"invalid passenger count {row['passenger_count']}")
-    logging.info(f"Excluded trip {row['id']} - {', '.join(reasons)}")
-
-logging.info(f"Total records removed in final validation: {len(invalid_trips_validation)}")
-
-# Apply the filter
-df = df[~invalid_mask]
-
-removed_count = initial_count - len(df)
-if removed_count > 0:
-    print(f"Removed {removed_count:,} invalid trips")
-    print(f"Records remaining: {len(df):,}")
-else:
-    print("All trips passed validation")
-
-# Handle infinite values
-print("Handling infinite values...")
-df = df.replace([np.inf, -np.inf], np.nan)
-df = df.fillna({'trip_speed_kmh': 0, 'fare_per_km': 0, 'idle_time_ratio': 0, 'estimated_fare': 0})
-
-# Normalize store_and_fwd_flag
-print("Normalizing store_and_fwd_flag...")
-df['store_and_fwd_flag'] = df['store_and_fwd_flag'].map({0: 'N', 1: 'Y'}).fillna('N')
-
-# Select required columns
-print("Selecting required columns...")
-required_columns = ['id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'pickup_date', 'pickup_month',
-                    'pickup_hour', 'pickup_day_of_week', 'pickup_day_name', 'is_pickup_weekend', 'is_pickup_peak_hour',
-                    'time_of_day', 'pickup_longitude', 'pickup_latitude', 'dropoff_longitude', 'dropoff_latitude',
-                    'pickup_zone', 'dropoff_zone', 'passenger_count', 'store_and_fwd_flag', 'trip_distance_km',
-                    'trip_duration_seconds', 'trip_duration_minutes', 'trip_speed_kmh', 'fare_per_km',
-                    'idle_time_ratio', 'estimated_fare']
-
-df = df[required_columns]
-
-# Convert datetime to string for CSV
-df['pickup_datetime'] = df['pickup_datetime'].dt.strftime('%Y-%m-%d %H:%M:%S')
-df['dropoff_datetime'] = df['dropoff_datetime'].dt.strftime('%Y-%m-%d %H:%M:%S')
-
-# Save cleaned dataset
-print("Saving cleaned dataset...")
-OUTPUT_DIR = BASE_DIR / 'data' / 'processed'
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-OUTPUT_PATH = OUTPUT_DIR / 'clean_trips.csv'
-
-try:
-    df.to_csv(OUTPUT_PATH, index=False)
-    print(f"Data saved to '{OUTPUT_PATH}'")
-    print(f"Final dataset: {len(df):,} rows, {len(df.columns)} columns")
-
-    # Show statistics
-    print(f"\nDataset Statistics:")
-    print(f"  Total trips: {len(df):,}")
-    print(f"  Date range: {df['pickup_date'].min()} to {df['pickup_date'].max()}")
-    print(f"  Average distance: {df['trip_distance_km'].mean():.2f} km")
-    print(f"  Average duration: {df['trip_duration_minutes'].mean():.1f} minutes")
-    print(f"  Average speed: {df['trip_speed_kmh'].mean():.1f} km/h")
-
-except Exception as e:
-    print(f"Error saving data: {e}")
-    logging.error(f"Failed to save cleaned data: {e}")
-    exit(1)
-
-# Log summary
-logging.info("=" * 50)
-logging.info("DATA CLEANING SUMMARY")
-logging.info(f"Initial records: {initial_load_count}")
-logging.info(f"Final records: {len(df)}")
-logging.info(f"Total removed: {initial_load_count - len(df)}")
-logging.info("=" * 50)
-
-print("Data cleaning completed!")
+#!/usr/bin/env python3
+"""
+Data cleaning script for NYC taxi data
+This script processes raw taxi data and creates clean dataset for analysis
+Author: Student
+
+Usage:
+    python scripts/data_cleaning.py                      # whole file in memory
+    python scripts/data_cleaning.py --chunksize 250000   # bounded-memory streaming mode
+    python scripts/data_cleaning.py --workers 8          # parallel mode over raw-file partitions
+    python scripts/data_cleaning.py --format parquet     # typed columnar output for the database load
+"""
+
+import argparse
+import functools
+import io
+import json
+import os
+import sys
+import urllib.request
+import pandas as pd
+import numpy as np
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Get the project root directory
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from backend.common import (LOG_DIR, LOG_PATH, REJECTED_PATH, REJECTION_SUMMARY_PATH,  # noqa: E402,F401
+                            haversine_vectorized)
+from backend.database.zones import ZoneIndex, load_zones  # noqa: E402
+
+# Data directories
+DATA_DIR = BASE_DIR / 'data' / 'raw'
+DATA_PATH = DATA_DIR / 'train.csv'
+DATA_URL = "https://github.com/Masalale/urban_mobility_data_explorer/releases/download/Raw/train.csv"
+
+OUTPUT_DIR = BASE_DIR / 'data' / 'processed'
+OUTPUT_PATH = OUTPUT_DIR / 'clean_trips.csv'
+PARQUET_OUTPUT_PATH = OUTPUT_DIR / 'clean_trips.parquet'
+
+# Raw column types, fixed so every chunk of the file is parsed the same way.
+# Integer columns are read as float so missing values don't change their type between chunks.
+RAW_DTYPES = {'id': str, 'vendor_id': 'float64', 'pickup_datetime': str, 'dropoff_datetime': str,
+              'passenger_count': 'float64', 'pickup_longitude': 'float64', 'pickup_latitude': 'float64',
+              'dropoff_longitude': 'float64', 'dropoff_latitude': 'float64', 'store_and_fwd_flag': str,
+              'trip_duration': 'float64'}
+INTEGER_COLUMNS = ['vendor_id', 'passenger_count', 'trip_duration']
+
+REQUIRED_COLUMNS = ['id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'pickup_date', 'pickup_month',
+                    'pickup_hour', 'pickup_day_of_week', 'pickup_day_name', 'is_pickup_weekend',
+                    'is_pickup_peak_hour', 'time_of_day', 'pickup_longitude', 'pickup_latitude',
+                    'dropoff_longitude', 'dropoff_latitude', 'pickup_zone', 'dropoff_zone', 'passenger_count',
+                    'store_and_fwd_flag', 'trip_distance_km', 'trip_duration_seconds', 'trip_duration_minutes',
+                    'trip_speed_kmh', 'fare_per_km', 'idle_time_ratio', 'estimated_fare']
+
+# Every excluded record gets a reason code, the OR of the bits of the checks it failed
+# (one record can fail several of the final validation checks)
+REASON_BITS = {'duplicate': 1, 'missing': 2, 'invalid_coordinates': 4, 'speed': 8, 'duration': 16,
+               'distance': 32, 'passenger_count': 64}
+REASON_CODES = 1 << len(REASON_BITS)
+
+# Reason bits set by each exclusion stage, used to reconcile duplicates found across partitions
+STAGE_BITS = {'missing': REASON_BITS['missing'], 'invalid_coordinates': REASON_BITS['invalid_coordinates'],
+              'validation': (REASON_BITS['speed'] | REASON_BITS['duration'] | REASON_BITS['distance'] |
+                             REASON_BITS['passenger_count'])}
+
+# Target size of one raw-file partition in parallel mode
+PARTITION_BYTES = 64 * 1024 * 1024
+
+# Rows per Parquet row group
+ROW_GROUP_ROWS = 250000
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Small-range columns of the cleaned frame are held as int8 and repeated labels as categoricals,
+# which keeps the in-memory frame a fraction of its object/int64 size; the written values are unchanged
+CALENDAR_DTYPE = 'int8'
+COMPACT_DTYPES = {'vendor_id': 'int8', 'passenger_count': 'int8', 'store_and_fwd_flag': 'category'}
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+TIMES_OF_DAY = ['Night', 'Morning', 'Afternoon', 'Evening']
+
+
+def setup_logging():
+    """Setup logging to track excluded records"""
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(filename=str(LOG_PATH), level=logging.INFO, format='%(asctime)s - %(message)s')
+
+
+def download_raw_data(data_path=DATA_PATH):
+    """Download raw data if not present"""
+    data_path = Path(data_path)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    if not data_path.exists():
+        print("Downloading raw data...")
+        urllib.request.urlretrieve(DATA_URL, data_path)
+        print(f"Data downloaded to '{data_path}'")
+    else:
+        print(f"Data file already exists at '{data_path}'")
+
+
+def new_stats():
+    """Counters shared by every cleaning stage, so chunks can be accumulated.
+
+    'reasons' counts the excluded records per reason code; 'rejected' holds the
+    excluded records not yet written to the rejected-records file (see reject()).
+    """
+    return {'loaded': 0, 'duplicates': 0, 'missing': 0, 'missing_by_column': {}, 'invalid_coordinates': 0,
+            'validation': 0, 'final': 0, 'reasons': np.zeros(REASON_CODES, dtype=np.int64), 'rejected': []}
+
+
+def merge_stats(total, part):
+    """Add the counters of one chunk or partition to the running totals"""
+    for key in ['loaded', 'duplicates', 'missing', 'invalid_coordinates', 'validation', 'final']:
+        total[key] += part[key]
+    for col, missing_count in part['missing_by_column'].items():
+        total['missing_by_column'][col] = total['missing_by_column'].get(col, 0) + missing_count
+    total['reasons'] += part['reasons']
+    total['rejected'].extend(part['rejected'])
+
+
+def raw_columns(df):
+    """The raw columns of a frame at any cleaning stage, converted back to their raw types"""
+    raw = df[list(RAW_DTYPES)]
+    for col in ['pickup_datetime', 'dropoff_datetime']:
+        if pd.api.types.is_datetime64_any_dtype(raw[col]):
+            raw = raw.assign(**{col: raw[col].dt.strftime(DATETIME_FORMAT)})
+    return raw.astype({col: 'float64' for col in INTEGER_COLUMNS})
+
+
+def reject(stats, excluded, codes):
+    """Count the reason codes of excluded rows and keep their raw columns for the rejected-records file.
+
+    The rows are labelled with their index, which is their position in the raw file. They are kept
+    as an Arrow table: referencing the frame's string objects instead would pin the memory of the
+    whole frame they were allocated with.
+    """
+    if excluded.empty:
+        return
+    codes = np.full(len(excluded), codes, dtype=np.uint8)
+    stats['reasons'] += np.bincount(codes, minlength=REASON_CODES)
+    rows = raw_columns(excluded)
+    rows.insert(0, 'reasons', codes)
+    rows.insert(0, 'row', excluded.index.to_numpy(dtype=np.int64))
+    stats['rejected'].append(RejectedRecordsWriter.encode(rows))
+
+
+# Remove duplicates
+def drop_duplicates(df, stats):
+    """Drop exact duplicate rows within one frame"""
+    duplicates = df.duplicated()
+    reject(stats, df[duplicates], REASON_BITS['duplicate'])
+    stats['duplicates'] += int(duplicates.sum())
+    return df[~duplicates]
+
+
+class RowHashSet:
+    """Compact set of row hashes used to find duplicates across chunks.
+
+    Holds one sorted uint64 per distinct raw row seen so far (8 bytes/row)
+    instead of the rows themselves.
+    """
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def contains(self, row_hashes):
+        """Mask of the given hashes that are already in the set"""
+        if not len(self.hashes):
+            return np.zeros(len(row_hashes), dtype=bool)
+        positions = np.searchsorted(self.hashes, row_hashes).clip(max=len(self.hashes) - 1)
+        return self.hashes[positions] == row_hashes
+
+    def add(self, row_hashes):
+        """Remember the given hashes"""
+        new_hashes = np.unique(row_hashes)
+        # Both inputs are sorted runs, so the stable sort is a linear merge
+        self.hashes = np.sort(np.concatenate([self.hashes, new_hashes]), kind='stable')
+
+    def drop_duplicates(self, df, stats):
+        """Drop rows already seen in this frame or any earlier one, then remember the new rows"""
+        row_hashes = hash_rows(df)
+        duplicates = pd.Series(row_hashes).duplicated().to_numpy() | self.contains(row_hashes)
+        self.add(row_hashes[~duplicates])
+
+        reject(stats, df[duplicates], REASON_BITS['duplicate'])
+        stats['duplicates'] += int(duplicates.sum())
+        return df[~duplicates]
+
+
+def hash_rows(df):
+    """64-bit hash of every raw row, equal for rows that DataFrame.duplicated() treats as equal"""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+# Handle missing values
+def drop_missing(df, stats):
+    """Remove records with any missing value"""
+    missing_rows = df.isnull().any(axis=1)
+    if missing_rows.any():
+        for col, missing_count in df.isnull().sum().items():
+            if missing_count > 0:
+                stats['missing_by_column'][col] = stats['missing_by_column'].get(col, 0) + int(missing_count)
+
+        reject(stats, df[missing_rows], REASON_BITS['missing'])
+        stats['missing'] += int(missing_rows.sum())
+        df = df[~missing_rows]
+
+    # Integer columns can only be cast back once their missing values are gone
+    return df.astype({col: 'int64' for col in INTEGER_COLUMNS})
+
+
+def coordinates_valid(df):
+    """Mask of trips with pickup and dropoff inside the NYC bounding box"""
+    return (df['pickup_latitude'].between(40.5, 41.0)) & (df['pickup_longitude'].between(-74.5, -73.5)) & (
+        df['dropoff_latitude'].between(40.5, 41.0)) & (df['dropoff_longitude'].between(-74.5, -73.5))
+
+
+# Validate coordinates
+def drop_invalid_coordinates(df, stats):
+    """Remove trips outside the NYC bounding box"""
+    valid_trips = coordinates_valid(df)
+    invalid_count = int((~valid_trips).sum())
+    if invalid_count > 0:
+        reject(stats, df[~valid_trips], REASON_BITS['invalid_coordinates'])
+        stats['invalid_coordinates'] += invalid_count
+        df = df[valid_trips]
+    return df
+
+
+# Create temporal features
+def add_temporal_features(df):
+    """Parse datetimes and derive the pickup calendar columns"""
+    df = df.copy()
+    df['pickup_datetime'] = pd.to_datetime(df['pickup_datetime'])
+    df['dropoff_datetime'] = pd.to_datetime(df['dropoff_datetime'])
+
+    # One ordered category per day, labelled YYYY-MM-DD, so min() / max() still give the date range
+    pickup_day = df['pickup_datetime'].dt.floor('D').astype(pd.CategoricalDtype(ordered=True))
+    df['pickup_date'] = pickup_day.cat.rename_categories(pickup_day.cat.categories.strftime('%Y-%m-%d'))
+    df['pickup_month'] = df['pickup_datetime'].dt.month.astype(CALENDAR_DTYPE)
+    df['pickup_hour'] = df['pickup_datetime'].dt.hour.astype(CALENDAR_DTYPE)
+    df['pickup_day_of_week'] = df['pickup_datetime'].dt.weekday.astype(CALENDAR_DTYPE)
+    df['pickup_day_name'] = pd.Categorical.from_codes(df['pickup_day_of_week'], DAY_NAMES)
+    df['is_pickup_weekend'] = (df['pickup_day_of_week'] >= 5).astype(CALENDAR_DTYPE)
+    df['is_pickup_peak_hour'] = df['pickup_hour'].isin([7, 8, 9, 16, 17, 18]).astype(CALENDAR_DTYPE)
+
+    # Time of day categories
+    df['time_of_day'] = pd.Categorical.from_codes(np.select(
+        [df['pickup_hour'].between(6, 11), df['pickup_hour'].between(12, 16), df['pickup_hour'].between(17, 20)],
+        [1, 2, 3], 0), TIMES_OF_DAY)
+    return df
+
+
+@functools.lru_cache(maxsize=None)
+def zone_index():
+    """Grid index over the zones of backend/database/zones.geojson, built once per process"""
+    return ZoneIndex(load_zones())
+
+
+# Map coordinates to zones
+def add_zones(df):
+    """Map pickup and dropoff coordinates to zones (missing outside every zone)"""
+    zones = zone_index()
+    for point in ['pickup', 'dropoff']:
+        df[f'{point}_zone'] = pd.Categorical(
+            zones.assign_codes(df[f'{point}_longitude'].to_numpy(), df[f'{point}_latitude'].to_numpy()))
+    return df
+
+
+def add_trip_metrics(df):
+    """Distance, duration, speed, fare and idle time derivations"""
+    # Calculate trip distance
+    df['trip_distance_km'] = haversine_vectorized(df['pickup_longitude'], df['pickup_latitude'],
+                                                  df['dropoff_longitude'], df['dropoff_latitude'])
+
+    # Calculate trip duration
+    df['trip_duration_seconds'] = (df['dropoff_datetime'] - df['pickup_datetime']).dt.total_seconds()
+    df['trip_duration_minutes'] = df['trip_duration_seconds'] / 60
+
+    # Calculate trip speed
+    df['trip_speed_kmh'] = np.where(df['trip_duration_seconds'] > 0,
+                                    (df['trip_distance_km'] / df['trip_duration_seconds']) * 3600, 0)
+
+    # Estimate fare
+    df['estimated_fare'] = (2.50 + (df['trip_distance_km'] * 2.50) + (df['trip_duration_minutes'] * 0.50))
+
+    # Calculate fare per km
+    df['fare_per_km'] = np.where(df['trip_distance_km'] > 0, df['estimated_fare'] / df['trip_distance_km'], 0)
+
+    # Calculate idle time ratio
+    expected_time = np.where(df['trip_speed_kmh'] > 0, df['trip_distance_km'] / df['trip_speed_kmh'] * 3600,
+                             df['trip_duration_seconds'])
+
+    df['idle_time_ratio'] = np.where(df['trip_duration_seconds'] > 0,
+                                     np.clip(1 - (expected_time / df['trip_duration_seconds']), 0, 1), 0)
+    return df
+
+
+def validation_reasons(df):
+    """Reason code of every trip for the final validation checks (0 for a valid trip).
+
+    Coordinates are not checked again: drop_invalid_coordinates runs first.
+    """
+    codes = np.zeros(len(df), dtype=np.uint8)
+    for reason, valid in [('speed', (df['trip_speed_kmh'] > 0) & (df['trip_speed_kmh'] <= 120)),
+                          ('duration', df['trip_duration_seconds'] > 0),
+                          ('distance', df['trip_distance_km'] > 0),
+                          ('passenger_count', (df['passenger_count'] > 0) & (df['passenger_count'] <= 9))]:
+        codes[~valid.to_numpy()] |= REASON_BITS[reason]
+    return codes
+
+
+# Data validation
+def drop_invalid_trips(df, stats):
+    """Remove trips with impossible speed, duration, distance or passenger count"""
+    codes = validation_reasons(df)
+    invalid_mask = codes != 0
+    reject(stats, df[invalid_mask], codes[invalid_mask])
+    stats['validation'] += int(invalid_mask.sum())
+    return df[~invalid_mask]
+
+
+def finalize(df):
+    """Fix infinite values and flags and select the output columns"""
+    # Handle infinite values
+    df = df.replace([np.inf, -np.inf], np.nan)
+    df = df.fillna({'trip_speed_kmh': 0, 'fare_per_km': 0, 'idle_time_ratio': 0, 'estimated_fare': 0})
+
+    # Normalize store_and_fwd_flag
+    df['store_and_fwd_flag'] = df['store_and_fwd_flag'].map({0: 'N', 1: 'Y'}).fillna('N')
+
+    # Select required columns, in their compact types (the values are validated, so they fit)
+    return df[REQUIRED_COLUMNS].astype(COMPACT_DTYPES)
+
+
+def clean_frame(df, stats):
+    """Run every stage after de-duplication on one frame (the whole file or a single chunk)"""
+    df = drop_missing(df, stats)
+    df = drop_invalid_coordinates(df, stats)
+    df = add_temporal_features(df)
+    df = add_zones(df)
+    df = add_trip_metrics(df)
+    df = drop_invalid_trips(df, stats)
+    df = finalize(df)
+    stats['final'] += len(df)
+    return df
+
+
+class CsvTripWriter:
+    """Writes cleaned trips as CSV text, with datetimes formatted as strings"""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        pd.DataFrame(columns=REQUIRED_COLUMNS).to_csv(self.file, index=False)
+
+    @staticmethod
+    def encode(df):
+        """Serialize a cleaned frame (lets worker processes do the formatting)"""
+        return df.to_csv(index=False, header=False, date_format=DATETIME_FORMAT)
+
+    def write(self, df):
+        self.write_encoded(self.encode(df))
+
+    @staticmethod
+    def records(payload):
+        """The CSV records of an encoded frame, each with its line terminator.
+
+        A record ends at a newline outside quotes: quoted fields may hold any character, and
+        quotes inside them are doubled, so an odd count of quotes means the field goes on.
+        """
+        records, pending = [], []
+        for line in payload.split('\n')[:-1]:
+            pending.append(line)
+            if sum(part.count('"') for part in pending) % 2 == 0:
+                records.append('\n'.join(pending) + '\n')
+                pending = []
+        return records
+
+    def write_encoded(self, payload, drop=None):
+        """Write an encoded frame, leaving out the rows flagged in `drop`"""
+        if drop is not None and drop.any():
+            payload = ''.join(record for record, dropped in zip(self.records(payload), drop) if not dropped)
+        self.file.write(payload)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetTripWriter:
+    """Writes cleaned trips as a typed Parquet file, one or more row groups per write.
+
+    Datetimes stay timestamps and missing zones are real nulls, so the database
+    load can read the columns it needs without parsing any text.
+    """
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+        self.writer = pq.ParquetWriter(path, self.schema())
+
+    @staticmethod
+    def schema():
+        import pyarrow as pa
+        types = {'id': pa.string(), 'pickup_datetime': pa.timestamp('s'), 'dropoff_datetime': pa.timestamp('s'),
+                 'pickup_date': pa.string(), 'pickup_day_name': pa.string(), 'time_of_day': pa.string(),
+                 'pickup_zone': pa.string(), 'dropoff_zone': pa.string(), 'store_and_fwd_flag': pa.string(),
+                 'pickup_longitude': pa.float64(), 'pickup_latitude': pa.float64(),
+                 'dropoff_longitude': pa.float64(), 'dropoff_latitude': pa.float64(),
+                 'trip_distance_km': pa.float64(), 'trip_duration_seconds': pa.float64(),
+                 'trip_duration_minutes': pa.float64(), 'trip_speed_kmh': pa.float64(), 'fare_per_km': pa.float64(),
+                 'idle_time_ratio': pa.float64(), 'estimated_fare': pa.float64()}
+        return pa.schema([(col, types.get(col, pa.int64())) for col in REQUIRED_COLUMNS])
+
+    @classmethod
+    def encode(cls, df):
+        """Convert a cleaned frame to an Arrow table (lets worker processes do the conversion)"""
+        import pyarrow as pa
+        return pa.Table.from_pandas(df, schema=cls.schema(), preserve_index=False, safe=False)
+
+    def write(self, df):
+        self.write_encoded(self.encode(df))
+
+    def write_encoded(self, payload, drop=None):
+        """Write an encoded frame, leaving out the rows flagged in `drop`"""
+        if drop is not None and drop.any():
+            payload = payload.filter(~drop)
+        self.writer.write_table(payload, row_group_size=ROW_GROUP_ROWS)
+
+    def close(self):
+        self.writer.close()
+
+
+class RejectedRecordsWriter:
+    """Writes excluded records to Parquet: their row in the raw file (0 = first data line),
+    their reason code (see REASON_BITS) and their raw columns.
+    """
+
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.writer = pq.ParquetWriter(path, self.schema())
+
+    @staticmethod
+    def schema():
+        import pyarrow as pa
+        return pa.schema([('row', pa.int64()), ('reasons', pa.uint8())] +
+                         [(col, pa.string() if dtype is str else pa.float64()) for col, dtype in RAW_DTYPES.items()])
+
+    @classmethod
+    def encode(cls, rows):
+        """Convert a frame of excluded records to an Arrow table"""
+        import pyarrow as pa
+        return pa.Table.from_pandas(rows, schema=cls.schema(), preserve_index=False)
+
+    @staticmethod
+    def collected(stats):
+        """The excluded records collected in stats as one table, in raw-file order (None if there are none)"""
+        import pyarrow as pa
+        if not stats['rejected']:
+            return None
+        return pa.concat_tables(stats['rejected']).sort_by('row')
+
+    def write(self, stats):
+        """Write the excluded records collected in stats and forget them"""
+        rows = self.collected(stats)
+        stats['rejected'] = []
+        if rows is not None:
+            self.writer.write_table(rows, row_group_size=ROW_GROUP_ROWS)
+
+    def close(self):
+        self.writer.close()
+
+
+def trip_writer_class(output_path):
+    """Pick the output format from the file extension"""
+    return ParquetTripWriter if Path(output_path).suffix == '.parquet' else CsvTripWriter
+
+
+def new_summary():
+    """Running totals for the dataset statistics printed at the end"""
+    return {'rows': 0, 'min_date': None, 'max_date': None, 'distance': 0.0, 'duration': 0.0, 'speed': 0.0}
+
+
+def update_summary(summary, df):
+    """Add one cleaned frame to the running totals"""
+    if df.empty:
+        return
+    summary['rows'] += len(df)
+    min_date, max_date = df['pickup_date'].min(), df['pickup_date'].max()
+    summary['min_date'] = min_date if summary['min_date'] is None else min(summary['min_date'], min_date)
+    summary['max_date'] = max_date if summary['max_date'] is None else max(summary['max_date'], max_date)
+    summary['distance'] += df['trip_distance_km'].sum()
+    summary['duration'] += df['trip_duration_minutes'].sum()
+    summary['speed'] += df['trip_speed_kmh'].sum()
+
+
+def clean_batch(data_path, output_path, rejected_path=REJECTED_PATH):
+    """Load the whole raw file, clean it and save it in one go"""
+    stats, summary = new_stats(), new_summary()
+
+    print("Loading raw data...")
+    df = pd.read_csv(data_path, dtype=RAW_DTYPES)
+    stats['loaded'] = len(df)
+    print(f"Loaded {len(df):,} records")
+
+    print("Removing duplicates...")
+    df = drop_duplicates(df, stats)
+
+    print("Cleaning and deriving features...")
+    df = clean_frame(df, stats)
+    update_summary(summary, df)
+
+    print("Saving cleaned dataset...")
+    writer = trip_writer_class(output_path)(output_path)
+    writer.write(df)
+    writer.close()
+    rejected = RejectedRecordsWriter(rejected_path)
+    rejected.write(stats)
+    rejected.close()
+    return stats, summary
+
+
+def clean_streaming(data_path, output_path, chunksize, rejected_path=REJECTED_PATH):
+    """Clean the raw file chunk by chunk, appending each chunk to the output.
+
+    Peak memory is bounded by the chunk size; duplicates across chunks are
+    found through a RowHashSet of every raw row seen so far.
+    """
+    stats, summary = new_stats(), new_summary()
+    seen_rows = RowHashSet()
+
+    print(f"Streaming raw data in chunks of {chunksize:,} rows...")
+    writer = trip_writer_class(output_path)(output_path)
+    rejected = RejectedRecordsWriter(rejected_path)
+    with pd.read_csv(data_path, dtype=RAW_DTYPES, chunksize=chunksize) as reader:
+        for chunk_number, chunk in enumerate(reader, start=1):
+            stats['loaded'] += len(chunk)
+            chunk = seen_rows.drop_duplicates(chunk, stats)
+            chunk = clean_frame(chunk, stats)
+            update_summary(summary, chunk)
+
+            writer.write(chunk)
+            rejected.write(stats)
+            print(f"Chunk {chunk_number}: {stats['loaded']:,} read, {stats['final']:,} kept", end='\r')
+
+    writer.close()
+    rejected.close()
+    print()
+    return stats, summary
+
+
+def split_byte_ranges(data_path, parts):
+    """Split the raw CSV body into about `parts` byte ranges that start and end on line boundaries.
+
+    Assumes no quoted field contains a newline, which holds for the taxi data.
+    """
+    size = os.path.getsize(data_path)
+    with open(data_path, 'rb') as f:
+        f.readline()
+        offsets = [f.tell()]
+        for i in range(1, parts):
+            f.seek(max(size * i // parts - 1, offsets[-1]))
+            f.readline()
+            offsets.append(f.tell())
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
+
+
+def read_partition(data_path, start, end):
+    """Parse one byte range of the raw file; rows are indexed by their position in the range"""
+    with open(data_path, 'rb') as f:
+        header = f.readline()
+        f.seek(start)
+        body = f.read(end - start)
+    return pd.read_csv(io.BytesIO(header + body), dtype=RAW_DTYPES)
+
+
+def clean_partition(data_path, start, end, writer_class):
+    """Worker: clean one byte range of the raw file.
+
+    Duplicates are only dropped within the partition here; the parent drops
+    rows repeated from earlier partitions using the returned row hashes and
+    positions (the rows of the de-duplicated partition).
+    """
+    stats = new_stats()
+    df = read_partition(data_path, start, end)
+    stats['loaded'] = len(df)
+
+    row_hashes = hash_rows(df)
+    duplicates = pd.Series(row_hashes).duplicated().to_numpy()
+    reject(stats, df[duplicates], REASON_BITS['duplicate'])
+    stats['duplicates'] = int(duplicates.sum())
+    df, row_hashes = df[~duplicates], row_hashes[~duplicates]
+
+    positions = df.index.to_numpy(dtype=np.int64)
+    df = clean_frame(df, stats)
+    summary_rows = df[['pickup_date', 'trip_distance_km', 'trip_duration_minutes', 'trip_speed_kmh']]
+
+    return {'stats': stats, 'row_hashes': row_hashes, 'positions': positions,
+            'payload': writer_class.encode(df), 'summary_rows': summary_rows}
+
+
+def reject_repeated_rows(stats, data_path, start, end, positions, repeated):
+    """Re-label the rows of a partition repeated from an earlier partition as duplicates.
+
+    Their counts move from the stage that excluded them (if any) to the duplicates. Excluded
+    rows are already in stats['rejected']; kept ones are parsed again from the raw file to be
+    added there, which only happens for partitions that have such rows.
+    Returns the mask of the partition's kept rows that are repeated, to leave out of the output.
+    """
+    import pyarrow as pa
+    rejected = RejectedRecordsWriter.collected(stats)
+    excluded = np.zeros(len(positions), dtype=bool)
+    if rejected is not None:
+        rows, codes = rejected['row'].to_numpy(), rejected['reasons'].to_numpy().copy()
+        excluded = np.isin(positions, rows)
+        relabelled = np.isin(rows, positions[repeated])
+        for stage, bits in STAGE_BITS.items():
+            stats[stage] -= int(np.count_nonzero(codes[relabelled] & bits))
+        stats['reasons'] -= np.bincount(codes[relabelled], minlength=REASON_CODES)
+        stats['reasons'][REASON_BITS['duplicate']] += int(relabelled.sum())
+        missing = rejected.filter(relabelled & (codes == REASON_BITS['missing']))
+        for col in missing.column_names[2:]:
+            if missing[col].null_count:
+                stats['missing_by_column'][col] -= missing[col].null_count
+                if not stats['missing_by_column'][col]:
+                    del stats['missing_by_column'][col]
+        codes[relabelled] = REASON_BITS['duplicate']
+        stats['rejected'] = [rejected.set_column(1, 'reasons', pa.array(codes, type=pa.uint8()))]
+
+    kept_repeated = repeated & ~excluded
+    if kept_repeated.any():
+        raw = read_partition(data_path, start, end)
+        reject(stats, raw.loc[positions[kept_repeated]], REASON_BITS['duplicate'])
+    stats['duplicates'] += int(repeated.sum())
+    stats['final'] -= int(kept_repeated.sum())
+    return repeated[~excluded]
+
+
+def clean_parallel(data_path, output_path, workers, rejected_path=REJECTED_PATH):
+    """Clean byte-range partitions of the raw file in a process pool.
+
+    Partitions are merged in file order, so the output and the exclusion
+    counts are the same as a single-process run.
+    """
+    stats, summary = new_stats(), new_summary()
+    seen_rows = RowHashSet()
+
+    parts = max(workers, -(-os.path.getsize(data_path) // PARTITION_BYTES))
+    ranges = split_byte_ranges(data_path, parts)
+    print(f"Cleaning {len(ranges)} partitions with {workers} workers...")
+
+    writer_class = trip_writer_class(output_path)
+    writer = writer_class(output_path)
+    rejected = RejectedRecordsWriter(rejected_path)
+    import pyarrow as pa
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(clean_partition, data_path, start, end, writer_class) for start, end in ranges]
+        for part_number, (future, (start, end)) in enumerate(zip(futures, ranges), start=1):
+            result = future.result()
+            part_stats = result['stats']
+
+            # Rows repeated from an earlier partition count as duplicates, not at the stage that dropped them
+            repeated = seen_rows.contains(result['row_hashes'])
+            seen_rows.add(result['row_hashes'])
+            kept_repeated = reject_repeated_rows(part_stats, data_path, start, end, result['positions'], repeated)
+            writer.write_encoded(result['payload'], drop=kept_repeated)
+            summary_rows = result['summary_rows'][~kept_repeated]
+
+            # Partition rows are numbered from 0; number them in the whole file
+            part_stats['rejected'] = [rows.set_column(0, 'row', pa.array(rows['row'].to_numpy() + stats['loaded']))
+                                      for rows in part_stats['rejected']]
+            merge_stats(stats, part_stats)
+            rejected.write(stats)
+            update_summary(summary, summary_rows)
+            print(f"Partition {part_number}/{len(ranges)}: {stats['loaded']:,} read, {stats['final']:,} kept",
+                  end='\r')
+
+    writer.close()
+    rejected.close()
+    print()
+    return stats, summary
+
+
+def reason_names(code):
+    """Names of the reasons in a reason code"""
+    return [reason for reason, bit in REASON_BITS.items() if code & bit]
+
+
+def rejection_summary(stats, rejected_path=REJECTED_PATH):
+    """Excluded record counts per reason, per exclusion stage and per reason code.
+
+    A record failing several checks counts under each of its reasons, so the
+    per-reason counts can add up to more than the excluded records.
+    """
+    codes = np.arange(REASON_CODES)
+    return {'loaded': stats['loaded'], 'kept': stats['final'], 'excluded': stats['loaded'] - stats['final'],
+            'by_reason': {reason: int(stats['reasons'][(codes & bit) != 0].sum())
+                          for reason, bit in REASON_BITS.items()},
+            'by_stage': {stage: stats[stage] for stage in ['duplicates', 'missing', 'invalid_coordinates',
+                                                          'validation']},
+            'by_code': [{'code': int(code), 'reasons': reason_names(code), 'records': int(stats['reasons'][code])}
+                        for code in np.flatnonzero(stats['reasons'])],
+            'missing_by_column': stats['missing_by_column'],
+            'rejected_records': Path(rejected_path).name}
+
+
+def report(stats, summary, output_path, rejected_path=REJECTED_PATH, summary_path=REJECTION_SUMMARY_PATH):
+    """Print and log the exclusion counts and dataset statistics, and save the rejection summary"""
+    logging.info(f"Initial records loaded: {stats['loaded']}")
+    if stats['duplicates']:
+        print(f"Dropped {stats['duplicates']:,} duplicates")
+        logging.info(f"Dropped {stats['duplicates']} duplicate rows")
+
+    for col, missing_count in stats['missing_by_column'].items():
+        print(f"  {col}: {missing_count:,} missing")
+        logging.info(f"Column '{col}' has {missing_count} missing values")
+    if stats['missing']:
+        print(f"Removed {stats['missing']:,} records with missing values")
+        logging.info(f"Total records with missing values removed: {stats['missing']}")
+
+    if stats['invalid_coordinates']:
+        print(f"Removed {stats['invalid_coordinates']:,} trips with invalid coordinates")
+        logging.info(f"Total records with invalid coordinates removed: {stats['invalid_coordinates']}")
+
+    print(f"Removed {stats['validation']:,} invalid trips")
+    logging.info(f"Total records removed in final validation: {stats['validation']}")
+
+    rejections = rejection_summary(stats, rejected_path)
+    for reason, count in rejections['by_reason'].items():
+        logging.info(f"Records excluded for reason '{reason}': {count}")
+    with open(summary_path, 'w') as f:
+        json.dump(rejections, f, indent=2)
+    print(f"Excluded records saved to '{rejected_path}', summary to '{summary_path}'")
+
+    print(f"Data saved to '{output_path}'")
+    print(f"Final dataset: {stats['final']:,} rows, {len(REQUIRED_COLUMNS)} columns")
+
+    # Show statistics
+    if summary['rows']:
+        print(f"\nDataset Statistics:")
+        print(f"  Total trips: {summary['rows']:,}")
+        print(f"  Date range: {summary['min_date']} to {summary['max_date']}")
+        print(f"  Average distance: {summary['distance'] / summary['rows']:.2f} km")
+        print(f"  Average duration: {summary['duration'] / summary['rows']:.1f} minutes")
+        print(f"  Average speed: {summary['speed'] / summary['rows']:.1f} km/h")
+
+    # Log summary
+    logging.info("=" * 50)
+    logging.info("DATA CLEANING SUMMARY")
+    logging.info(f"Initial records: {stats['loaded']}")
+    logging.info(f"Final records: {stats['final']}")
+    logging.info(f"Total removed: {stats['loaded'] - stats['final']}")
+    logging.info("=" * 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean the raw NYC taxi trip data")
+    parser.add_argument('--input', type=Path, default=DATA_PATH, help="raw trips CSV")
+    parser.add_argument('--output', type=Path, default=None,
+                        help="cleaned trips file, .csv or .parquet (default: data/processed/clean_trips.<format>)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help="output format when --output is not given")
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help="stream the raw file in chunks of this many rows to bound memory use")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="clean partitions of the raw file in N processes (0 = one per CPU core)")
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count()
+    if args.output is None:
+        args.output = PARQUET_OUTPUT_PATH if args.format == 'parquet' else OUTPUT_PATH
+
+    setup_logging()
+    try:
+        if args.input == DATA_PATH:
+            download_raw_data(args.input)
+    except Exception as e:
+        print(f"Error downloading data: {e}")
+        exit(1)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if workers > 1:
+            stats, summary = clean_parallel(args.input, args.output, workers)
+        elif args.chunksize:
+            stats, summary = clean_streaming(args.input, args.output, args.chunksize)
+        else:
+            stats, summary = clean_batch(args.input, args.output)
+    except Exception as e:
+        print(f"Error cleaning data: {e}")
+        logging.error(f"Failed to clean data: {e}")
+        exit(1)
+
+    report(stats, summary, args.output)
+    print("Data cleaning completed!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic NYC taxi trips, in the raw format of train.csv
+Pickups are drawn around Manhattan, Brooklyn, Queens and the airports with a daily demand curve;
+dropoffs lie a gamma-distributed distance away and durations follow from a traffic-dependent speed.
+A controlled share of rows is made bad (missing values, coordinates outside NYC, impossible trips)
+and a share of rows is repeated, so every cleaning stage has work to do.
+
+The same rows, seed and shares always produce the same file.
+
+Usage:
+    python scripts/generate_trips.py --rows 1000000 --output data/raw/synthetic_1m.csv
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RAW_COLUMNS = ['id', 'vendor_id', 'pickup_datetime', 'dropoff_datetime', 'passenger_count', 'pickup_longitude',
+               'pickup_latitude', 'dropoff_longitude', 'dropoff_latitude', 'store_and_fwd_flag', 'trip_duration']
+
+# Rows generated (and held in memory) at a time
+CHUNK_ROWS = 1000000
+
+START = np.datetime64('2016-01-01T00:00:00')
+DAYS = 182
+
+# Pickup hotspots: (longitude, latitude, spread in degrees, share of pickups)
+HOTSPOTS = [(-73.985, 40.755, 0.012, 0.40),   # Midtown
+            (-74.005, 40.720, 0.012, 0.20),   # Downtown
+            (-73.960, 40.785, 0.012, 0.15),   # Upper Manhattan
+            (-73.960, 40.690, 0.025, 0.10),   # Brooklyn
+            (-73.900, 40.740, 0.030, 0.07),   # Queens
+            (-73.870, 40.774, 0.004, 0.05),   # LaGuardia
+            (-73.785, 40.645, 0.004, 0.03)]   # JFK
+
+# Relative pickup demand per hour of day
+HOURLY_DEMAND = [3.5, 2.6, 1.9, 1.4, 1.1, 1.2, 2.3, 3.8, 4.5, 4.5, 4.4, 4.6,
+                 4.8, 4.8, 5.0, 4.9, 4.4, 5.1, 6.0, 6.1, 5.8, 5.6, 5.3, 4.6]
+
+PASSENGER_COUNTS = [1, 2, 3, 4, 5, 6]
+PASSENGER_SHARES = [0.71, 0.14, 0.04, 0.02, 0.05, 0.04]
+
+# Kinds of bad rows, drawn in equal shares
+BAD_KINDS = ['missing', 'invalid_coordinates', 'zero_passengers', 'too_fast', 'negative_duration']
+
+
+def generate_chunk(rows, first_id, rng, bad_share, duplicate_share, id_width):
+    """One chunk of raw trips"""
+    spot = rng.choice(len(HOTSPOTS), rows, p=[share for *_, share in HOTSPOTS])
+    centres = np.array([(lon, lat, spread) for lon, lat, spread, _ in HOTSPOTS])[spot]
+    pickup_lon = rng.normal(centres[:, 0], centres[:, 2])
+    pickup_lat = rng.normal(centres[:, 1], centres[:, 2])
+
+    distance_km = rng.gamma(1.6, 2.2, rows) + 0.1
+    bearing = rng.uniform(0, 2 * np.pi, rows)
+    dropoff_lat = pickup_lat + distance_km * np.cos(bearing) / 111.32
+    dropoff_lon = pickup_lon + distance_km * np.sin(bearing) / (111.32 * np.cos(np.radians(pickup_lat)))
+
+    hours = rng.choice(24, rows, p=np.array(HOURLY_DEMAND) / sum(HOURLY_DEMAND))
+    pickup = (START + rng.integers(0, DAYS, rows).astype('timedelta64[D]') + hours.astype('timedelta64[h]')
+              + rng.integers(0, 3600, rows).astype('timedelta64[s]'))
+    rush = np.isin(hours, [7, 8, 9, 16, 17, 18, 19])
+    speed_kmh = np.clip(rng.normal(np.where(rush, 14, 22), 5), 4, 60)
+    duration = np.maximum((distance_km / speed_kmh * 3600 + rng.normal(60, 30, rows)).astype(np.int64), 1)
+
+    df = pd.DataFrame({
+        'id': [f"id{number:0{id_width}d}" for number in range(first_id, first_id + rows)],
+        'vendor_id': rng.choice([1, 2], rows, p=[0.47, 0.53]),
+        'pickup_datetime': pd.Series(pickup).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'dropoff_datetime': pd.Series(pickup + duration.astype('timedelta64[s]')).dt.strftime('%Y-%m-%d %H:%M:%S'),
+        'passenger_count': rng.choice(PASSENGER_COUNTS, rows, p=PASSENGER_SHARES),
+        'pickup_longitude': pickup_lon, 'pickup_latitude': pickup_lat,
+        'dropoff_longitude': dropoff_lon, 'dropoff_latitude': dropoff_lat,
+        'store_and_fwd_flag': rng.choice(['N', 'Y'], rows, p=[0.994, 0.006]),
+        'trip_duration': duration,
+    })
+
+    # Spoil a share of the rows, one kind of fault each
+    bad = np.flatnonzero(rng.random(rows) < bad_share)
+    kinds = rng.integers(0, len(BAD_KINDS), len(bad))
+    for number, kind in enumerate(BAD_KINDS):
+        index = bad[kinds == number]
+        if kind == 'missing':
+            columns = rng.choice(['vendor_id', 'passenger_count', 'pickup_longitude', 'dropoff_datetime'], len(index))
+            for column in np.unique(columns):
+                df.loc[index[columns == column], column] = np.nan
+        elif kind == 'invalid_coordinates':
+            df.loc[index, ['pickup_longitude', 'pickup_latitude']] = 0.0
+        elif kind == 'zero_passengers':
+            df.loc[index, 'passenger_count'] = 0
+        elif kind == 'too_fast':
+            df.loc[index, 'dropoff_datetime'] = df.loc[index, 'pickup_datetime']
+            df.loc[index, 'trip_duration'] = 0
+        elif kind == 'negative_duration':
+            df.loc[index, ['pickup_datetime', 'dropoff_datetime']] = df.loc[
+                index, ['dropoff_datetime', 'pickup_datetime']].to_numpy()
+
+    # Integer columns keep their integer text next to missing values
+    for column in ['vendor_id', 'passenger_count', 'trip_duration']:
+        df[column] = df[column].astype('Int64')
+
+    # Repeat a share of the rows at random positions
+    repeats = df.iloc[rng.choice(rows, int(rows * duplicate_share), replace=False)]
+    df = pd.concat([df, repeats])
+    return df.iloc[rng.permutation(len(df))]
+
+
+def write_trips(output_path, rows, seed=0, bad_share=0.02, duplicate_share=0.01):
+    """Write `rows` synthetic trips (plus the repeated rows) to a raw CSV file; returns the rows written"""
+    id_width = max(7, len(str(rows - 1)))
+    written = 0
+    with open(output_path, 'w', newline='') as f:
+        for chunk_number, first_id in enumerate(range(0, rows, CHUNK_ROWS)):
+            # Each chunk has its own stream, so the file does not depend on how it is chunked in memory
+            rng = np.random.default_rng([seed, chunk_number])
+            chunk = generate_chunk(min(CHUNK_ROWS, rows - first_id), first_id, rng, bad_share, duplicate_share,
+                                   id_width)
+            chunk[RAW_COLUMNS].to_csv(f, index=False, header=chunk_number == 0)
+            written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic raw NYC taxi trips")
+    parser.add_argument('--rows', type=int, default=100000, help="distinct trips to generate")
+    parser.add_argument('--output', type=Path, required=True, help="raw trips CSV to write")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bad-share', type=float, default=0.02, help="share of rows made invalid")
+    parser.add_argument('--duplicate-share', type=float, default=0.01, help="share of rows written twice")
+    args = parser.parse_args()
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    written = write_trips(args.output, args.rows, args.seed, args.bad_share, args.duplicate_share)
+    print(f"Wrote {written:,} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
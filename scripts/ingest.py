@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Incremental ingestion of new raw trip files into an existing database
+Only files whose fingerprint is not in the ingested_files manifest are cleaned; their trips are
+upserted by trip_id, the rollups are rebuilt for the affected pickup days only, the upserted
+trips are re-indexed in the spatial indexes and their heatmap cell counts are updated (the
+replaced versions subtracted), so a new month of data does not need a full rebuild.
+New trips are appended to the columnar copy of trips (backend/database/columns.py); it is exported
+again only when an ingest replaced existing trips.
+The records excluded while cleaning a file are saved to backend/logs/rejected_<file name>.parquet.
+
+Usage:
+    python scripts/ingest.py                          # every new CSV in data/raw
+    python scripts/ingest.py data/raw/2016-07.csv     # specific files
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import data_cleaning
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from backend.database.columns import ColumnStore, append_columns, columns_dir, export_columns  # noqa: E402
+from backend.database.db import (SECONDS_PER_DAY, TRIP_COLUMNS, encode_trips, file_fingerprint,  # noqa: E402
+                                 insert_trips, record_ingested_file, refresh_rollups, refresh_spatial_index,
+                                 zone_ids)
+from backend.database.heatmap import add_heatmap_trips  # noqa: E402
+
+DB_PATH = BASE_DIR / 'backend' / 'database' / 'nyc_taxi.db'
+CHUNK_ROWS = 250000
+
+
+def ingested_fingerprints(conn):
+    """Manifest of already ingested files: file name -> fingerprint"""
+    try:
+        return dict(conn.execute("SELECT file_name, fingerprint FROM ingested_files"))
+    except sqlite3.OperationalError:
+        raise SystemExit("Database has no ingestion manifest. Rebuild it with: python backend/database/db.py")
+
+
+def ingest_file(conn, raw_path, fingerprint):
+    """Clean one raw file, upsert its trips and refresh the tables derived from them, all in a single transaction.
+
+    Returns the cleaning stats, the pickup days (epoch seconds of midnight) the file touched,
+    including the old days of trips that were replaced, and the number of trips replaced.
+    """
+    stats = data_cleaning.new_stats()
+    seen_rows = data_cleaning.RowHashSet()
+    zones = zone_ids(conn)
+    rejected = data_cleaning.RejectedRecordsWriter(data_cleaning.LOG_DIR / f'rejected_{Path(raw_path).stem}.parquet')
+
+    conn.execute("DROP TABLE IF EXISTS temp.staged_trips")
+    conn.execute("CREATE TEMP TABLE staged_trips AS SELECT * FROM main.trips WHERE 0")
+    with pd.read_csv(raw_path, dtype=data_cleaning.RAW_DTYPES, chunksize=CHUNK_ROWS) as reader:
+        for chunk in reader:
+            stats['loaded'] += len(chunk)
+            chunk = seen_rows.drop_duplicates(chunk, stats)
+            chunk = data_cleaning.clean_frame(chunk, stats)
+            insert_trips(conn, encode_trips(chunk, zones), table='temp.staged_trips')
+            rejected.write(stats)
+    rejected.close()
+
+    # Rows repeated within the file keep the last version, like the upsert itself
+    conn.execute("DELETE FROM staged_trips WHERE rowid NOT IN (SELECT MAX(rowid) FROM staged_trips GROUP BY trip_id)")
+
+    replaced = conn.execute("SELECT COUNT(*) FROM trips JOIN staged_trips USING (trip_id)").fetchone()[0]
+    affected_days = {day for day, in conn.execute(f"""
+        SELECT pickup_at - pickup_at % {SECONDS_PER_DAY} FROM staged_trips
+        UNION
+        SELECT trips.pickup_at - trips.pickup_at % {SECONDS_PER_DAY} FROM trips JOIN staged_trips USING (trip_id)
+        """)}
+
+    updates = ', '.join(f"{col} = excluded.{col}" for col in TRIP_COLUMNS[1:])
+    upserted_rowids = "SELECT trips.rowid FROM trips JOIN staged_trips USING (trip_id)"
+    with conn:
+        add_heatmap_trips(conn, upserted_rowids, sign=-1)
+        conn.execute(f"""
+            INSERT INTO trips ({', '.join(TRIP_COLUMNS)})
+            SELECT {', '.join(TRIP_COLUMNS)} FROM staged_trips WHERE true
+            ON CONFLICT (trip_id) DO UPDATE SET {updates}
+            """)
+        refresh_rollups(conn, affected_days)
+        refresh_spatial_index(conn, upserted_rowids)
+        add_heatmap_trips(conn, upserted_rowids)
+        record_ingested_file(conn, raw_path, stats['final'], fingerprint)
+    conn.execute("DROP TABLE temp.staged_trips")
+    return stats, affected_days, replaced
+
+
+def ingest(raw_paths, db_path=DB_PATH):
+    """Ingest every raw file not yet in the manifest (or changed since it was ingested)"""
+    if not Path(db_path).exists():
+        raise SystemExit("No Database found. Please run: python setup.py")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('PRAGMA journal_mode = WAL')
+    manifest = ingested_fingerprints(conn)
+
+    all_days, ingested, replaced = set(), False, 0
+    for raw_path in raw_paths:
+        fingerprint = file_fingerprint(raw_path)
+        if manifest.get(Path(raw_path).name) == fingerprint:
+            print(f"Skipping {raw_path} (already ingested)")
+            continue
+
+        started = time.perf_counter()
+        stats, affected_days, file_replaced = ingest_file(conn, raw_path, fingerprint)
+        all_days |= affected_days
+        replaced += file_replaced
+        ingested = True
+        print(f"Ingested {stats['final']:,} of {stats['loaded']:,} trips from {raw_path} "
+              f"({len(affected_days)} pickup days) in {time.perf_counter() - started:.2f}s")
+
+    if ingested or not columns_current(conn, columns_dir(db_path)):
+        update_columns(conn, columns_dir(db_path), replaced)
+    conn.close()
+    return all_days
+
+
+def columns_current(conn, directory):
+    """Whether the columnar copy exists and was exported from the database as it is now"""
+    try:
+        return ColumnStore(directory).matches(conn)
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+def update_columns(conn, directory, replaced):
+    """Append the new trips to the columnar copy, or export it again if trips were replaced"""
+    started = time.perf_counter()
+    rows = append_columns(conn, directory) if not replaced else None
+    if rows is not None:
+        print(f"Trip columns appended in {time.perf_counter() - started:.2f}s")
+        return
+    export_columns(conn, directory)
+    print(f"Trip columns exported in {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new raw trip files into the existing database")
+    parser.add_argument('raw_paths', nargs='*', type=Path, help="raw trip CSVs (default: every CSV in data/raw)")
+    parser.add_argument('--db', type=Path, default=DB_PATH, help="database to update")
+    args = parser.parse_args()
+
+    raw_paths = args.raw_paths or sorted(data_cleaning.DATA_DIR.glob('*.csv'))
+    data_cleaning.setup_logging()
+    ingest(raw_paths, args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Staged build of the cleaned data and the database, run by setup.py
+
+    download -> clean -> load -> index ---------> analyze
+                              -> rollups -------^ -> columns
+                              -> spatial_index -^
+                              -> heatmap -------^
+
+Every stage has a fingerprint: a SHA-256 over the contents of its input files, the source files of its
+code, its config (e.g. its part of schema.sql) and the fingerprints of the stages it runs after.
+data/pipeline_state.json records the fingerprint of each stage's last successful run, and a stage is
+skipped while its fingerprint is unchanged, its outputs exist and none of the stages before it ran again.
+A stage that reads a file written by the stage before it depends on that file's contents instead, so
+cleaning again with a cleaning-code edit that leaves clean_trips.csv unchanged does not reload it.
+Editing an index in schema.sql only rebuilds the indexes (and the statistics), and an unrelated edit
+runs nothing.
+
+Stages whose predecessors are done run concurrently on a thread pool, each on its own database
+connection. SQLite takes one writer at a time, so the stages that mostly write the database hold the
+'database' lock and run one after the other; the heatmap (which reads every trip and then writes a few
+thousand cells) and the column export (which only reads) overlap with them.
+
+File hashes are cached by size and modification time, so unchanged data files are not read again.
+
+Usage:
+    python scripts/pipeline.py                        # run the stages that are out of date
+    python scripts/pipeline.py --format parquet       # clean to Parquet, which loads faster
+    python scripts/pipeline.py --force heatmap        # rerun a stage (and the stages after it)
+    python scripts/pipeline.py --dry-run              # list the stages that would run
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
+from pathlib import Path
+
+import data_cleaning
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from backend.database import db  # noqa: E402
+from backend.database.columns import columns_dir, export_columns  # noqa: E402
+from backend.database.heatmap import refresh_heatmap  # noqa: E402
+
+DB_PATH = BASE_DIR / 'backend' / 'database' / 'nyc_taxi.db'
+SCHEMA_PATH = BASE_DIR / 'backend' / 'database' / 'schema.sql'
+STATE_PATH = BASE_DIR / 'data' / 'pipeline_state.json'
+
+
+def module_sources(path):
+    """Paths (relative to BASE_DIR) of a module's source file and of the project modules it imports, directly or not
+
+    Imports are read from the source, so the code of a stage always covers every project module it runs.
+    """
+    found, pending = [], [BASE_DIR / path]
+    while pending:
+        source = pending.pop()
+        if source in found:
+            continue
+        found.append(source)
+        for node in ast.walk(ast.parse(source.read_text(), filename=str(source))):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                # from package import module imports a module too
+                names = [node.module] + [f'{node.module}.{alias.name}' for alias in node.names]
+            else:
+                continue
+            # Project modules are imported from BASE_DIR, or from the script's own directory (scripts/)
+            for name in names:
+                relative = Path(*name.split('.'))
+                for root in (BASE_DIR, source.parent):
+                    for candidate in (root / relative.with_suffix('.py'), root / relative / '__init__.py'):
+                        if candidate.is_file():
+                            pending.append(candidate)
+    return sorted(str(source.relative_to(BASE_DIR)) for source in found)
+
+
+# Source files whose contents define each part of the build; the zones are read by cleaning and loading
+ZONES_DATA = ['backend/database/zones.geojson']
+CLEANING_CODE = module_sources('scripts/data_cleaning.py') + ZONES_DATA
+DATABASE_CODE = module_sources('backend/database/db.py') + ZONES_DATA
+HEATMAP_CODE = module_sources('backend/database/heatmap.py')
+COLUMNS_CODE = module_sources('backend/database/columns.py')
+
+
+class Stage:
+    """One build step: what it reads, which code and config define it, and what it produces"""
+
+    def __init__(self, name, run, after=(), inputs=(), code=(), config=None, outputs=(), lock=None):
+        self.name = name
+        self.run = run
+        self.after = list(after)
+        self.inputs = [Path(path) for path in inputs]
+        self.code = [BASE_DIR / path for path in code]
+        self.config = config
+        self.outputs = [Path(path) for path in outputs]
+        # Stages holding the same lock never run at the same time
+        self.lock = lock
+
+    def fingerprint(self, hashes, previous):
+        """Hash of everything the stage's result depends on; previous are the fingerprints of its predecessors"""
+        document = {'inputs': [hashes.get(path) for path in self.inputs],
+                    'code': [hashes.get(path) for path in self.code],
+                    'config': self.config,
+                    'after': previous}
+        return hashlib.sha256(json.dumps(document, sort_keys=True, default=str).encode()).hexdigest()
+
+    def outputs_exist(self):
+        return all(path.exists() for path in self.outputs)
+
+    def chained_to(self, previous):
+        """Whether the stage depends on a predecessor's run rather than on files it reads from it"""
+        return not set(previous.outputs) & set(self.inputs)
+
+
+class FileHashes:
+    """SHA-256 of files, cached in the pipeline state by path, size and modification time"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, path):
+        path = Path(path)
+        if not path.exists():
+            return None
+        stat = path.stat()
+        key = str(path.relative_to(BASE_DIR) if path.is_relative_to(BASE_DIR) else path)
+        cached = self.cache.get(key)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+        digest = db.file_fingerprint(path)
+        self.cache[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        return digest
+
+
+def load_state(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'stages': {}, 'files': {}}
+
+
+def save_state(state, state_path):
+    """Write the state atomically, so an interrupted run never leaves it half-written"""
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = state_path.with_suffix('.tmp')
+    with open(staging, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(staging, state_path)
+
+
+def run_stages(stages, state_path=STATE_PATH, workers=4, force=(), dry_run=False):
+    """Run the out-of-date stages, each as soon as the stages it runs after are done; returns the names run"""
+    state = load_state(state_path)
+    hashes = FileHashes(state['files'])
+    by_name = {stage.name: stage for stage in stages}
+    pending = dict(by_name)
+    fingerprints, ran, running, queued = {}, [], {}, []
+
+    def start_ready_stages(pool):
+        """Skip or queue every pending stage whose predecessors are done, then submit the queued stages whose
+        lock is free"""
+        progress = True
+        while progress:
+            progress = False
+            for name, stage in list(pending.items()):
+                if any(previous not in fingerprints for previous in stage.after):
+                    continue
+                del pending[name]
+                progress = True
+                chained = [previous for previous in stage.after if stage.chained_to(by_name[previous])]
+                fingerprint = stage.fingerprint(hashes, [fingerprints[previous] for previous in chained])
+                stale = (name in force or any(previous in ran for previous in chained)
+                         or state['stages'].get(name) != fingerprint or not stage.outputs_exist())
+                if not stale:
+                    print(f"[{name}] up to date")
+                    fingerprints[name] = fingerprint
+                elif dry_run:
+                    print(f"[{name}] would run")
+                    fingerprints[name] = fingerprint
+                    ran.append(name)
+                else:
+                    # This stage and the ones after it are out of date until they succeed, even if this run fails
+                    for stale_name in {name} | downstream(stages, name):
+                        state['stages'].pop(stale_name, None)
+                    save_state(state, state_path)
+                    queued.append((stage, fingerprint))
+
+        for stage, fingerprint in list(queued):
+            held = {running_stage.lock for running_stage, _ in running.values()}
+            if stage.lock is None or stage.lock not in held:
+                queued.remove((stage, fingerprint))
+                print(f"[{stage.name}] running")
+                running[pool.submit(timed, stage)] = (stage, fingerprint)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start_ready_stages(pool)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, fingerprint = running.pop(future)
+                name = stage.name
+                try:
+                    elapsed = future.result()
+                except Exception:
+                    # Let the stages already running finish, but start no more
+                    pending.clear()
+                    queued.clear()
+                    wait(running)
+                    raise
+                print(f"[{name}] done in {elapsed:.2f}s")
+                fingerprints[name] = fingerprint
+                ran.append(name)
+                state['stages'][name] = fingerprint
+                save_state(state, state_path)
+            start_ready_stages(pool)
+    return ran
+
+
+def downstream(stages, name):
+    """Names of the stages chained after the given one, directly or not (see Stage.chained_to)"""
+    by_name = {stage.name: stage for stage in stages}
+    later, found = {name}, True
+    while found:
+        found = False
+        for stage in stages:
+            if stage.name not in later and any(previous in later and stage.chained_to(by_name[previous])
+                                               for previous in stage.after):
+                later.add(stage.name)
+                found = True
+    return later - {name}
+
+
+def timed(stage):
+    started = time.perf_counter()
+    stage.run()
+    return time.perf_counter() - started
+
+
+def clean(output_path, workers):
+    """Clean the raw data in a separate process, as setup.py always has"""
+    command = [sys.executable, 'scripts/data_cleaning.py', '--output', str(output_path)]
+    if workers > 1:
+        command += ['--workers', str(workers)]
+    subprocess.run(command, cwd=BASE_DIR, check=True)
+
+
+def load(data_path, raw_paths):
+    """Create the database afresh and load the cleaned trips into it (without indexes)"""
+    for suffix in ['', '-wal', '-shm']:
+        Path(f'{DB_PATH}{suffix}').unlink(missing_ok=True)
+    shutil.rmtree(columns_dir(DB_PATH), ignore_errors=True)
+    table_sql, _ = db.read_schema(SCHEMA_PATH)
+    with closing(db.connect_for_build(DB_PATH, load=True)) as conn:
+        db.apply_schema(conn, table_sql)
+        rows = db.load_trips(conn, data_path)
+        db.record_raw_files(conn, raw_paths, rows)
+
+
+def build(description, step, *args):
+    """A database stage: run step on its own connection"""
+    def run():
+        with closing(db.connect_for_build(DB_PATH)) as conn:
+            rows = conn.execute("SELECT MAX(rowid) FROM trips").fetchone()[0] or 0
+            db.run_phase(conn, description, rows, step, *args)
+    return run
+
+
+def rebuild_indexes(conn, index_statements):
+    db.drop_indexes(conn)
+    db.build_indexes(conn, index_statements, conn.execute("SELECT MAX(rowid) FROM trips").fetchone()[0] or 0)
+
+
+def pipeline_stages(clean_format='csv', workers=1):
+    """The setup stages, cleaning to a CSV or Parquet file"""
+    clean_path = data_cleaning.PARQUET_OUTPUT_PATH if clean_format == 'parquet' else data_cleaning.OUTPUT_PATH
+    raw_paths = [data_cleaning.DATA_PATH]
+    table_sql, index_statements = db.read_schema(SCHEMA_PATH)
+    return [
+        Stage('download', lambda: data_cleaning.download_raw_data(data_cleaning.DATA_PATH),
+              config={'url': data_cleaning.DATA_URL}, outputs=raw_paths),
+        # The worker count is not part of the config: every cleaning mode writes the same output
+        Stage('clean', lambda: clean(clean_path, workers), after=['download'], inputs=raw_paths, code=CLEANING_CODE,
+              config={'output': clean_path.name},
+              outputs=[clean_path, data_cleaning.REJECTED_PATH, data_cleaning.REJECTION_SUMMARY_PATH]),
+        Stage('load', lambda: load(clean_path, raw_paths), after=['clean'], inputs=[clean_path],
+              code=DATABASE_CODE, config={'tables': table_sql}, outputs=[DB_PATH]),
+        Stage('index', build(f"{len(index_statements)} indexes built", rebuild_indexes, index_statements),
+              after=['load'], code=DATABASE_CODE, config={'indexes': index_statements}, outputs=[DB_PATH],
+              lock='database'),
+        Stage('rollups', build("Rollups built", db.refresh_rollups), after=['load'], code=DATABASE_CODE,
+              outputs=[DB_PATH], lock='database'),
+        Stage('spatial_index', build("Spatial indexes built", db.refresh_spatial_index), after=['load'],
+              code=DATABASE_CODE, outputs=[DB_PATH], lock='database'),
+        Stage('heatmap', build("Heatmap cells built", refresh_heatmap), after=['load'],
+              code=HEATMAP_CODE, outputs=[DB_PATH]),
+        Stage('analyze', build("Statistics analyzed", db.analyze),
+              after=['index', 'rollups', 'spatial_index', 'heatmap'], code=DATABASE_CODE, outputs=[DB_PATH],
+              lock='database'),
+        # The columns are matched to the database by a signature over the trips, rollups and ingested files
+        Stage('columns', build("Trip columns exported", export_columns, columns_dir(DB_PATH)),
+              after=['load', 'rollups'], code=COLUMNS_CODE,
+              outputs=[columns_dir(DB_PATH) / 'manifest.json']),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the cleaned data and the database, skipping up-to-date stages")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="cleaned trips file format")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="processes for the cleaning stage (0 = one per CPU core)")
+    parser.add_argument('--force', nargs='*', default=[], metavar='STAGE',
+                        help="rerun these stages even if they are up to date")
+    parser.add_argument('--dry-run', action='store_true', help="only list the stages that would run")
+    args = parser.parse_args()
+
+    stages = pipeline_stages(args.format, args.workers or os.cpu_count())
+    unknown = set(args.force) - {stage.name for stage in stages}
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    started = time.perf_counter()
+    ran = run_stages(stages, force=set(args.force), dry_run=args.dry_run)
+    if not args.dry_run:
+        print(f"\nPipeline finished in {time.perf_counter() - started:.2f}s "
+              f"({len(ran)} of {len(stages)} stages run)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,13 @@
 let allTrips = [];
 let trips = [];
+let stats = {}; // Aggregates over the whole database, from /api/stats
 const API_BASE = "/api"; // Flask backend URL
 
 async function loadData() {
     try {
-        const res = await fetch(`${API_BASE}/trips`);
-        const data = await res.json();
-
-        // Convert datetime strings to Date objects
-        allTrips = data.map(trip => ({
-            ...trip,
-            pickup_datetime: new Date(trip.pickup_datetime),
-            dropoff_datetime: new Date(trip.dropoff_datetime),
-            passenger_count: parseInt(trip.passenger_count),
-            trip_duration: parseInt(trip.trip_duration)
-
-        }));
-
+        await fetchTrips();
         trips = [...allTrips];
+        await loadStats();
 
         // Update visualizations and table
         updateStats();
@@ -38,6 +28,44 @@ async function loadData() {
     }
 }
 
+// Fetch a page of trips into allTrips, ordered by the server (sort: a /api/trips ?sort= value)
+async function fetchTrips(sort) {
+    const query = sort ? `?sort=${encodeURIComponent(sort)}` : '';
+    const res = await fetch(`${API_BASE}/trips${query}`);
+    const data = await res.json();
+
+    // Convert datetime strings to Date objects
+    allTrips = data.map(trip => ({
+        ...trip,
+        pickup_datetime: new Date(trip.pickup_datetime),
+        dropoff_datetime: new Date(trip.dropoff_datetime),
+        passenger_count: parseInt(trip.passenger_count),
+        trip_duration: parseInt(trip.trip_duration)
+
+    }));
+}
+
+
+// Query string for the filters the /api/stats endpoints support
+function statsParams() {
+    const params = new URLSearchParams();
+    const vendor = $('#filter-vendor').val();
+    const month = $('#filter-month').val();
+    const location = $('#filter-location').val();
+    if (vendor) params.set('vendor', vendor);
+    if (month) params.set('month', month);
+    if (location) params.set('zone', location);
+    return params.toString();
+}
+
+// Load the dashboard aggregates, computed server-side from the rollup tables
+async function loadStats() {
+    const query = statsParams();
+    const [summary, hourly, vendors, passengers] = await Promise.all(
+        ['summary', 'hourly', 'vendors', 'passengers'].map(name =>
+            fetch(`${API_BASE}/stats/${name}?${query}`).then(res => res.json())));
+    stats = { summary, hourly, vendors, passengers };
+}
 
 // Color palette
 const colors = ['#8884d8', '#82ca9d', '#ffc658', '#ff7c7c', '#8dd1e1'];
@@ -75,14 +103,12 @@ $(document).ready(function() {
 
 // Update statistics cards
 function updateStats() {
-    const totalTrips = trips.length;
-    const totalDuration = trips.reduce((sum, trip) => sum + trip.trip_duration, 0);
-    const totalPassengers = trips.reduce((sum, trip) => sum + trip.passenger_count, 0);
+    const summary = stats.summary;
     
-    $('#stat-total-trips').text(totalTrips);
-    $('#stat-avg-duration').text(Math.round(totalDuration / totalTrips) + 's');
-    $('#stat-avg-passengers').text(Math.round(totalPassengers / totalTrips));
-    $('#stat-routes').text(totalTrips);
+    $('#stat-total-trips').text(summary.total_trips.toLocaleString());
+    $('#stat-avg-duration').text(Math.round(summary.avg_duration_seconds || 0) + 's');
+    $('#stat-avg-passengers').text(Math.round(summary.avg_passengers || 0));
+    $('#stat-routes').text(summary.total_trips.toLocaleString());
 }
 
 // Create duration distribution chart
@@ -138,14 +164,9 @@ function createDurationChart() {
 
 // Create passenger count charts
 function createPassengerCharts() {
-    const passengerCounts = {};
-    trips.forEach(trip => {
-        passengerCounts[trip.passenger_count] = (passengerCounts[trip.passenger_count] || 0) + 1;
-    });
-    
-    const passengerData = Object.entries(passengerCounts).map(([count, trips]) => ({
-        passengers: `${count} passenger${count === '1' ? '' : 's'}`,
-        count: trips
+    const passengerData = stats.passengers.map(row => ({
+        passengers: `${row.passenger_count} passenger${row.passenger_count === 1 ? '' : 's'}`,
+        count: row.trips
     }));
     
     // Pie chart
@@ -213,15 +234,7 @@ function createPassengerCharts() {
 function createTimeChart() {
     const ctx = $('#chart-time')[0].getContext('2d');
     
-    const hourCounts = {};
-    trips.forEach(trip => {
-        const hour = trip.pickup_datetime.getHours();
-        hourCounts[hour] = (hourCounts[hour] || 0) + 1;
-    });
-    
-    const timeData = Object.entries(hourCounts)
-        .map(([hour, count]) => ({ hour: `${hour}:00`, trips: count }))
-        .sort((a, b) => parseInt(a.hour) - parseInt(b.hour));
+    const timeData = stats.hourly.map(row => ({ hour: `${row.hour}:00`, trips: row.trips }));
     
     if (charts.time) charts.time.destroy();
     
@@ -261,30 +274,32 @@ function createTimeChart() {
     });
 }
 
-// Create pickup location scatter chart
-function createMapChart() {
+// Create pickup density map from the heatmap cells of every trip, aggregated server-side
+async function createMapChart() {
     const ctx = $('#chart-map')[0].getContext('2d');
-    
-    const mapData = trips.map((trip, index) => ({
-        x: (trip.pickup_longitude + 74.02) * 1000,
-        y: (trip.pickup_latitude - 40.7) * 1000,
-        label: `Trip ${index + 1}`,
-        passengers: trip.passenger_count
-    }));
-    
+
+    const params = new URLSearchParams();
+    const vendor = $('#filter-vendor').val();
+    if (vendor) params.set('vendor', vendor);
+    const heatmap = await fetch(`${API_BASE}/heatmap?${params}`).then(res => res.json());
+
+    // Shade cells on a log scale, so quiet areas stay visible next to Midtown
+    const maxTrips = Math.max(1, ...heatmap.cells.map(cell => cell.trips));
+    const shade = trips => `rgba(136, 132, 216, ${(0.15 + 0.85 * Math.log1p(trips) / Math.log1p(maxTrips)).toFixed(3)})`;
+
     if (charts.map) charts.map.destroy();
-    
+
     charts.map = new Chart(ctx, {
         type: 'scatter',
         data: {
             datasets: [{
-                label: 'Pickup Locations',
-                data: mapData.map(d => ({ x: d.x, y: d.y })),
-                backgroundColor: mapData.map(d => colors[d.passengers % colors.length]),
-                borderColor: mapData.map(d => colors[d.passengers % colors.length]),
-                borderWidth: 1,
-                pointRadius: 8,
-                pointHoverRadius: 10
+                label: `Pickups per cell (grid level ${heatmap.level})`,
+                data: heatmap.cells.map(cell => ({ x: cell.lon, y: cell.lat })),
+                backgroundColor: heatmap.cells.map(cell => shade(cell.trips)),
+                borderWidth: 0,
+                pointStyle: 'rect',
+                pointRadius: 4,
+                pointHoverRadius: 6
             }]
         },
         options: {
@@ -295,15 +310,16 @@ function createMapChart() {
                 tooltip: {
                     callbacks: {
                         label: function(context) {
-                            const item = mapData[context.dataIndex];
-                            return [item.label, `Passengers: ${item.passengers}`];
+                            const cell = heatmap.cells[context.dataIndex];
+                            return [`${cell.lat.toFixed(4)}, ${cell.lon.toFixed(4)}`,
+                                    `Trips: ${cell.trips.toLocaleString()}`];
                         }
                     }
                 }
             },
             scales: {
-                x: { title: { display: true, text: 'Longitude (normalized)' } },
-                y: { title: { display: true, text: 'Latitude (normalized)' } }
+                x: { title: { display: true, text: 'Longitude' } },
+                y: { title: { display: true, text: 'Latitude' } }
             }
         }
     });
@@ -320,6 +336,8 @@ function populateTable() {
             <td>Vendor ${trip.vendor_id}</td>
             <td>${trip.pickup_datetime.toLocaleString()}</td>
             <td>${Math.round(trip.trip_duration / 60)} min</td>
+            <td>${trip.trip_distance_km.toFixed(2)} km</td>
+            <td>${trip.estimated_fare === null ? '-' : '$' + trip.estimated_fare.toFixed(2)}</td>
             <td>${trip.passenger_count}</td>
             <td>${trip.pickup_latitude.toFixed(4)}, ${trip.pickup_longitude.toFixed(4)}</td>
         `);
@@ -421,6 +439,7 @@ async function applyFilters() {
     });
 
     // Update UI
+    await loadStats();
     updateStats();
     populateTable();
     createDurationChart();
@@ -440,9 +459,17 @@ function updateCharts() {
     createMapChart();
 }
 
+// Table columns the server can order by (an index walk over all trips) -> /api/trips ?sort= value
+const SERVER_SORTS = {
+    pickup_datetime: 'pickup_time',
+    trip_duration: 'duration',
+    trip_distance_km: 'distance',
+    estimated_fare: 'fare'
+};
+
 // Setup table sorting
 function setupSorting() {
-    $('.sortable').on('click', function() {
+    $('.sortable').on('click', async function() {
         const field = $(this).data('sort');
         
         // Toggle sort direction
@@ -460,57 +487,27 @@ function setupSorting() {
         $(this).addClass(currentSort.direction);
         
         // Sort and update table
-        sortTrips();
-        populateTable();
+        await sortTrips();
+        await applyFilters();
     });
 }
 
-// Sort trips manually without using built-insort
-function sortTrips() {
+// Indexed columns are sorted by the server, which returns the first page of all trips in that order;
+// the other columns sort the trips already loaded
+async function sortTrips() {
     const field = currentSort.field;
     const direction = currentSort.direction;
 
-    trips = selectionSort(trips, field, direction);
-}
-
-// Selection sort algorithm implementation
-function selectionSort(trips_array, key, direction = 'asc') {
-    const trip_arr = [...trips_array];
-    const n = trip_arr.length;
-
-    for (let i = 0; i < n - 1; i++) {
-        let actualIndex = i;
-
-        for (let j = i + 1; j < n; j++) {
-            let valueA = trip_arr[j][key];
-            let valueB = trip_arr[actualIndex][key];
-
-            // Handle dates
-            if (valueA instanceof Date) valueA = valueA.getTime();
-            if (valueB instanceof Date) valueB = valueB.getTime();
-
-            // Handle strings
-            if (typeof valueA === 'string') valueA = valueA.toLowerCase();
-            if (typeof valueB === 'string') valueB = valueB.toLowerCase();
-
-            const condition = direction === 'asc'
-                ? valueA < valueB
-                : valueA > valueB;
-
-            if (condition) {
-                actualIndex = j;
-            }
-        }
-
-        // Swap elements
-        if (actualIndex !== i) {
-            const temp = trip_arr[i];
-            trip_arr[i] = trip_arr[actualIndex];
-            trip_arr[actualIndex] = temp;
-        }
+    if (SERVER_SORTS[field]) {
+        await fetchTrips((direction === 'desc' ? '-' : '') + SERVER_SORTS[field]);
+        return;
     }
-
-    return trip_arr;
+    const sign = direction === 'asc' ? 1 : -1;
+    allTrips.sort((a, b) => {
+        const valueA = typeof a[field] === 'string' ? a[field].toLowerCase() : a[field];
+        const valueB = typeof b[field] === 'string' ? b[field].toLowerCase() : b[field];
+        return valueA < valueB ? -sign : valueA > valueB ? sign : 0;
+    });
 }
 
 // Update trip count display
@@ -521,32 +518,22 @@ function updateTripCount() {
 
 // Insights and stories for our dashboard
 function updateInsights() {
-    if (!trips.length) {
+    if (!stats.summary.total_trips) {
         $('#insights-text').html("<p>No data available for the selected filters.</p>");
         $('#story-section').html("");
         return;
     }
 
-    const totalTrips = trips.length;
-    const totalDuration = trips.reduce((s, t) => s + t.trip_duration, 0);
-    const totalPassengers = trips.reduce((s, t) => s + t.passenger_count, 0);
-    const avgDuration = Math.round(totalDuration / totalTrips / 60);
-    const avgPassengers = (totalPassengers / totalTrips).toFixed(1);
+    const totalTrips = stats.summary.total_trips;
+    const avgDuration = Math.round(stats.summary.avg_duration_seconds / 60);
+    const avgPassengers = stats.summary.avg_passengers.toFixed(1);
 
     // Peak hour calculation
-    const hourCounts = {};
-    trips.forEach(t => {
-        const h = t.pickup_datetime.getHours();
-        hourCounts[h] = (hourCounts[h] || 0) + 1;
-    });
-    const [peakHour, peakTrips] = Object.entries(hourCounts).sort((a,b)=>b[1]-a[1])[0];
+    const peak = stats.hourly.reduce((best, row) => row.trips > best.trips ? row : best);
+    const [peakHour, peakTrips] = [peak.hour, peak.trips];
 
-    // Vendor with most trips
-    const vendorCounts = {};
-    trips.forEach(t => {
-        vendorCounts[t.vendor_id] = (vendorCounts[t.vendor_id] || 0) + 1;
-    });
-    const [topVendor, topVendorTrips] = Object.entries(vendorCounts).sort((a,b)=>b[1]-a[1])[0];
+    // Vendor with most trips (the endpoint orders vendors by trips)
+    const [topVendor, topVendorTrips] = [stats.vendors[0].vendor_id, stats.vendors[0].trips];
 
     // Location context
     const location = $('#filter-location').val();
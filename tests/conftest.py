@@ -0,0 +1,38 @@
+""" Shared fixtures: a small database built from synthetic trips by the real cleaning and load steps """
+
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+# The scripts import each other by module name, as when run from scripts/
+sys.path.insert(1, str(BASE_DIR / 'scripts'))
+
+from backend import app as app_module  # noqa: E402
+from backend.database.db import create_database  # noqa: E402
+from scripts import data_cleaning  # noqa: E402
+from scripts.generate_trips import write_trips  # noqa: E402
+
+SCHEMA_PATH = BASE_DIR / 'backend' / 'database' / 'schema.sql'
+TRIPS = 5000
+
+
+@pytest.fixture(scope='session')
+def trips_db(tmp_path_factory):
+    """ Path of a database of TRIPS synthetic trips, with its column export and ingestion manifest """
+    directory = tmp_path_factory.mktemp('database')
+    raw_path = directory / 'train.csv'
+    write_trips(raw_path, TRIPS)
+    data_cleaning.clean_batch(raw_path, directory / 'clean_trips.csv', rejected_path=directory / 'rejected.parquet')
+    db_path = directory / 'nyc_taxi.db'
+    create_database(db_path, directory / 'clean_trips.csv', SCHEMA_PATH, raw_paths=[raw_path])
+    return db_path
+
+
+@pytest.fixture
+def client(trips_db, monkeypatch):
+    """ Test client of the API, reading trips_db """
+    monkeypatch.setattr(app_module, 'DB_PATH', trips_db)
+    return app_module.app.test_client()
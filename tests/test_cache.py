@@ -0,0 +1,47 @@
+""" Result caching and conditional requests of the @cached views """
+
+import pytest
+
+from backend import app as app_module
+
+
+@pytest.fixture
+def stamp(monkeypatch):
+    """ Settable database stamp, in place of the database's file stats """
+    current = {'stamp': (('database', 1), None)}
+    monkeypatch.setattr(app_module, 'database_stamp', lambda: current['stamp'])
+    return current
+
+
+def test_repeated_request_is_a_hit(client, stamp):
+    assert client.get('/api/trips?limit=5').headers['X-Cache'] == 'MISS'
+    assert client.get('/api/trips?limit=5').headers['X-Cache'] == 'HIT'
+
+
+def test_database_change_misses(client, stamp):
+    client.get('/api/trips?limit=5')
+    stamp['stamp'] = (('database', 2), None)
+    assert client.get('/api/trips?limit=5').headers['X-Cache'] == 'MISS'
+
+
+def test_result_read_across_a_database_change_is_not_served(client, stamp, monkeypatch):
+    """ A request that started before the database changed must not fill the cache of the new generation """
+    get_connection = app_module.get_connection
+
+    def change_database_mid_request():
+        stamp['stamp'] = (('database', 2), None)
+        app_module.result_cache.set_generation(stamp['stamp'])  # as another request would
+        return get_connection()
+
+    client.get('/api/trips?limit=5')
+    monkeypatch.setattr(app_module, 'get_connection', change_database_mid_request)
+    client.get('/api/trips?limit=6')
+    monkeypatch.setattr(app_module, 'get_connection', get_connection)
+    assert client.get('/api/trips?limit=6').headers['X-Cache'] == 'MISS'
+
+
+def test_unchanged_data_is_not_modified(client, stamp):
+    etag = client.get('/api/trips?limit=5').headers['ETag']
+    assert client.get('/api/trips?limit=5', headers={'If-None-Match': etag}).status_code == 304
+    stamp['stamp'] = (('database', 2), None)
+    assert client.get('/api/trips?limit=5', headers={'If-None-Match': etag}).status_code == 200
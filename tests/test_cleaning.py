@@ -0,0 +1,63 @@
+""" The cleaning modes (whole file, streaming, parallel) and their writers """
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from scripts import data_cleaning
+from scripts.generate_trips import write_trips
+
+
+def test_csv_records_keep_line_breaks_inside_quotes(tmp_path):
+    flags = ['N', 'a\rb', 'c\x0bd', 'e\x0cf', 'g\x1ch', 'i\x85j', 'k l', 'm n', 'o\np', 'q"\n"r', 'Y']
+    df = pd.DataFrame({'id': [f'id{number}' for number in range(len(flags))], 'store_and_fwd_flag': flags})
+    payload = data_cleaning.CsvTripWriter.encode(df)
+    assert len(data_cleaning.CsvTripWriter.records(payload)) == len(df)
+
+    drop = np.arange(len(df)) % 3 == 1
+    writer = data_cleaning.CsvTripWriter(tmp_path / 'trips.csv')
+    writer.write_encoded(payload, drop=drop)
+    writer.close()
+    with open(tmp_path / 'trips.csv', newline='') as f:
+        written = f.read().split('\n', 1)[1]
+    assert written == data_cleaning.CsvTripWriter.encode(df[~drop])
+
+
+@pytest.fixture(scope='module')
+def raw_trips(tmp_path_factory):
+    """ A raw file with bad rows, and rows repeated within and across chunks and partitions """
+    path = tmp_path_factory.mktemp('raw') / 'train.csv'
+    write_trips(path, 3000, bad_share=0.05, duplicate_share=0.05)
+    return path
+
+
+def clean(mode, raw_path, directory, suffix):
+    """ Output bytes, excluded records and counts of one cleaning run """
+    directory.mkdir()
+    output_path, rejected_path = directory / f'clean_trips{suffix}', directory / 'rejected.parquet'
+    if mode == 'batch':
+        stats, summary = data_cleaning.clean_batch(raw_path, output_path, rejected_path)
+    elif mode == 'streaming':
+        stats, summary = data_cleaning.clean_streaming(raw_path, output_path, 700, rejected_path)
+    else:
+        stats, summary = data_cleaning.clean_parallel(raw_path, output_path, 3, rejected_path)
+    return {'output': output_path.read_bytes() if suffix == '.csv' else pq.read_table(output_path),
+            'rejected': pq.read_table(rejected_path),
+            'rejection_summary': data_cleaning.rejection_summary(stats, rejected_path),
+            'summary': summary}
+
+
+@pytest.mark.parametrize('suffix', ['.csv', '.parquet'])
+@pytest.mark.parametrize('mode', ['streaming', 'parallel'])
+def test_modes_match_batch(raw_trips, tmp_path, mode, suffix):
+    expected = clean('batch', raw_trips, tmp_path / 'batch', suffix)
+    result = clean(mode, raw_trips, tmp_path / mode, suffix)
+    assert expected['rejection_summary']['by_stage']['duplicates'] > 0
+    if suffix == '.csv':
+        assert result['output'] == expected['output']
+    else:
+        assert result['output'].equals(expected['output'])
+    assert result['rejected'].equals(expected['rejected'])
+    assert result['rejection_summary'] == expected['rejection_summary']
+    assert result['summary'] == pytest.approx(expected['summary'])
@@ -0,0 +1,74 @@
+""" The memory-mapped column engine answers the stats endpoints like the SQL path """
+
+import shutil
+import sqlite3
+
+import pytest
+
+from backend import app as app_module
+from backend.database.columns import ColumnStore, columns_dir, export_columns
+
+STATS_ENDPOINTS = ['summary', 'hourly', 'vendors', 'passengers']
+
+# Each includes a filter the rollups do not hold, so the column engine is used when enabled
+COLUMN_FILTERS = [
+    {'hour': '8'},
+    {'min_distance': '2', 'max_distance': '6'},
+    {'min_duration': '600', 'vendor': '2'},
+    {'max_fare': '25', 'month': '3'},
+    {'zone': 'midtown', 'hour': '18'},
+    {'start_date': '2016-03-01', 'end_date': '2016-03-31', 'min_fare': '10'},
+]
+
+
+def stats(client, endpoint, filters, column_engine, monkeypatch):
+    monkeypatch.setattr(app_module, 'COLUMN_ENGINE', column_engine)
+    monkeypatch.setattr(app_module, 'column_store', None)
+    app_module.result_cache.set_generation(None)
+    response = client.get(f'/api/stats/{endpoint}', query_string=filters)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+def test_manifest_is_populated(trips_db):
+    conn = sqlite3.connect(trips_db)
+    assert conn.execute("SELECT COUNT(*) FROM ingested_files").fetchone()[0] > 0
+    conn.close()
+
+
+@pytest.mark.parametrize('endpoint', STATS_ENDPOINTS)
+@pytest.mark.parametrize('filters', COLUMN_FILTERS, ids=lambda filters: '&'.join(f'{k}={v}' for k, v in filters.items()))
+def test_column_engine_matches_sql(client, monkeypatch, endpoint, filters):
+    from_sql = stats(client, endpoint, filters, False, monkeypatch)
+    from_columns = stats(client, endpoint, filters, True, monkeypatch)
+    assert app_module.column_store[1] is not None, "the column store was not used"
+    if isinstance(from_sql, dict):
+        assert from_columns == pytest.approx(from_sql)
+    else:
+        assert from_columns == [pytest.approx(row) for row in from_sql]
+
+
+def test_zones_past_int8(trips_db, tmp_path):
+    """ Zone numbers above 127 must not wrap around in the stored zone column """
+    db_path = tmp_path / 'zones.db'
+    shutil.copy(trips_db, db_path)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("""
+        INSERT INTO location_zones (zone_code, min_latitude, max_latitude, min_longitude, max_longitude)
+        VALUES (?, 0, 0, 0, 0)
+        """, [(f'extra_{number}',) for number in range(200)])
+    far_zone = conn.execute("SELECT zone_id FROM location_zones WHERE zone_code = 'extra_199'").fetchone()[0]
+    moved = conn.execute("UPDATE trips SET pickup_zone_id = ? WHERE rowid % 10 = 0", (far_zone,)).rowcount
+    conn.commit()
+    export_columns(conn, columns_dir(db_path))
+
+    store = ColumnStore(columns_dir(db_path))
+    assert len(store.zones) > 200
+    assert store.summary({'zone': 'extra_199'})['total_trips'] == moved
+    for zone, in conn.execute("SELECT zone_code FROM location_zones WHERE zone_code NOT LIKE 'extra_%'"):
+        expected = conn.execute("""
+            SELECT COUNT(*) FROM trips
+            WHERE pickup_zone_id = (SELECT zone_id FROM location_zones WHERE zone_code = ?)
+            """, (zone,)).fetchone()[0]
+        assert store.summary({'zone': zone})['total_trips'] == expected, zone
+    conn.close()
@@ -0,0 +1,20 @@
+""" /api/trips/export """
+
+
+def test_export_streams_matching_trips(client):
+    response = client.get('/api/trips/export?min=2&max=5')
+    assert response.status_code == 200
+    trips = [line for line in response.get_data(as_text=True).splitlines() if line]
+    assert trips
+
+
+def test_malformed_distance_is_rejected(client):
+    for query in ('min=abc', 'max=abc', 'min=1&max=x'):
+        response = client.get(f'/api/trips/export?{query}')
+        assert response.status_code == 400, query
+        assert 'Invalid value' in response.get_json()['error']
+
+
+def test_malformed_distance_range_is_rejected(client):
+    response = client.get('/api/trips/by_distance?min=abc')
+    assert response.status_code == 400
@@ -0,0 +1,45 @@
+""" Malformed and out-of-range query parameters are rejected with a 400 """
+
+import pytest
+
+from backend import app as app_module
+
+HUGE = str(2 ** 70)
+
+
+@pytest.mark.parametrize('url', [
+    f'/api/trips/search?hour={HUGE}',
+    f'/api/trips/search?min_duration=-{HUGE}',
+    f'/api/trips/search?vendor=1&month={HUGE}',
+    f'/api/stats/hourly?vendor={HUGE}',
+    f'/api/stats/summary?hour={HUGE}&min_fare=10',
+    f'/api/heatmap?vendor={HUGE}',
+    f'/api/heatmap?zoom={HUGE}',
+    '/api/trips/search?hour=eight',
+])
+@pytest.mark.parametrize('column_engine', [False, True])
+def test_out_of_range_integer(client, monkeypatch, url, column_engine):
+    monkeypatch.setattr(app_module, 'COLUMN_ENGINE', column_engine)
+    response = client.get(url)
+    assert response.status_code == 400, response.get_data(as_text=True)
+    assert 'Invalid value' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('url', ['/api/trips/search?hour=23', '/api/stats/hourly?vendor=2', '/api/heatmap?hour=0'])
+def test_in_range_integer(client, url):
+    assert client.get(url).status_code == 200
+
+
+@pytest.mark.parametrize('url', [
+    '/api/heatmap?min_lat=nan',
+    '/api/heatmap?max_lon=inf',
+    '/api/heatmap?min_lat=-Infinity',
+    '/api/trips/near?lat=40.75&lon=nan',
+    '/api/trips/within_bbox?min_lat=40.7&max_lat=inf&min_lon=-74&max_lon=-73.9',
+    '/api/trips/by_distance?max=inf',
+    '/api/trips/export?min=nan',
+])
+def test_non_finite_float(client, url):
+    response = client.get(url)
+    assert response.status_code == 400, response.get_data(as_text=True)
+    assert 'Invalid value' in response.get_json()['error']
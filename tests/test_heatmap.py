@@ -0,0 +1,23 @@
+""" Heatmap cell counts """
+
+import sqlite3
+
+from backend.database import heatmap
+
+
+def test_batches_merge_to_the_same_counts(trips_db, monkeypatch):
+    conn = sqlite3.connect(trips_db)
+    whole = heatmap.heatmap_rows(conn)
+    monkeypatch.setattr(heatmap, 'HEATMAP_BATCH_ROWS', 97)
+    assert heatmap.heatmap_rows(conn) == whole
+
+    trips = conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+    for table, rows in whole.items():
+        assert sum(row[-1] for row in rows if row[0] == heatmap.HEATMAP_LEVELS[0]) == trips, table
+    conn.close()
+
+
+def test_no_trips(trips_db):
+    conn = sqlite3.connect(trips_db)
+    assert heatmap.heatmap_rows(conn, "SELECT rowid FROM trips WHERE 0") == {table: [] for table in heatmap.HEATMAP_TABLES}
+    conn.close()
@@ -0,0 +1,90 @@
+""" Incremental ingestion leaves the database as a full rebuild of its derived tables would """
+
+import shutil
+import sqlite3
+
+import pytest
+
+import ingest
+from backend.database import db
+from backend.database.columns import ColumnStore, columns_dir, export_columns
+from backend.database.heatmap import HEATMAP_TABLES, refresh_heatmap
+from scripts import data_cleaning
+from scripts.generate_trips import write_trips
+
+# Tables derived from trips, and the columns ordering their rows
+DERIVED_TABLES = {'trip_rollups': '*', 'trip_passenger_rollups': '*',
+                  **{table: 'id' for table in db.SPATIAL_INDEXES},
+                  **{table: 'level, cell_x, cell_y, pickup_hour, vendor_id' for table in HEATMAP_TABLES}}
+
+
+def table_rows(conn):
+    return {table: conn.execute(f"SELECT * FROM {table} ORDER BY {order.replace('*', '1, 2, 3, 4, 5, 6')}").fetchall()
+            for table, order in DERIVED_TABLES.items()}
+
+
+def rebuilt_rows(db_path, directory):
+    """ Derived tables of a copy of the database, rebuilt from all of its trips """
+    copy_path = directory / 'rebuilt.db'
+    shutil.copy(db_path, copy_path)
+    conn = sqlite3.connect(copy_path)
+    with conn:
+        db.refresh_rollups(conn)
+        db.refresh_spatial_index(conn)
+        for table in HEATMAP_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        refresh_heatmap(conn)
+    rows = table_rows(conn)
+    conn.close()
+    return rows
+
+
+@pytest.fixture
+def db_path(trips_db, tmp_path, monkeypatch):
+    """ A copy of trips_db to ingest into; the excluded records are logged under tmp_path """
+    monkeypatch.setattr(ingest.data_cleaning, 'LOG_DIR', tmp_path)
+    path = tmp_path / 'nyc_taxi.db'
+    shutil.copy(trips_db, path)
+    shutil.copytree(columns_dir(trips_db), columns_dir(path))
+    return path
+
+
+@pytest.mark.parametrize('rows, id_prefix', [(6000, ''), (2000, ''), (2000, 'new')],
+                         ids=['overlapping-and-new', 'overlapping-only', 'new-only'])
+def test_ingest_matches_a_rebuild(db_path, tmp_path, capsys, rows, id_prefix):
+    # The same trip ids as the database's first trips, with other values, and (for 6000) new trips after them;
+    # prefixed ids are all new, so the column store is appended to rather than exported again
+    raw_path = tmp_path / 'update.csv'
+    write_trips(raw_path, rows, seed=1)
+    raw = data_cleaning.pd.read_csv(raw_path, dtype=str, keep_default_na=False)
+    raw['id'] = id_prefix + raw['id']
+    raw.to_csv(raw_path, index=False)
+    data_cleaning.clean_batch(raw_path, tmp_path / 'update_clean.csv', rejected_path=tmp_path / 'rejected.parquet')
+    conn = sqlite3.connect(db_path)
+    before = dict(conn.execute("SELECT trip_id, pickup_longitude FROM trips"))
+    conn.close()
+
+    ingest.ingest([raw_path], db_path)
+
+    conn = sqlite3.connect(db_path)
+    updated = {row[0]: float(row[1]) for row in data_cleaning.pd.read_csv(
+        tmp_path / 'update_clean.csv', usecols=['id', 'pickup_longitude']).itertuples(index=False)}
+    after = dict(conn.execute("SELECT trip_id, pickup_longitude FROM trips"))
+    assert bool(updated.keys() & before.keys()) == (not id_prefix)
+    assert after == {**before, **updated}
+    # Sums may differ in the last bits, having been added up in another order
+    rebuilt = rebuilt_rows(db_path, tmp_path)
+    for table, rows in table_rows(conn).items():
+        assert rows == [pytest.approx(row) for row in rebuilt[table]], table
+
+    # The column store was appended to, or exported again, to match the trips
+    assert ('Trip columns appended' in capsys.readouterr().out) == bool(id_prefix)
+    store = ColumnStore(columns_dir(db_path))
+    assert store.matches(conn)
+    export_columns(conn, tmp_path / 'exported')
+    assert store.summary({}) == ColumnStore(tmp_path / 'exported').summary({})
+
+    # Ingesting the same file again changes nothing
+    ingest.ingest([raw_path], db_path)
+    assert dict(conn.execute("SELECT trip_id, pickup_longitude FROM trips")) == after
+    conn.close()
@@ -0,0 +1,43 @@
+""" Keyset pagination cursors """
+
+import base64
+import json
+
+import pytest
+
+PAGED_URLS = [
+    '/api/trips?limit=5',
+    '/api/trips?limit=5&sort=-fare',
+    '/api/trips/by_date?date=2016-03-14&limit=5',
+    '/api/trips/by_distance?min=1&max=5&limit=5',
+    '/api/trips/by_location?location=midtown&limit=5',
+    '/api/trips/search?start_date=2016-03-01&end_date=2016-03-31&limit=5',
+    '/api/trips/within_bbox?min_lat=40.7&max_lat=40.8&min_lon=-74.0&max_lon=-73.9&limit=5',
+]
+
+
+def encode(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(sort_key).encode()).decode()
+
+
+@pytest.mark.parametrize('url', PAGED_URLS)
+def test_next_page_follows_the_cursor(client, url):
+    first = client.get(url)
+    assert first.status_code == 200
+    cursor = first.headers['X-Next-Cursor']
+    second = client.get(f'{url}&cursor={cursor}')
+    assert second.status_code == 200
+    # Summaries name the trip id `id`, the detailed rows `trip_id`
+    ids = [{trip.get('id', trip.get('trip_id')) for trip in page.get_json()} for page in (first, second)]
+    assert len(ids[0]) == 5 and ids[1] and not ids[0] & ids[1]
+
+
+@pytest.mark.parametrize('url', PAGED_URLS)
+@pytest.mark.parametrize('cursor', ['not base64!', encode({}), encode([{}, 1]), encode([[1], 2]), encode(['a', 1]),
+                                    encode([1, 1.5]), encode([1, True]), encode([1, 2 ** 70]), encode([1, 2, 3])],
+                         ids=['garbage', 'object', 'object-key', 'list-key', 'string-key', 'float-rowid',
+                              'bool-rowid', 'huge-rowid', 'too-long'])
+def test_malformed_cursor_is_rejected(client, url, cursor):
+    response = client.get(f'{url}&cursor={cursor}')
+    assert response.status_code == 400, response.get_data(as_text=True)
+    assert response.get_json() == {'error': 'Invalid cursor'}
@@ -0,0 +1,31 @@
+""" Fingerprints of the setup pipeline's stages """
+
+import pipeline
+
+
+def test_stage_code_covers_imported_modules():
+    assert 'backend/common.py' in pipeline.CLEANING_CODE
+    assert 'backend/database/zones.py' in pipeline.CLEANING_CODE
+    assert 'backend/database/zones.py' in pipeline.DATABASE_CODE
+
+
+def test_changed_imported_module_reruns_the_stage(tmp_path, monkeypatch):
+    (tmp_path / 'scripts').mkdir()
+    (tmp_path / 'shared').mkdir()
+    (tmp_path / 'scripts' / 'stage.py').write_text("import helper\nfrom shared import constants\n")
+    (tmp_path / 'scripts' / 'helper.py').write_text("import os\n")
+    (tmp_path / 'shared' / '__init__.py').write_text("")
+    (tmp_path / 'shared' / 'constants.py').write_text("RADIUS = 1\n")
+    monkeypatch.setattr(pipeline, 'BASE_DIR', tmp_path)
+    code = pipeline.module_sources('scripts/stage.py')
+    assert code == ['scripts/helper.py', 'scripts/stage.py', 'shared/__init__.py', 'shared/constants.py']
+
+    runs = []
+    stages = [pipeline.Stage('stage', lambda: runs.append(1), code=code)]
+    state_path = tmp_path / 'state.json'
+    pipeline.run_stages(stages, state_path=state_path)
+    pipeline.run_stages(stages, state_path=state_path)
+    assert len(runs) == 1
+    (tmp_path / 'shared' / 'constants.py').write_text("RADIUS = 20\n")
+    pipeline.run_stages(stages, state_path=state_path)
+    assert len(runs) == 2
@@ -0,0 +1,73 @@
+""" Common /api/trips/search filter combinations are answered by index seeks
+
+Runs EXPLAIN QUERY PLAN for each combination (first page and a later page) and fails if SQLite
+would scan the trips table, or sort the matching rows, instead of seeking an index.
+"""
+
+import sqlite3
+
+import pytest
+
+from backend.app import compile_trip_search, search_page_query
+
+COMMON_SEARCHES = [
+    {'start_date': '2016-03-14', 'end_date': '2016-03-14'},
+    {'start_date': '2016-03-14', 'end_date': '2016-03-14', 'hour': '8'},
+    {'start_date': '2016-03-01', 'end_date': '2016-03-31'},
+    {'start_date': '2016-06-01'},
+    {'start_date': '2016-03-01', 'end_date': '2016-03-31', 'hour': '17'},
+    {'hour': '8'},
+    {'month': '3'},
+    {'zone': 'midtown'},
+    {'zone': 'bronx', 'month': '3'},
+    {'zone': 'midtown', 'hour': '8'},
+    {'zone': 'midtown', 'start_date': '2016-03-14', 'end_date': '2016-03-14'},
+    {'zone': 'midtown', 'start_date': '2016-03-01', 'end_date': '2016-03-31'},
+    {'zone': 'queens', 'min_fare': '30'},
+    {'vendor': '2'},
+    {'vendor': '1', 'start_date': '2016-03-14', 'end_date': '2016-03-14'},
+    {'vendor': '2', 'start_date': '2016-03-01', 'end_date': '2016-03-07'},
+    {'vendor': '2', 'zone': 'midtown', 'hour': '8'},
+    {'vendor': '2', 'zone': 'midtown', 'start_date': '2016-03-14', 'end_date': '2016-03-14'},
+    {'vendor': '1', 'min_distance': '5'},
+    {'min_distance': '1'},
+    {'min_distance': '5', 'max_distance': '10'},
+    {'min_duration': '600', 'max_duration': '900'},
+    {'min_fare': '20', 'max_fare': '30'},
+    {'start_date': '2016-03-01', 'end_date': '2016-03-31', 'min_distance': '5', 'max_fare': '40'},
+]
+
+
+def full_scan(detail):
+    """ Whether an EXPLAIN QUERY PLAN step reads (nearly) every trip or sorts the matches """
+    return (detail.startswith('SCAN trips')
+            or detail.startswith('SEARCH trips USING INTEGER PRIMARY KEY')
+            or detail.startswith('USE TEMP B-TREE'))
+
+
+@pytest.fixture(scope='module')
+def conn(trips_db):
+    conn = sqlite3.connect(f"{trips_db.resolve().as_uri()}?mode=ro", uri=True)
+    yield conn
+    conn.close()
+
+
+def plan(conn, query, params):
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", (*params, 101))]
+
+
+@pytest.mark.parametrize('filters', COMMON_SEARCHES, ids=lambda filters: '&'.join(f'{k}={v}' for k, v in filters.items()))
+def test_search_seeks_an_index(conn, filters):
+    clauses, params, sort_columns = compile_trip_search(filters)
+    query, query_params = search_page_query(clauses, params, sort_columns)
+    first_page = plan(conn, query, query_params)
+    assert not any(full_scan(detail) for detail in first_page), first_page
+
+    # Seek past a matching row, as the next page of the search would
+    first = conn.execute(query.replace('SELECT rowid,', f"SELECT {', '.join(sort_columns + ['rowid'])},", 1),
+                         (*query_params, 1)).fetchone()
+    if first is None:
+        pytest.skip('no matching trip to page past')
+    query, query_params = search_page_query(clauses, params, sort_columns, list(first[:len(sort_columns) + 1]))
+    next_page = plan(conn, query, query_params)
+    assert not any(full_scan(detail) for detail in next_page), next_page
@@ -0,0 +1,48 @@
+""" Nearest-trip search against a brute-force haversine over every trip """
+
+import math
+import sqlite3
+
+import numpy as np
+import pytest
+
+from backend.common import EARTH_RADIUS_KM, haversine_vectorized
+
+RADIUS_KM = 0.05
+
+
+def destination(lat, lon, bearing, km):
+    """ The point km away from (lat, lon) along a bearing (degrees clockwise from north) """
+    angle, bearing = km / EARTH_RADIUS_KM, math.radians(bearing)
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2 = math.asin(math.sin(lat1) * math.cos(angle) + math.cos(lat1) * math.sin(angle) * math.cos(bearing))
+    lon2 = lon1 + math.atan2(math.sin(bearing) * math.sin(angle) * math.cos(lat1),
+                             math.cos(angle) - math.sin(lat1) * math.sin(lat2))
+    return math.degrees(lat2), math.degrees(lon2)
+
+
+@pytest.fixture(scope='module')
+def pickups(trips_db):
+    conn = sqlite3.connect(trips_db)
+    rows = conn.execute("SELECT trip_id, pickup_latitude, pickup_longitude FROM trips").fetchall()
+    conn.close()
+    return rows
+
+
+@pytest.mark.parametrize('bearing', [0, 45, 90, 135, 180, 270])
+def test_trips_on_the_radius_are_found(client, pickups, bearing):
+    """ Search from points that put a trip just inside the radius, in each direction """
+    ids = np.array([row[0] for row in pickups])
+    latitudes = np.array([row[1] for row in pickups])
+    longitudes = np.array([row[2] for row in pickups])
+    for trip_id, lat, lon in pickups[::500]:
+        # The trip lies RADIUS_KM * 0.999 from the point, along the given bearing
+        point_lat, point_lon = destination(lat, lon, bearing + 180, RADIUS_KM * 0.999)
+        distances = haversine_vectorized(point_lon, point_lat, longitudes, latitudes)
+        expected = set(ids[distances <= RADIUS_KM].tolist())
+        assert trip_id in expected
+
+        response = client.get('/api/trips/near', query_string={'lat': point_lat, 'lon': point_lon,
+                                                               'radius_km': RADIUS_KM, 'limit': 1000})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        assert {trip['id'] for trip in response.get_json()} == expected